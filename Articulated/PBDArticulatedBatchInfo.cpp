@@ -0,0 +1,212 @@
+#include "PBDArticulatedBatchInfo.h"
+#include "PBDArticulatedGradientInfo.h"
+#include "JointFunc.h"
+#include <Utils/RotationUtil.h>
+#include <Utils/DebugGradient.h>
+#include <CommonFile/Timing.h>
+#include <Utils/Scalar.h>
+
+USE_PRJ_NAMESPACE
+
+//entry (R,C) of the 3x4 transformation J, entry R of the 3-vector D, for all configurations
+#define SOA(M,J,R,C) (M).col((J)*12+(R)+(C)*3)
+#define SOAV(M,D,R) (M).col((D)*3+(R))
+
+template <typename T>
+PBDArticulatedBatchInfo<T>::PBDArticulatedBatchInfo():_grad(false) {}
+template <typename T>
+PBDArticulatedBatchInfo<T>::PBDArticulatedBatchInfo(const ArticulatedBody& body,const MatT& xs,bool grad)
+{
+  reset(body,xs,grad);
+}
+template <typename T>
+void PBDArticulatedBatchInfo<T>::reset(const ArticulatedBody& body,const MatT& xs,bool grad)
+{
+  sizeType nrJ=body.nrJ();
+  sizeType nrDOF=body.nrDOF();
+  sizeType nrDDT=body.nrDDT();
+  sizeType K=xs.cols();
+  ASSERT_MSGV(xs.rows()==nrDOF,"Batch configurations have %d rows, expected %d!",xs.rows(),nrDOF)
+  _grad=grad;
+  _x=xs.transpose();
+  _T.resize(K,nrJ*12);
+  _TK_1K.resize(K,nrJ*12);
+  _DT.setZero(K,grad?nrDOF*3:0);
+  _RDT.setZero(K,grad?nrDOF*3:0);
+  _DDT.setZero(K,grad?nrDDT*3:0);
+  //the same re-orthogonalized joint transformations as PBDArticulatedGradientInfo
+  PBDArticulatedGradientInfo<T> info(body,Vec::Zero(nrDOF));
+  MatT L(K,12),D(K,3);
+  Vec s(K),c(K),xk;
+  Mat3XT DT,DDT;
+  for(sizeType j=0; j<nrJ; j++) {
+    const Joint& J=body.joint(j);
+    Mat3X4T JTrans=TRANSI(info._JTransM,j);
+    //local transformation in L, local derivatives in _DT,_DDT
+    L.setZero();
+    SOA(L,0,0,0).setOnes();
+    SOA(L,0,1,1).setOnes();
+    SOA(L,0,2,2).setOnes();
+    if(J._typeJoint==Joint::TRANS_3D || J._typeJoint==Joint::TRANS_2D || J._typeJoint==Joint::TRANS_1D) {
+      for(sizeType d=0; d<J.nrDOF(); d++) {
+        SOA(L,0,d,3)=_x.col(J._offDOF+d);
+        if(grad)
+          SOAV(_DT,J._offDOF+d,d).setOnes();
+      }
+    } else if(J._typeJoint==Joint::HINGE_JOINT) {
+      for(sizeType k=0; k<K; k++)
+        SinCosTraits<T>::sincos(_x(k,J._offDOF),&s[k],&c[k]);
+      SOA(L,0,0,0)=c;
+      SOA(L,0,1,0)=s;
+      SOA(L,0,0,1)=-s;
+      SOA(L,0,1,1)=c;
+      if(grad)
+        SOAV(_DT,J._offDOF,2).setOnes();
+    } else if(J._typeJoint!=Joint::FIX_JOINT) {
+      //the 3D rotations and ball joints (usually only the base) use JointFunc per configuration
+      DT.setZero(3,nrDOF);
+      DDT.setZero(3,nrDDT);
+      for(sizeType k=0; k<K; k++) {
+        xk=_x.row(k).transpose();
+        Mat3X4T JLT=JointFunc<T>::TDTDDT(J,VecCM(xk.data(),xk.size()),Mat3XTM(DT.data(),3,nrDOF,Eigen::OuterStride<>(3)),Mat3XTM(DDT.data(),3,nrDDT,Eigen::OuterStride<>(3)));
+        for(sizeType e=0; e<12; e++)
+          L(k,e)=JLT(e%3,e/3);
+        if(grad) {
+          for(sizeType d=J._offDOF; d<J._offDOF+J.nrDOF(); d++)
+            for(sizeType r=0; r<3; r++)
+              _DT(k,d*3+r)=DT(r,d);
+          for(sizeType d=J._offDDT; d<J._offDDT+J.nrDDT(); d++)
+            for(sizeType r=0; r<3; r++)
+              _DDT(k,d*3+r)=DDT(r,d);
+        }
+      }
+    }
+    //local transformation JTrans*L, derivatives rotated by JTrans
+    for(sizeType cc=0; cc<4; cc++)
+      for(sizeType r=0; r<3; r++) {
+        SOA(_TK_1K,j,r,cc)=SOA(L,0,0,cc)*JTrans(r,0)+SOA(L,0,1,cc)*JTrans(r,1)+SOA(L,0,2,cc)*JTrans(r,2);
+        if(cc==3)
+          SOA(_TK_1K,j,r,cc).array()+=JTrans(r,3);
+      }
+    if(grad) {
+      for(sizeType d=J._offDOF; d<J._offDOF+J.nrDOF(); d++) {
+        for(sizeType r=0; r<3; r++)
+          D.col(r)=SOAV(_DT,d,0)*JTrans(r,0)+SOAV(_DT,d,1)*JTrans(r,1)+SOAV(_DT,d,2)*JTrans(r,2);
+        _DT.middleCols(d*3,3)=D;
+      }
+      for(sizeType d=J._offDDT; d<J._offDDT+J.nrDDT(); d++) {
+        for(sizeType r=0; r<3; r++)
+          D.col(r)=SOAV(_DDT,d,0)*JTrans(r,0)+SOAV(_DDT,d,1)*JTrans(r,1)+SOAV(_DDT,d,2)*JTrans(r,2);
+        _DDT.middleCols(d*3,3)=D;
+      }
+    }
+    //parent transformation, RDT
+    if(J._parent>=0) {
+      for(sizeType cc=0; cc<4; cc++)
+        for(sizeType r=0; r<3; r++) {
+          SOA(_T,j,r,cc)=SOA(_T,J._parent,r,0).cwiseProduct(SOA(_TK_1K,j,0,cc))+
+                         SOA(_T,J._parent,r,1).cwiseProduct(SOA(_TK_1K,j,1,cc))+
+                         SOA(_T,J._parent,r,2).cwiseProduct(SOA(_TK_1K,j,2,cc));
+          if(cc==3)
+            SOA(_T,j,r,cc)+=SOA(_T,J._parent,r,3);
+        }
+      if(grad)
+        for(sizeType d=J._offDOF; d<J._offDOF+J.nrDOF(); d++)
+          for(sizeType r=0; r<3; r++)
+            SOAV(_RDT,d,r)=SOA(_T,J._parent,r,0).cwiseProduct(SOAV(_DT,d,0))+
+                           SOA(_T,J._parent,r,1).cwiseProduct(SOAV(_DT,d,1))+
+                           SOA(_T,J._parent,r,2).cwiseProduct(SOAV(_DT,d,2));
+    } else {
+      _T.middleCols(j*12,12)=_TK_1K.middleCols(j*12,12);
+      if(grad)
+        _RDT.middleCols(J._offDOF*3,J.nrDOF()*3)=_DT.middleCols(J._offDOF*3,J.nrDOF()*3);
+    }
+  }
+}
+template <typename T>
+sizeType PBDArticulatedBatchInfo<T>::size() const
+{
+  return _x.rows();
+}
+template <typename T>
+bool PBDArticulatedBatchInfo<T>::hasGrad() const
+{
+  return _grad;
+}
+template <typename T>
+typename PBDArticulatedBatchInfo<T>::Vec PBDArticulatedBatchInfo<T>::x(sizeType k) const
+{
+  return _x.row(k).transpose();
+}
+template <typename T>
+typename PBDArticulatedBatchInfo<T>::Mat3XTSCM PBDArticulatedBatchInfo<T>::TM(sizeType k) const
+{
+  return map(_T,k);
+}
+template <typename T>
+typename PBDArticulatedBatchInfo<T>::Mat3XTSCM PBDArticulatedBatchInfo<T>::TK_1KM(sizeType k) const
+{
+  return map(_TK_1K,k);
+}
+template <typename T>
+typename PBDArticulatedBatchInfo<T>::Mat3XTSCM PBDArticulatedBatchInfo<T>::DTM(sizeType k) const
+{
+  return map(_DT,k);
+}
+template <typename T>
+typename PBDArticulatedBatchInfo<T>::Mat3XTSCM PBDArticulatedBatchInfo<T>::RDTM(sizeType k) const
+{
+  return map(_RDT,k);
+}
+template <typename T>
+typename PBDArticulatedBatchInfo<T>::Mat3XTSCM PBDArticulatedBatchInfo<T>::DDTM(sizeType k) const
+{
+  return map(_DDT,k);
+}
+template <typename T>
+typename PBDArticulatedBatchInfo<T>::Mat3XTSCM PBDArticulatedBatchInfo<T>::map(const MatT& M,sizeType k) const
+{
+  //configuration k is row k, consecutive entries are M.rows() apart
+  return Mat3XTSCM(M.data()+k,3,M.cols()/3,Eigen::Stride<-1,-1>(M.rows()*3,M.rows()));
+}
+//debug
+template <typename T>
+void PBDArticulatedBatchInfo<T>::debug(const ArticulatedBody& body,sizeType K)
+{
+  DEFINE_NUMERIC_DELTA_T(T)
+  INFO("-------------------------------------------------------------DebugPBDArticulatedBatchInfo")
+  MatT xs=MatT::Random(body.nrDOF(),K);
+  std::vector<PBDArticulatedGradientInfo<T>> infos(K);
+  TBEG("PBDArticulatedGradientInfo");
+  for(sizeType k=0; k<K; k++)
+    infos[k].reset(body,xs.col(k));
+  TEND();
+  PBDArticulatedBatchInfo<T> batch;
+  TBEG("PBDArticulatedBatchInfo");
+  batch.reset(body,xs);
+  TEND();
+  T errT=0,errTK_1K=0,errDT=0,errRDT=0,errDDT=0;
+  for(sizeType k=0; k<K; k++) {
+    PBDArticulatedGradientInfo<T> info;
+    info.reset(body,batch,k);
+    errT=std::max<T>(errT,(infos[k]._TM-batch.TM(k)).cwiseAbs().maxCoeff());
+    errTK_1K=std::max<T>(errTK_1K,(infos[k]._TK_1KM-info._TK_1KM).cwiseAbs().maxCoeff());
+    errDT=std::max<T>(errDT,(infos[k]._DTM-info._DTM).cwiseAbs().maxCoeff());
+    errRDT=std::max<T>(errRDT,(infos[k]._RDTM-info._RDTM).cwiseAbs().maxCoeff());
+    if(body.nrDDT()>0)
+      errDDT=std::max<T>(errDDT,(infos[k]._DDTM-info._DDTM).cwiseAbs().maxCoeff());
+  }
+  DEBUG_GRADIENT("T",std::sqrt(batch._T.squaredNorm()),errT)
+  DEBUG_GRADIENT("TK_1K",std::sqrt(batch._TK_1K.squaredNorm()),errTK_1K)
+  DEBUG_GRADIENT("DT",std::sqrt(batch._DT.squaredNorm()),errDT)
+  DEBUG_GRADIENT("RDT",std::sqrt(batch._RDT.squaredNorm()),errRDT)
+  DEBUG_GRADIENT("DDT",std::sqrt(batch._DDT.squaredNorm()),errDDT)
+}
+//instance
+PRJ_BEGIN
+template struct PBDArticulatedBatchInfo<double>;
+#ifdef ALL_TYPES
+template struct PBDArticulatedBatchInfo<__float128>;
+template struct PBDArticulatedBatchInfo<mpfr::mpreal>;
+#endif
+PRJ_END
@@ -0,0 +1,43 @@
+#ifndef PBD_ARTICULATED_BATCH_INFO_H
+#define PBD_ARTICULATED_BATCH_INFO_H
+
+#include "ArticulatedBody.h"
+#include <Utils/SparseUtils.h>
+
+PRJ_BEGIN
+
+#include <Utils/MapTypePragma.h>
+//forward kinematics of K configurations at once in structure-of-arrays layout: entry e of a per-configuration quantity
+//(its column-major index in _TM,_TK_1KM,_DTM,_RDTM,_DDTM of PBDArticulatedGradientInfo) is column e of a K-row matrix,
+//so every step of the recursion runs over K contiguous values of all configurations
+template <typename T>
+struct PBDArticulatedBatchInfo
+{
+public:
+  DECL_MAP_TYPES_T
+  typedef Eigen::Map<const Mat3XT,0,Eigen::Stride<-1,-1> > Mat3XTSCM;
+  PBDArticulatedBatchInfo();
+  PBDArticulatedBatchInfo(const ArticulatedBody& body,const MatT& xs,bool grad=true);
+  //every column of xs is a configuration, grad also computes the DOF derivatives (_DTM,_RDTM,_DDTM)
+  void reset(const ArticulatedBody& body,const MatT& xs,bool grad=true);
+  sizeType size() const;
+  bool hasGrad() const;
+  Vec x(sizeType k) const;
+  //the quantities of configuration k, laid out as in PBDArticulatedGradientInfo
+  Mat3XTSCM TM(sizeType k) const;
+  Mat3XTSCM TK_1KM(sizeType k) const;
+  Mat3XTSCM DTM(sizeType k) const;
+  Mat3XTSCM RDTM(sizeType k) const;
+  Mat3XTSCM DDTM(sizeType k) const;
+  //debug
+  static void debug(const ArticulatedBody& body,sizeType K);
+private:
+  Mat3XTSCM map(const MatT& M,sizeType k) const;
+  //data
+  MatT _x,_T,_TK_1K,_DT,_RDT,_DDT;
+  bool _grad;
+};
+
+PRJ_END
+
+#endif
@@ -1,9 +1,10 @@
+#include <Utils/Scalar.h>
 #include "PBDArticulatedGradientInfo.h"
+#include "PBDArticulatedBatchInfo.h"
 #include "TensorContractPragma.h"
 #include "JointFunc.h"
 #include <Utils/CrossSpatialUtil.h>
 #include <Utils/DebugGradient.h>
-#include <Utils/Scalar.h>
 
 USE_PRJ_NAMESPACE
 
@@ -1495,6 +1496,65 @@ void PBDArticulatedGradientInfo<T>::reset(const ArticulatedBody& body,const Vec&
   PBDArticulatedGradientInfoMap<T>::reset(body,mapV(x));
 }
 template <typename T>
+void PBDArticulatedGradientInfo<T>::reset(const ArticulatedBody& body,const PBDArticulatedBatchInfo<T>& batch,sizeType k)
+{
+  ASSERT_MSG(batch.hasGrad(),"The batch has no DOF derivatives!")
+  sizeType nrJ=body.nrJ();
+  sizeType nrDOF=body.nrDOF();
+  sizeType nrDDT=body.nrDDT();
+  _x=batch.x(k);
+  _T=batch.TM(k);
+  _TK_1K=batch.TK_1KM(k);
+  _DT=batch.DTM(k);
+  _RDT=batch.RDTM(k);
+  _DDT=batch.DDTM(k);
+  reorthogonalize(body);
+  _DTLambda.resize(3,nrJ*2);
+  _DTK_1KLambda.resize(3,nrJ*2);
+  _DTILambda.resize(3,nrDOF);
+  _RDTILambda.resize(3,nrDOF);
+  _DTIILambda.resize(3,nrDDT);
+  _RDTIILambda.resize(3,nrDDT);
+  resetPtr();
+}
+template <typename T>
+bool PBDArticulatedGradientInfo<T>::read(std::istream& is)
+{
+  readBinaryData(_x,is);
+  readBinaryData(_T,is);
+  readBinaryData(_TK_1K,is);
+  readBinaryData(_DT,is);
+  readBinaryData(_RDT,is);
+  readBinaryData(_DDT,is);
+  readBinaryData(_JTrans,is);
+  readBinaryData(_DTLambda,is);
+  readBinaryData(_DTK_1KLambda,is);
+  readBinaryData(_DTILambda,is);
+  readBinaryData(_RDTILambda,is);
+  readBinaryData(_DTIILambda,is);
+  readBinaryData(_RDTIILambda,is);
+  resetPtr();
+  return is.good();
+}
+template <typename T>
+bool PBDArticulatedGradientInfo<T>::write(std::ostream& os) const
+{
+  writeBinaryData(_x,os);
+  writeBinaryData(_T,os);
+  writeBinaryData(_TK_1K,os);
+  writeBinaryData(_DT,os);
+  writeBinaryData(_RDT,os);
+  writeBinaryData(_DDT,os);
+  writeBinaryData(_JTrans,os);
+  writeBinaryData(_DTLambda,os);
+  writeBinaryData(_DTK_1KLambda,os);
+  writeBinaryData(_DTILambda,os);
+  writeBinaryData(_RDTILambda,os);
+  writeBinaryData(_DTIILambda,os);
+  writeBinaryData(_RDTIILambda,os);
+  return os.good();
+}
+template <typename T>
 void PBDArticulatedGradientInfo<T>::reorthogonalize(const ArticulatedBody& body)
 {
   sizeType nrJ=body.nrJ();
@@ -10,6 +10,8 @@ PRJ_BEGIN
 
 #include <Utils/MapTypePragma.h>
 template <typename T>
+struct PBDArticulatedBatchInfo;
+template <typename T>
 struct PBDArticulatedGradientInfoMap
 {
   DECL_MAP_TYPES_T
@@ -309,7 +311,12 @@ public:
   PBDArticulatedGradientInfo& operator=(const PBDArticulatedGradientInfo& other);
   void resetLambda(const ArticulatedBody& body,const Vec& lambda);
   void reset(const ArticulatedBody& body,const Vec& x);
+  //copy configuration k of a batch computed with grad=true instead of recomputing it
+  void reset(const ArticulatedBody& body,const PBDArticulatedBatchInfo<T>& batch,sizeType k);
   void reorthogonalize(const ArticulatedBody& body);
+  //the kinematics as computed, a read info equals the written one bitwise, whichever reset computed it
+  bool read(std::istream& is);
+  bool write(std::ostream& os) const;
   //debug
   static void debug(const ArticulatedBody& body);
 private:
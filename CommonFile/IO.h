@@ -159,7 +159,7 @@ template <typename K,typename T,typename CMP,typename ALLOC>FORCE_INLINE std::is
     v.clear();
   K tmpK;
   T tmpV;
-  for(sizeType i=0; i<(sizeType)v.size(); i++) {
+  for(sizeType i=0; i<size; i++) {
     readBinaryData(tmpK,is,dat);
     readBinaryData(tmpV,is,dat);
     v[tmpK]=tmpV;
@@ -207,7 +207,7 @@ template <typename K,typename T,typename H,typename P,typename ALLOC>FORCE_INLIN
     v.clear();
   K tmpK;
   T tmpV;
-  for(sizeType i=0; i<(sizeType)v.size(); i++) {
+  for(sizeType i=0; i<size; i++) {
     readBinaryData(tmpK,is,dat);
     readBinaryData(tmpV,is,dat);
     v[tmpK]=tmpV;
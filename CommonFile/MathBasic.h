@@ -518,6 +518,7 @@ struct EigenTraits<Eigen::Matrix<T2,r,c,o,mr,mc> > {
 #define OMP_PARALLEL_FOR_I(...) PRAGMA(STRINGIFY_OMP(omp parallel for num_threads(OmpSettings::getOmpSettings().nrThreads()) schedule(static) __VA_ARGS__))
 #define OMP_PARALLEL_FOR_X(X) PRAGMA(STRINGIFY_OMP(omp parallel for num_threads(X) schedule(static)))
 #define OMP_PARALLEL_FOR_XI(X,...) PRAGMA(STRINGIFY_OMP(omp parallel for num_threads(X) schedule(static) __VA_ARGS__))
+#define OMP_PARALLEL_FOR_DYNAMIC_X(X) PRAGMA(STRINGIFY_OMP(omp parallel for num_threads(X) schedule(dynamic,1)))
 #define OMP_ADD(...) reduction(+: __VA_ARGS__)
 #define OMP_PRI(...) private(__VA_ARGS__)
 #define OMP_FPRI(...) firstprivate(__VA_ARGS__)
@@ -525,12 +526,17 @@ struct EigenTraits<Eigen::Matrix<T2,r,c,o,mr,mc> > {
 #define OMP_ATOMIC_CAPTURE_	PRAGMA(STRINGIFY_OMP(omp atomic capture))
 #define OMP_CRITICAL_ PRAGMA(STRINGIFY_OMP(omp critical))
 #define OMP_FLUSH_(X) PRAGMA(STRINGIFY_OMP(omp flush(X)))
+#define OMP_PARALLEL_ PRAGMA(STRINGIFY_OMP(omp parallel num_threads(OmpSettings::getOmpSettings().nrThreads())))
+#define OMP_SINGLE_ PRAGMA(STRINGIFY_OMP(omp single))
+#define OMP_TASK_ PRAGMA(STRINGIFY_OMP(omp task default(shared)))
+#define OMP_TASKWAIT_ PRAGMA(STRINGIFY_OMP(omp taskwait))
 #else
 //openmp convenient functions
 #define OMP_PARALLEL_FOR_
 #define OMP_PARALLEL_FOR_I(...)
 #define OMP_PARALLEL_FOR_X(X)
 #define OMP_PARALLEL_FOR_XI(X,...)
+#define OMP_PARALLEL_FOR_DYNAMIC_X(X)
 #define OMP_ADD(...)
 #define OMP_PRI(...)
 #define OMP_FPRI(...)
@@ -538,6 +544,10 @@ struct EigenTraits<Eigen::Matrix<T2,r,c,o,mr,mc> > {
 #define OMP_ATOMIC_CAPTURE_
 #define OMP_CRITICAL_
 #define OMP_FLUSH_(X)
+#define OMP_PARALLEL_
+#define OMP_SINGLE_
+#define OMP_TASK_
+#define OMP_TASKWAIT_
 #endif
 struct OmpSettings {
 public:
@@ -0,0 +1,185 @@
+#include "Profiler.h"
+#include <unordered_set>
+#include <unordered_map>
+#include <algorithm>
+#include <fstream>
+#include <iomanip>
+#include <memory>
+#include <vector>
+#include <mutex>
+
+PRJ_BEGIN
+
+std::atomic<bool> profilerEnabled(false);
+struct ProfileEvent
+{
+  const char* _name;
+  std::chrono::steady_clock::time_point _beg,_end;
+  sizeType _depth;
+};
+//events are appended when a span ends, so children always precede their parent,
+//_mutex guards _events against the readers below, it is only contended while they run
+struct ProfileThread
+{
+  std::mutex _mutex;
+  std::vector<ProfileEvent> _events;
+  sizeType _depth=0;
+  sizeType _tid=0;
+};
+static std::mutex profileMutex;
+static std::vector<std::shared_ptr<ProfileThread>> profileThreads;
+static std::unordered_set<std::string> profileNames;
+static std::chrono::steady_clock::time_point profileBeg=std::chrono::steady_clock::now();
+
+static ProfileThread& profileThread()
+{
+  thread_local std::shared_ptr<ProfileThread> thread;
+  if(!thread) {
+    thread.reset(new ProfileThread);
+    std::lock_guard<std::mutex> lock(profileMutex);
+    thread->_tid=(sizeType)profileThreads.size();
+    profileThreads.push_back(thread);
+  }
+  return *thread;
+}
+void enableProfiler()
+{
+  profilerEnabled=true;
+}
+void disableProfiler()
+{
+  profilerEnabled=false;
+}
+void resetProfiler()
+{
+  std::lock_guard<std::mutex> lock(profileMutex);
+  for(std::shared_ptr<ProfileThread>& t:profileThreads) {
+    std::lock_guard<std::mutex> lockThread(t->_mutex);
+    t->_events.clear();
+  }
+  profileBeg=std::chrono::steady_clock::now();
+}
+const char* profileName(const std::string& name)
+{
+  std::lock_guard<std::mutex> lock(profileMutex);
+  return profileNames.insert(name).first->c_str();
+}
+void ProfileScope::begin()
+{
+  profileThread()._depth++;
+  _beg=std::chrono::steady_clock::now();
+}
+void ProfileScope::end()
+{
+  std::chrono::steady_clock::time_point end=std::chrono::steady_clock::now();
+  ProfileThread& t=profileThread();
+  t._depth--;
+  std::lock_guard<std::mutex> lock(t._mutex);
+  t._events.push_back({_name,_beg,end,t._depth});
+}
+static void writeJSONString(std::ostream& os,const char* str)
+{
+  os << '"';
+  for(; *str; str++)
+    if(*str=='"' || *str=='\\')
+      os << '\\' << *str;
+    else if((unsigned char)*str<0x20)
+      os << ' ';
+    else os << *str;
+  os << '"';
+}
+bool writeProfileTrace(const std::string& path)
+{
+  std::ofstream os(path);
+  if(!os.good())
+    return false;
+  std::lock_guard<std::mutex> lock(profileMutex);
+  os << std::fixed << std::setprecision(3);
+  os << "{\"displayTimeUnit\":\"ms\",\"traceEvents\":[";
+  bool first=true;
+  for(const std::shared_ptr<ProfileThread>& t:profileThreads) {
+    std::lock_guard<std::mutex> lockThread(t->_mutex);
+    for(const ProfileEvent& e:t->_events) {
+      os << (first?"\n":",\n") << "{\"name\":";
+      writeJSONString(os,e._name);
+      os << ",\"ph\":\"X\",\"pid\":0,\"tid\":" << t->_tid
+         << ",\"ts\":" << std::chrono::duration<scalarD,std::micro>(e._beg-profileBeg).count()
+         << ",\"dur\":" << std::chrono::duration<scalarD,std::micro>(e._end-e._beg).count() << "}";
+      first=false;
+    }
+  }
+  os << "\n]}" << std::endl;
+  return os.good();
+}
+void writeProfileSummary(std::ostream& os)
+{
+  struct Entry {
+    sizeType _calls=0;
+    scalarD _total=0,_self=0,_max=0;
+  };
+  std::unordered_map<const char*,Entry> entries;
+  {
+    std::lock_guard<std::mutex> lock(profileMutex);
+    for(const std::shared_ptr<ProfileThread>& t:profileThreads) {
+      std::lock_guard<std::mutex> lockThread(t->_mutex);
+      //time spent in the direct children of the currently open span at each depth
+      std::vector<scalarD> childTime;
+      for(const ProfileEvent& e:t->_events) {
+        scalarD dur=std::chrono::duration<scalarD>(e._end-e._beg).count();
+        if((sizeType)childTime.size()<e._depth+2)
+          childTime.resize(e._depth+2,0);
+        Entry& entry=entries[e._name];
+        entry._calls++;
+        entry._total+=dur;
+        entry._self+=dur-childTime[e._depth+1];
+        entry._max=std::max(entry._max,dur);
+        childTime[e._depth+1]=0;
+        childTime[e._depth]+=dur;
+      }
+    }
+  }
+  std::vector<std::pair<const char*,Entry>> sorted(entries.begin(),entries.end());
+  std::sort(sorted.begin(),sorted.end(),[](const std::pair<const char*,Entry>& a,const std::pair<const char*,Entry>& b) {
+    return a.second._self>b.second._self;
+  });
+  //spans of different threads overlap, so the total can exceed the wall time
+  scalarD self=0;
+  for(const std::pair<const char*,Entry>& e:sorted)
+    self+=e.second._self;
+  os << std::left << std::setw(72) << "span" << std::right << std::setw(10) << "calls" << std::setw(14) << "total[s]"
+     << std::setw(14) << "self[s]" << std::setw(8) << "self%" << std::setw(14) << "mean[ms]" << std::setw(14) << "max[ms]" << std::endl;
+  os << std::fixed;
+  for(const std::pair<const char*,Entry>& e:sorted)
+    os << std::left << std::setw(72) << e.first << std::right << std::setw(10) << e.second._calls
+       << std::setw(14) << std::setprecision(4) << e.second._total << std::setw(14) << e.second._self
+       << std::setw(8) << std::setprecision(1) << (self>0?e.second._self*100/self:0)
+       << std::setw(14) << std::setprecision(4) << e.second._total*1000/e.second._calls << std::setw(14) << e.second._max*1000 << std::endl;
+}
+bool writeProfileSummary(const std::string& path)
+{
+  std::ofstream os(path);
+  if(!os.good())
+    return false;
+  writeProfileSummary(os);
+  return os.good();
+}
+ProfileSession::ProfileSession(const std::string& path):_path(path)
+{
+  if(_path.empty())
+    return;
+  resetProfiler();
+  enableProfiler();
+}
+ProfileSession::~ProfileSession()
+{
+  if(_path.empty())
+    return;
+  disableProfiler();
+  if(writeProfileTrace(_path+".json") && writeProfileSummary(_path+".txt")) {
+    INFOV("Profile written to %s.json (trace) and %s.txt (summary)",_path.c_str(),_path.c_str())
+  } else {
+    WARNINGV("Cannot write profile %s",_path.c_str())
+  }
+}
+
+PRJ_END
@@ -0,0 +1,66 @@
+#ifndef PROFILER_H
+#define PROFILER_H
+
+#include "Config.h"
+#include <iostream>
+#include <atomic>
+#include <chrono>
+
+PRJ_BEGIN
+
+//scoped hot-path profiler: nested spans are recorded per thread while the
+//profiler is enabled, a disabled PROFILE_SCOPE costs one relaxed atomic load
+extern std::atomic<bool> profilerEnabled;
+void enableProfiler();
+void disableProfiler();
+void resetProfiler();
+//Chrome trace event format, open in chrome://tracing or ui.perfetto.dev
+bool writeProfileTrace(const std::string& path);
+//calls, total/self/mean/max time per span name, sorted by self time
+void writeProfileSummary(std::ostream& os);
+bool writeProfileSummary(const std::string& path);
+//name of a span that is not a string literal, the returned pointer stays valid
+const char* profileName(const std::string& name);
+class ProfileScope
+{
+public:
+  //name must outlive the profiler (a literal or the result of profileName)
+  ProfileScope(const char* name):_name(profilerEnabled.load(std::memory_order_relaxed)?name:NULL) {
+    if(_name)
+      begin();
+  }
+  ProfileScope(const std::string& name):_name(profilerEnabled.load(std::memory_order_relaxed)?profileName(name):NULL) {
+    if(_name)
+      begin();
+  }
+  ~ProfileScope() {
+    stop();
+  }
+  //end the span before the scope ends
+  void stop() {
+    if(_name)
+      end();
+    _name=NULL;
+  }
+private:
+  void begin();
+  void end();
+  const char* _name;
+  std::chrono::steady_clock::time_point _beg;
+};
+//enables the profiler if path is not empty and dumps path+".json" (trace) and path+".txt" (summary) when destroyed
+class ProfileSession
+{
+public:
+  ProfileSession(const std::string& path);
+  ~ProfileSession();
+private:
+  std::string _path;
+};
+#define PROFILE_SCOPE_CAT_(a,b) a##b
+#define PROFILE_SCOPE_CAT(a,b) PROFILE_SCOPE_CAT_(a,b)
+#define PROFILE_SCOPE(name) ProfileScope PROFILE_SCOPE_CAT(profileScope,__LINE__)(name);
+
+PRJ_END
+
+#endif
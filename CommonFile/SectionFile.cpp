@@ -0,0 +1,176 @@
+#include "SectionFile.h"
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <fstream>
+#include <sstream>
+#include <cstring>
+#include <cstdio>
+
+PRJ_BEGIN
+
+static const char SECTION_MAGIC[8]= {'L','D','S','E','C','T','\0','\0'};
+const sizeType SectionFile::ALIGN;
+const sizeType SectionFile::VERSION;
+//MappedFile
+MappedFile::MappedFile(const std::string& path):_data(NULL),_size(0)
+{
+  int fd=open(path.c_str(),O_RDONLY);
+  if(fd<0)
+    return;
+  struct stat st;
+  if(fstat(fd,&st)==0 && st.st_size>0) {
+    void* data=mmap(NULL,(size_t)st.st_size,PROT_READ,MAP_SHARED,fd,0);
+    if(data!=MAP_FAILED) {
+      _data=(const char*)data;
+      _size=(sizeType)st.st_size;
+    }
+  }
+  //the mapping stays valid after closing the descriptor
+  close(fd);
+}
+MappedFile::~MappedFile()
+{
+  if(_data)
+    munmap((void*)_data,(size_t)_size);
+}
+bool MappedFile::valid() const
+{
+  return _data!=NULL;
+}
+const char* MappedFile::data() const
+{
+  return _data;
+}
+sizeType MappedFile::size() const
+{
+  return _size;
+}
+//IMemoryStream
+IMemoryStream::Buf::Buf(const char* data,sizeType size)
+{
+  char* p=const_cast<char*>(data);
+  setg(p,p,p+size);
+}
+IMemoryStream::IMemoryStream(const char* data,sizeType size):std::istream(NULL),_buf(data,size)
+{
+  rdbuf(&_buf);
+}
+//SectionFile
+bool SectionFile::isSectionFile(const std::string& path)
+{
+  char magic[8];
+  std::ifstream is(path,std::ios::binary);
+  return is.read(magic,8) && std::memcmp(magic,SECTION_MAGIC,8)==0;
+}
+SectionFile::SectionFile(const std::string& path):_file(new MappedFile(path))
+{
+  if(!_file->valid() || _file->size()<8 || std::memcmp(_file->data(),SECTION_MAGIC,8)!=0) {
+    _file=NULL;
+    return;
+  }
+  IMemoryStream is(_file->data()+8,_file->size()-8);
+  sizeType version,nr,offset,size;
+  std::string name;
+  readBinaryData(version,is);
+  if(version!=VERSION) {
+    WARNINGV("Section file %s has version %d, expected %d",path.c_str(),version,VERSION)
+    _file=NULL;
+    return;
+  }
+  readBinaryData(_type,is);
+  readBinaryData(nr,is);
+  for(sizeType i=0; i<nr; i++) {
+    readBinaryData(name,is);
+    readBinaryData(offset,is);
+    readBinaryData(size,is);
+    if(!is.good() || offset<0 || size<0 || offset+size>_file->size()) {
+      WARNINGV("Section file %s is truncated",path.c_str())
+      _file=NULL;
+      return;
+    }
+    _sections[name]=std::make_pair(offset,size);
+  }
+}
+bool SectionFile::valid() const
+{
+  return _file!=NULL;
+}
+const std::string& SectionFile::type() const
+{
+  return _type;
+}
+bool SectionFile::has(const std::string& name) const
+{
+  return _sections.find(name)!=_sections.end();
+}
+const char* SectionFile::data(const std::string& name) const
+{
+  return _file->data()+_sections.at(name).first;
+}
+sizeType SectionFile::size(const std::string& name) const
+{
+  return _sections.at(name).second;
+}
+std::shared_ptr<IMemoryStream> SectionFile::stream(const std::string& name) const
+{
+  return std::shared_ptr<IMemoryStream>(new IMemoryStream(data(name),size(name)));
+}
+std::shared_ptr<MappedFile> SectionFile::file() const
+{
+  return _file;
+}
+//SectionFileWriter
+SectionFileWriter::SectionFileWriter(const std::string& type):_type(type) {}
+void SectionFileWriter::add(const std::string& name,std::function<void(std::ostream&)> write)
+{
+  std::ostringstream os(std::ios::binary);
+  write(os);
+  _sections.push_back(std::make_pair(name,os.str()));
+}
+bool SectionFileWriter::write(const std::string& path) const
+{
+  //the header has a fixed size given the section names, so the offsets are computed from a first pass
+  std::vector<sizeType> offsets(_sections.size(),0);
+  std::string header;
+  for(sizeType pass=0; pass<2; pass++) {
+    std::ostringstream os(std::ios::binary);
+    os.write(SECTION_MAGIC,8);
+    writeBinaryData(SectionFile::VERSION,os);
+    writeBinaryData(_type,os);
+    writeBinaryData((sizeType)_sections.size(),os);
+    for(sizeType i=0; i<(sizeType)_sections.size(); i++) {
+      writeBinaryData(_sections[i].first,os);
+      writeBinaryData(offsets[i],os);
+      writeBinaryData((sizeType)_sections[i].second.size(),os);
+    }
+    header=os.str();
+    sizeType offset=(sizeType)header.size();
+    for(sizeType i=0; i<(sizeType)_sections.size(); i++) {
+      offset=(offset+SectionFile::ALIGN-1)/SectionFile::ALIGN*SectionFile::ALIGN;
+      offsets[i]=offset;
+      offset+=(sizeType)_sections[i].second.size();
+    }
+  }
+  //the file is written next to path and renamed over it, so a hardlink to the old file (e.g. a cache entry) or a reader mapping it is left intact
+  std::string tmp=path+"."+std::to_string(getpid())+".tmp";
+  {
+    std::ofstream os(tmp,std::ios::binary);
+    os.write(header.data(),header.size());
+    sizeType offset=(sizeType)header.size();
+    for(sizeType i=0; i<(sizeType)_sections.size(); i++) {
+      std::string pad(offsets[i]-offset,'\0');
+      os.write(pad.data(),pad.size());
+      os.write(_sections[i].second.data(),_sections[i].second.size());
+      offset=offsets[i]+(sizeType)_sections[i].second.size();
+    }
+    os.close();
+    if(os.good() && std::rename(tmp.c_str(),path.c_str())==0)
+      return true;
+  }
+  std::remove(tmp.c_str());
+  return false;
+}
+
+PRJ_END
@@ -0,0 +1,93 @@
+#ifndef SECTION_FILE_H
+#define SECTION_FILE_H
+
+#include "IOBasic.h"
+#include <functional>
+#include <mutex>
+
+PRJ_BEGIN
+
+//read-only shared mapping of a whole file, all processes mapping the same file share its physical pages
+class MappedFile
+{
+public:
+  MappedFile(const std::string& path);
+  ~MappedFile();
+  bool valid() const;
+  const char* data() const;
+  sizeType size() const;
+private:
+  MappedFile(const MappedFile&);
+  MappedFile& operator=(const MappedFile&);
+  const char* _data;
+  sizeType _size;
+};
+//std::istream over a memory range, readBinaryData deserializes directly from the mapped pages
+class IMemoryStream : public std::istream
+{
+public:
+  IMemoryStream(const char* data,sizeType size);
+private:
+  struct Buf : public std::streambuf {
+    Buf(const char* data,sizeType size);
+  } _buf;
+};
+//versioned container of named sections, each section starts at a multiple of ALIGN bytes:
+//magic, version, type of the stored object, #sections and (name,offset,size) per section
+class SectionFile
+{
+public:
+  static const sizeType ALIGN=64;
+  static const sizeType VERSION=1;
+  static bool isSectionFile(const std::string& path);
+  SectionFile(const std::string& path);
+  bool valid() const;
+  const std::string& type() const;
+  bool has(const std::string& name) const;
+  const char* data(const std::string& name) const;
+  sizeType size(const std::string& name) const;
+  std::shared_ptr<IMemoryStream> stream(const std::string& name) const;
+  std::shared_ptr<MappedFile> file() const;
+private:
+  std::shared_ptr<MappedFile> _file;
+  std::string _type;
+  std::unordered_map<std::string,std::pair<sizeType,sizeType>> _sections;
+};
+class SectionFileWriter
+{
+public:
+  SectionFileWriter(const std::string& type);
+  //the section is serialized by write, whose stream starts ALIGN-aligned in the file
+  void add(const std::string& name,std::function<void(std::ostream&)> write);
+  //path is replaced by a rename, never truncated in place
+  bool write(const std::string& path) const;
+private:
+  std::string _type;
+  std::vector<std::pair<std::string,std::string>> _sections;
+};
+//section deserialized on first access, copies of the owner share the shared_ptr and hence the loaded value
+template <typename T>
+class LazySection
+{
+public:
+  typedef std::function<void(std::istream&,T&)> Reader;
+  LazySection(std::shared_ptr<SectionFile> file,const std::string& name,Reader read)
+    :_file(file),_name(name),_read(read) {}
+  const T& get() const {
+    std::call_once(_once,[&]() {
+      _read(*(_file->stream(_name)),_val);
+      _file=NULL;
+    });
+    return _val;
+  }
+private:
+  mutable std::shared_ptr<SectionFile> _file;
+  std::string _name;
+  Reader _read;
+  mutable std::once_flag _once;
+  mutable T _val;
+};
+
+PRJ_END
+
+#endif
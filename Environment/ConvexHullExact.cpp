@@ -92,6 +92,8 @@ ConvexHullExact::~ConvexHullExact()
 bool ConvexHullExact::read(std::istream& is,IOData* dat)
 {
   ObjMeshGeomCellExact::read(is,dat);
+  //the hull is queried by walking its edges, not through the BVH of closestFilter
+  _bvhD.clear();
   readBinaryData(_ess,is,dat);
   readBinaryData(_eNss,is,dat);
   removeBD();
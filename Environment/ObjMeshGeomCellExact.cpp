@@ -2,6 +2,7 @@
 #include <CommonFile/CameraModel.h>
 #include <Utils/DebugGradient.h>
 #include <CommonFile/IO.h>
+#include <CommonFile/Timing.h>
 #include <stack>
 
 USE_PRJ_NAMESPACE
@@ -15,46 +16,57 @@ ObjMeshGeomCellExact::ObjMeshGeomCellExact(const ObjMeshGeomCell& exact)
     _vss[i]=(exact.getT().block<3,3>(0,0)*exact.vss()[i]+exact.getT().block<3,1>(0,3)).cast<double>().cast<T>();
   //iss
   _iss=exact.iss();
-  //tss
-  _tss.resize(_iss.size());
-  for(sizeType i=0; i<(sizeType)_tss.size(); i++)
-    _tss[i]=TriangleExact(_vss[_iss[i][0]],_vss[_iss[i][1]],_vss[_iss[i][2]]);
-  //bvh
-  _bvh.resize(exact.bvh().size());
-  for(sizeType i=0; i<(sizeType)_bvh.size(); i++) {
-    Node<sizeType,BBoxExact>& n=_bvh[i];
+  //the rational triangles and BVH are built on demand, only the double BVH is built here
+  _bvhD.resize(exact.bvh().size());
+  for(sizeType i=0; i<(sizeType)_bvhD.size(); i++) {
+    Node<sizeType,BBox<scalarD>>& n=_bvhD[i];
     const Node<sizeType>& nRef=exact.bvh()[i];
     n._l=nRef._l;
     n._r=nRef._r;
     n._parent=nRef._parent;
     n._nrCell=nRef._nrCell;
     n._cell=nRef._cell;
-    if(n._cell>=0) {
-      n._bb=BBoxExact();
-      n._bb.setUnion(_tss[n._cell].v(0));
-      n._bb.setUnion(_tss[n._cell].v(1));
-      n._bb.setUnion(_tss[n._cell].v(2));
-    } else {
-      n._bb=_bvh[n._l]._bb;
-      n._bb.setUnion(_bvh[n._r]._bb._minC);
-      n._bb.setUnion(_bvh[n._r]._bb._maxC);
-    }
   }
+  buildFilter();
 }
 bool ObjMeshGeomCellExact::read(std::istream& is,IOData* dat)
 {
-  readBinaryData(_vss,is,dat);
+  //files written before the double filter start with the size of _vss instead of -1
+  sizeType nrV;
+  readBinaryData(nrV,is);
+  if(nrV==-1)
+    readBinaryData(_vss,is,dat);
+  else {
+    _vss.resize(nrV);
+    for(sizeType i=0; i<nrV; i++)
+      readBinaryData(_vss[i],is,dat);
+  }
   readBinaryData(_iss,is,dat);
   readBinaryData(_tss,is,dat);
   readBinaryData(_bvh,is,dat);
+  if(nrV==-1)
+    readBinaryData(_bvhD,is,dat);
+  else {
+    _bvhD.resize(_bvh.size());
+    for(sizeType i=0; i<(sizeType)_bvhD.size(); i++) {
+      _bvhD[i]._l=_bvh[i]._l;
+      _bvhD[i]._r=_bvh[i]._r;
+      _bvhD[i]._parent=_bvh[i]._parent;
+      _bvhD[i]._nrCell=_bvh[i]._nrCell;
+      _bvhD[i]._cell=_bvh[i]._cell;
+    }
+  }
+  buildFilter();
   return is.good();
 }
 bool ObjMeshGeomCellExact::write(std::ostream& os,IOData* dat) const
 {
+  writeBinaryData((sizeType)-1,os);
   writeBinaryData(_vss,os,dat);
   writeBinaryData(_iss,os,dat);
   writeBinaryData(_tss,os,dat);
   writeBinaryData(_bvh,os,dat);
+  writeBinaryData(_bvhD,os,dat);
   return os.good();
 }
 std::shared_ptr<SerializableBase> ObjMeshGeomCellExact::copy() const
@@ -67,7 +79,7 @@ std::string ObjMeshGeomCellExact::type() const
 }
 const BBoxExact& ObjMeshGeomCellExact::getBB() const
 {
-  return _bvh.back()._bb;
+  return bvhExact().back()._bb;
 }
 bool ObjMeshGeomCellExact::empty() const
 {
@@ -81,16 +93,17 @@ bool ObjMeshGeomCellExact::closest(const PT& pt,PT& n,PT& normal,MAT3& hessian,V
   T distSqr=ScalarUtil<double>::scalar_max(),distSqrTmp;
   cp.setConstant(distSqr);
   //main loop
+  const std::vector<Node<sizeType,BBoxExact>>& bvh=bvhExact();
   std::stack<std::pair<T,sizeType>> ss;
-  ss.push(std::make_pair(_bvh.back()._bb.distToSqr(pt),(sizeType)_bvh.size()-1));
+  ss.push(std::make_pair(bvh.back()._bb.distToSqr(pt),(sizeType)bvh.size()-1));
   while(!ss.empty()) {
     T distSqrToBB=ss.top().first;
-    const Node<sizeType,BBoxExact>& node=_bvh[ss.top().second];
+    const Node<sizeType,BBoxExact>& node=bvh[ss.top().second];
     ss.pop();
     if(distSqrToBB>distSqr)
       continue;
     else if(node._cell>=0) {
-      const TriangleExact& te=_tss[node._cell];
+      const TriangleExact& te=tri(node._cell);
       te.calcPointDist(pt,distSqrTmp,cpTmp,bTmp,featTmp);
       //get feature id
       for(int d=0; d<2; d++)
@@ -122,8 +135,8 @@ bool ObjMeshGeomCellExact::closest(const PT& pt,PT& n,PT& normal,MAT3& hessian,V
         n=cp-pt;
       }
     } else {
-      const Node<sizeType,BBoxExact>& nl=_bvh[node._l];
-      const Node<sizeType,BBoxExact>& nr=_bvh[node._r];
+      const Node<sizeType,BBoxExact>& nl=bvh[node._l];
+      const Node<sizeType,BBoxExact>& nr=bvh[node._r];
       T distSqrToBBL=nl._bb.distToSqr(pt);
       T distSqrToBBR=nr._bb.distToSqr(pt);
       if(distSqrToBBL<distSqrToBBR) {
@@ -162,6 +175,149 @@ bool ObjMeshGeomCellExact::closest(const PT& pt,PT& n,PT& normal,MAT3& hessian,V
   }
   return n.dot(normal)>0;
 }
+bool ObjMeshGeomCellExact::closestFilter(const Vec3d& pt,Vec3d& n,Vec3d& normal,Mat3d& hessian,Vec2i& feat,bool& inside) const
+{
+  //candidate triangle, mirrors TriangleExact::calcPointDist
+  struct Candidate {
+    sizeType _tid;
+    Vec2i _feat;
+    Vec3d _cp;
+    scalarD _distSqr,_err;
+  };
+  if(_bvhD.empty())
+    return false;
+  //err[k] bounds the rounding error of the degree-k polynomials of coordinate differences below,
+  //each coordinate difference is bounded by S
+  const BBox<scalarD>& root=_bvhD.back()._bb;
+  scalarD S=2*std::max(pt.cwiseAbs().maxCoeff(),std::max(root._minC.cwiseAbs().maxCoeff(),root._maxC.cwiseAbs().maxCoeff()));
+  scalarD err[5];
+  for(sizeType k=0; k<5; k++)
+    err[k]=1024*std::numeric_limits<scalarD>::epsilon()*std::pow(S,(scalarD)k);
+  //no pruned triangle can have an exact distance below bestUpper, nor can a triangle not in cands
+  std::vector<Candidate> cands;
+  scalarD bestUpper=std::numeric_limits<scalarD>::infinity();
+  std::stack<sizeType> ss;
+  ss.push((sizeType)_bvhD.size()-1);
+  while(!ss.empty()) {
+    const Node<sizeType,BBox<scalarD>>& node=_bvhD[ss.top()];
+    ss.pop();
+    if(node._bb.distToSqr(pt)-err[2]>bestUpper)
+      continue;
+    else if(node._cell>=0) {
+      const Vec3i& iss=_iss[node._cell];
+      const Vec3d* v[3]= {&_vssD[iss[0]],&_vssD[iss[1]],&_vssD[iss[2]]};
+      Candidate c;
+      c._tid=node._cell;
+      c._feat=Vec2i(-1,-1);
+      c._err=err[2];
+      bool outside=false,edge=false;
+      for(int d=0; d<3 && !edge; d++) {
+        const Vec3d& v0=*v[d];
+        const Vec3d& v1=*v[(d+1)%3];
+        Vec3d nO=*v[(d+2)%3]-v1;
+        scalarD nOSqr=nO.squaredNorm();
+        //(pt-v1).dot(_n[d])*nOSqr
+        scalarD side=(pt-v1).dot(nOSqr*(v1-v0)+nO*(v0-v1).dot(nO));
+        if(nOSqr<=err[2] || std::abs(side)<=err[4])
+          return false;
+        if(side>=0) {
+          outside=true;
+          scalarD e=(pt-v1).dot(nO);
+          if(std::abs(e)<=err[2] || std::abs(nOSqr-e)<=err[2])
+            return false;
+          if(e>0 && e<nOSqr) {
+            edge=true;
+            c._feat=Vec2i((d+1)%3,(d+2)%3);
+            c._cp=v1+nO*(e/nOSqr);
+            c._err=err[2]*std::max<scalarD>(1,err[2]/nOSqr/err[0]);
+          }
+        }
+      }
+      if(!outside) {
+        Vec3d nt=(*v[1]-*v[0]).cross(*v[2]-*v[0]);
+        scalarD ntSqr=nt.squaredNorm();
+        if(ntSqr<=err[4])
+          return false;
+        c._cp=pt-nt*((pt-*v[0]).dot(nt)/ntSqr);
+        c._err=err[2]*std::max<scalarD>(1,err[4]/ntSqr/err[0]);
+      } else if(!edge) {
+        sizeType best=0;
+        for(int d=1; d<3; d++) {
+          scalarD diff=(pt-*v[d]).squaredNorm()-(pt-*v[best]).squaredNorm();
+          if(std::abs(diff)<=2*err[2])
+            return false;
+          if(diff<0)
+            best=d;
+        }
+        c._feat=Vec2i(best,-1);
+        c._cp=*v[best];
+      }
+      c._distSqr=(pt-c._cp).squaredNorm();
+      //get feature id, make feature id unique
+      for(int d=0; d<2; d++)
+        if(c._feat[d]>=0)
+          c._feat[d]=iss[c._feat[d]];
+      if(c._feat[1]>=0 && c._feat[0]>c._feat[1])
+        std::swap(c._feat[0],c._feat[1]);
+      else if(c._feat[0]==-1)
+        c._feat[1]=node._cell;
+      bestUpper=std::min(bestUpper,c._distSqr+c._err);
+      cands.push_back(c);
+    } else {
+      ss.push(node._l);
+      ss.push(node._r);
+    }
+  }
+  //all triangles that may be the closest must share the closest feature
+  const Candidate* best=NULL;
+  scalarD bestAlign=0,secondAlign=-1;
+  for(const Candidate& c:cands)
+    if(c._distSqr-c._err<=bestUpper) {
+      if(best && c._feat!=best->_feat)
+        return false;
+      //the exact closest keeps the triangle best aligned with (cp-pt), (cp-pt).dot(nt)=(v0-pt).dot(nt) as cp lies in the plane
+      const Vec3d& v0=_vssD[_iss[c._tid][0]];
+      Vec3d nt=(_vssD[_iss[c._tid][1]]-v0).cross(_vssD[_iss[c._tid][2]]-v0);
+      scalarD align=std::abs((v0-pt).dot(nt));
+      if(!best || align>bestAlign) {
+        secondAlign=best?bestAlign:-1;
+        bestAlign=align;
+        best=&c;
+      } else secondAlign=std::max(secondAlign,align);
+    }
+  if(!best || (secondAlign>=0 && bestAlign-secondAlign<=2*err[3]))
+    return false;
+  //inside/outside
+  const Vec3d& v0=_vssD[_iss[best->_tid][0]];
+  normal=(_vssD[_iss[best->_tid][1]]-v0).cross(_vssD[_iss[best->_tid][2]]-v0);
+  scalarD side=(v0-pt).dot(normal);
+  if(std::abs(side)<=err[3])
+    return false;
+  inside=side>0;
+  feat=best->_feat;
+  n=best->_cp-pt;
+  //adjust hessian
+  if(feat[0]==-1) {
+    //surface
+    hessian.setZero();
+  } else if(feat[1]==-1) {
+    //vertex
+    hessian=n*n.transpose();
+    hessian/=hessian.trace();
+    hessian-=Mat3d::Identity();
+  } else {
+    //edge
+    Vec3d e=_vssD[feat[0]]-_vssD[feat[1]];
+    scalarD eDotE=e.dot(e);
+    Vec3d d=n-n.dot(e)*e/eDotE;
+    scalarD dDotD=d.dot(d);
+    Vec3d nd=e.dot(d)*e/eDotE/dDotD;
+    hessian=e*e.transpose()/eDotE-Mat3d::Identity();
+    hessian+=d*d.transpose()/dDotD;
+    hessian-=d*nd.transpose();
+  }
+  return true;
+}
 void ObjMeshGeomCellExact::writePointDistVTK(const std::string& path,sizeType res) const
 {
   VTKWriter<scalar> os("PointDist",path,true);
@@ -217,6 +373,113 @@ void ObjMeshGeomCellExact::debugPointDist(sizeType nrIter) const
       }
   }
 }
+void ObjMeshGeomCellExact::debugFilter(sizeType nrIter) const
+{
+  if(_iss.empty())
+    return;
+  BBox<scalar> bb;
+  bb._minC=castRational<Vec3,PT>(getBB()._minC);
+  bb._maxC=castRational<Vec3,PT>(getBB()._maxC);
+  scalar ext=bb.getExtent().maxCoeff();
+  sizeType nrCertified=0,nrWrong=0;
+  scalarD timeFilter=0,timeExact=0;
+  for(sizeType i=0; i<nrIter; i++) {
+    //half of the points are uniform in the enlarged bounding box, half are close to a random surface point
+    Vec3d pt;
+    if(i%2==0) {
+      Vec3 alpha=Vec3::Random()*0.5+Vec3::Constant(0.5);
+      pt=(bb._minC.array()*(1-alpha.array())+bb._maxC.array()*alpha.array()).matrix().cast<scalarD>()+Vec3d::Random()*ext*0.1f;
+    } else {
+      const Vec3i& iss=_iss[RandEngine::randI(0,(sizeType)_iss.size()-1)];
+      Vec3d b=Vec3d::Random().cwiseAbs();
+      b/=b.sum();
+      pt=_vssD[iss[0]]*b[0]+_vssD[iss[1]]*b[1]+_vssD[iss[2]]*b[2]+Vec3d::Random()*ext*1e-3f;
+    }
+    Vec3d n,normal;
+    Mat3d hessian;
+    Vec2i feat;
+    bool inside;
+    TBEG();
+    bool certified=closestFilter(pt,n,normal,hessian,feat,inside);
+    timeFilter+=TENDV();
+    if(!certified)
+      continue;
+    nrCertified++;
+    PT nR,normalR;
+    MAT3 hessianR;
+    Vec2i featR;
+    TBEG();
+    bool insideR=closest(pt.cast<T>(),nR,normalR,hessianR,featR);
+    timeExact+=TENDV();
+    scalarD errN=(n-castRational<Vec3d,PT>(nR)).norm()/std::max<scalarD>(ext,1e-10f);
+    if(feat!=featR || inside!=insideR || errN>1e-10f) {
+      WARNINGV("closestFilter mismatch: feat=(%d,%d)/(%d,%d) inside=%d/%d errN=%g",feat[0],feat[1],featR[0],featR[1],inside?1:0,insideR?1:0,errN)
+      nrWrong++;
+    }
+  }
+  INFOV("closestFilter: %d/%d certified, %d mismatches, filter %fs, rational %fs (certified queries only)",nrCertified,nrIter,nrWrong,timeFilter,timeExact)
+}
+const TriangleExact& ObjMeshGeomCellExact::tri(sizeType i) const
+{
+  if(!_tss.empty())
+    return _tss[i];
+  //the first thread to finish building publishes its triangle, published triangles are never replaced
+  std::shared_ptr<TriangleExact> t=std::atomic_load(&_tssLazy[i]),expected;
+  if(!t) {
+    t.reset(new TriangleExact(_vss[_iss[i][0]],_vss[_iss[i][1]],_vss[_iss[i][2]]));
+    if(!std::atomic_compare_exchange_strong(&_tssLazy[i],&expected,t))
+      t=expected;
+  }
+  return *t;
+}
+const std::vector<Node<sizeType,BBoxExact>>& ObjMeshGeomCellExact::bvhExact() const
+{
+  if(!_bvh.empty())
+    return _bvh;
+  std::shared_ptr<std::vector<Node<sizeType,BBoxExact>>> bvh=std::atomic_load(&_bvhLazy),expected;
+  if(!bvh) {
+    bvh.reset(new std::vector<Node<sizeType,BBoxExact>>(_bvhD.size()));
+    for(sizeType i=0; i<(sizeType)bvh->size(); i++) {
+      Node<sizeType,BBoxExact>& n=bvh->at(i);
+      const Node<sizeType,BBox<scalarD>>& nRef=_bvhD[i];
+      n._l=nRef._l;
+      n._r=nRef._r;
+      n._parent=nRef._parent;
+      n._nrCell=nRef._nrCell;
+      n._cell=nRef._cell;
+      if(n._cell>=0) {
+        n._bb=BBoxExact(_vss[_iss[n._cell][0]],_vss[_iss[n._cell][1]],_vss[_iss[n._cell][2]]);
+      } else {
+        n._bb=bvh->at(n._l)._bb;
+        n._bb.setUnion(bvh->at(n._r)._bb._minC);
+        n._bb.setUnion(bvh->at(n._r)._bb._maxC);
+      }
+    }
+    if(!std::atomic_compare_exchange_strong(&_bvhLazy,&expected,bvh))
+      bvh=expected;
+  }
+  return *bvh;
+}
+void ObjMeshGeomCellExact::buildFilter()
+{
+  _tssLazy.assign(_iss.size(),NULL);
+  _bvhLazy=NULL;
+  _vssD.resize(_vss.size());
+  for(sizeType i=0; i<(sizeType)_vss.size(); i++)
+    _vssD[i]=castRational<Vec3d,PT>(_vss[i]);
+  //children are stored before their parents
+  for(sizeType i=0; i<(sizeType)_bvhD.size(); i++) {
+    Node<sizeType,BBox<scalarD>>& n=_bvhD[i];
+    n._bb.reset();
+    if(n._cell>=0 && n._cell<(sizeType)_iss.size()) {
+      for(sizeType d=0; d<3; d++)
+        n._bb.setUnion(_vssD[_iss[n._cell][d]]);
+    } else if(n._l>=0 && n._r>=0) {
+      n._bb.setUnion(_bvhD[n._l]._bb);
+      n._bb.setUnion(_bvhD[n._r]._bb);
+    }
+  }
+}
 ObjMesh ObjMeshGeomCellExact::getMesh() const
 {
   ObjMesh ret;
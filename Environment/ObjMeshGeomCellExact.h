@@ -22,32 +22,42 @@ struct ALIGN_16 ObjMeshGeomCellExact : public SerializableBase
   const BBoxExact& getBB() const;
   bool empty() const;
   virtual bool closest(const PT& pt,PT& n,PT& normal,MAT3& hessian,Vec2i& feat,bool cache=false,std::vector<PT,Eigen::aligned_allocator<PT>>* history=NULL) const;
+  //double queries first run closestFilter and only fall back to the rational closest if it cannot certify the result
   template <typename T2>
   T2 closest(const Eigen::Matrix<T2,3,1>& pt,Eigen::Matrix<T2,3,1>& n,Eigen::Matrix<T2,3,1>& normal,Eigen::Matrix<T2,3,3>& hessian,Vec2i& feat,bool cache=false,std::vector<Eigen::Matrix<T2,3,1>,Eigen::aligned_allocator<Eigen::Matrix<T2,3,1>>>* history=NULL) const
   {
     bool inside;
-    MAT3 hessianR;
-    PT ptR=pt.unaryExpr([&](const T2& t) {
-      T ret;
-      castRational(t,ret);
-      return ret;
-    }),nR,normalR;
-    std::vector<PT,Eigen::aligned_allocator<PT>> historyT2;
-    inside=closest(ptR,nR,normalR,hessianR,feat,cache,history?&historyT2:NULL);
-    if(history) {
-      history->resize(historyT2.size());
-      for(sizeType i=0; i<(sizeType)history->size(); i++)
-        history->at(i)=castRational<Eigen::Matrix<T2,3,1>,PT>(historyT2[i]);
+    Vec3d nD,normalD;
+    Mat3d hessianD;
+    if(std::is_same<T2,scalarD>::value && !history && closestFilter(pt.unaryExpr([&](const T2& t) {
+      return (scalarD)std::to_double(t);
+    }),nD,normalD,hessianD,feat,inside)) {
+      n=nD.template cast<T2>();
+      normal=normalD.template cast<T2>();
+      hessian=hessianD.template cast<T2>();
+    } else {
+      MAT3 hessianR;
+      PT ptR=pt.unaryExpr([&](const T2& t) {
+        T ret;
+        castRational(t,ret);
+        return ret;
+      }),nR,normalR;
+      std::vector<PT,Eigen::aligned_allocator<PT>> historyT2;
+      inside=closest(ptR,nR,normalR,hessianR,feat,cache,history?&historyT2:NULL);
+      if(history) {
+        history->resize(historyT2.size());
+        for(sizeType i=0; i<(sizeType)history->size(); i++)
+          history->at(i)=castRational<Eigen::Matrix<T2,3,1>,PT>(historyT2[i]);
+      }
+      //cast
+      n=castRational<Eigen::Matrix<T2,3,1>,PT>(nR);
+      normal=castRational<Eigen::Matrix<T2,3,1>,PT>(normalR);
+      hessian=castRational<Eigen::Matrix<T2,3,3>,MAT3>(hessianR);
     }
-    inside=closest(ptR,nR,normalR,hessianR,feat,cache,history?&historyT2:NULL);
-    //cast
-    n=castRational<Eigen::Matrix<T2,3,1>,PT>(nR);
-    normal=castRational<Eigen::Matrix<T2,3,1>,PT>(normalR);
-    hessian=castRational<Eigen::Matrix<T2,3,3>,MAT3>(hessianR);
     //post process
     T2 nLen=std::sqrt(n.squaredNorm());
     hessian/=std::max(std::numeric_limits<T2>::epsilon(),nLen);
-    if(nR[0]==0 && nR[1]==0 && nR[2]==0) {
+    if(n[0]==0 && n[1]==0 && n[2]==0) {
       nLen=0;
       normal/=std::max(std::numeric_limits<T2>::epsilon(),std::sqrt(normal.squaredNorm()));
     } else {
@@ -61,14 +71,29 @@ struct ALIGN_16 ObjMeshGeomCellExact : public SerializableBase
     }
     return nLen;
   }
+  //same result as the rational closest evaluated in double precision, returns false if the closest feature,
+  //a Voronoi region test or the inside/outside test is within its a-priori rounding error bound
+  bool closestFilter(const Vec3d& pt,Vec3d& n,Vec3d& normal,Mat3d& hessian,Vec2i& feat,bool& inside) const;
   virtual void writePointDistVTK(const std::string& path,sizeType res=10) const;
   virtual void debugPointDist(sizeType nrIter=100) const;
+  //compares closestFilter with the rational closest and reports the fraction of certified queries and the timings
+  void debugFilter(sizeType nrIter=1000) const;
   ObjMesh getMesh() const;
 protected:
+  const TriangleExact& tri(sizeType i) const;
+  const std::vector<Node<sizeType,BBoxExact>>& bvhExact() const;
+  void buildFilter();
+  //_tss and _bvh are either built eagerly (ConvexHullExact, older files) or left empty,
+  //then _tssLazy and _bvhLazy are built per triangle/once on the first rational query
   ALIGN_16 std::vector<TriangleExact> _tss;
   ALIGN_16 std::vector<PT,Eigen::aligned_allocator<PT>> _vss;
   ALIGN_16 std::vector<Vec3i,Eigen::aligned_allocator<Vec3i>> _iss;
   ALIGN_16 std::vector<Node<sizeType,BBoxExact>> _bvh;
+  ALIGN_16 mutable std::vector<std::shared_ptr<TriangleExact>> _tssLazy;
+  ALIGN_16 mutable std::shared_ptr<std::vector<Node<sizeType,BBoxExact>>> _bvhLazy;
+  //double vertices (_vss are converted from double, so they are exact) and BVH for closestFilter
+  ALIGN_16 std::vector<Vec3d,Eigen::aligned_allocator<Vec3d>> _vssD;
+  ALIGN_16 std::vector<Node<sizeType,BBox<scalarD>>> _bvhD;
 };
 
 PRJ_END
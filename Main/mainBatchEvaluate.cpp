@@ -0,0 +1,84 @@
+#include <Quasistatic/GraspPlanner.h>
+#include <Utils/Utils.h>
+#include <CommonFile/Timing.h>
+#include <fstream>
+#include <sstream>
+
+USE_PRJ_NAMESPACE
+
+typedef double T;
+typedef GraspPlanner<T>::Vec Vec;
+typedef GraspPlanner<T>::MatT MatT;
+MatT readConfigurations(const std::string& path)
+{
+  //one configuration per (non-empty) line, all of the same length
+  std::vector<std::vector<T>> xs;
+  std::string line;
+  std::ifstream fin(path);
+  sizeType lineId=0;
+  while(std::getline(fin,line)) {
+    lineId++;
+    std::istringstream iss(line);
+    std::vector<T> x;
+    T a;
+    while(iss >> a)
+      x.push_back(a);
+    if(!x.empty()) {
+      ASSERT_MSGV(xs.empty() || x.size()==xs[0].size(),"Line %d of %s has %d values, the first configuration has %d",lineId,path.c_str(),(sizeType)x.size(),(sizeType)xs[0].size())
+      xs.push_back(x);
+    }
+  }
+  MatT ret=MatT::Zero((sizeType)xs.size(),xs.empty()?0:(sizeType)xs[0].size());
+  for(sizeType i=0; i<(sizeType)xs.size(); i++)
+    for(sizeType j=0; j<(sizeType)xs[i].size(); j++)
+      ret(i,j)=xs[i][j];
+  return ret;
+}
+int main(int argn,char** argc)
+{
+  mpfr_set_default_prec(1024U);
+  RandEngine::useDeterministic();
+  RandEngine::seed(0);
+
+  ASSERT_MSG(argn>=6,"mainBatchEvaluate: [urdf path] [sample density] [obj path] [configurations (one per line)] [output .csv] [normalExtrude (default 2)]")
+  std::string path(argc[1]);
+  sizeType density=std::atoi(argc[2]);
+  std::string pathObj(argc[3]);
+  std::string pathX(argc[4]);
+  std::string pathOut(argc[5]);
+  //the metric points are extruded as in the Q_INF phase of mainGraspPlan, whose results are ranked with normalExtrude=2
+  T normalExtrude=argn>=7?std::atof(argc[6]):2;
+
+  //load hand
+  std::experimental::filesystem::v1::path pathIO(path);
+  pathIO.replace_extension("");
+  pathIO.replace_filename(pathIO.filename().string()+"_"+std::to_string(density));
+  pathIO.replace_extension(".dat");
+  GraspPlanner<T> planner;
+  ASSERT_MSG(exists(pathIO.string()),"Use mainGripper to create gripper first")
+  planner.readMapped(pathIO.string());
+
+  //load object
+  PointCloudObject<T> obj;
+  ASSERT_MSGV(exists(pathObj),"Cannot find file: %s",pathObj.c_str())
+  obj.readMapped(pathObj);
+
+  //evaluate
+  MatT xs=readConfigurations(pathX);
+  ASSERT_MSGV(xs.rows()>0,"No configuration in %s",pathX.c_str())
+  Options ops;
+  GraspPlannerParameter param(ops);
+  param._normalExtrude=normalExtrude;
+  TBEG("evaluateBatch");
+  MatT ret=planner.evaluateBatch(xs,obj,param);
+  TEND();
+  INFOV("Evaluated %d configurations",(sizeType)xs.rows())
+
+  //one row per configuration, in the order of the input
+  std::ofstream os(pathOut);
+  os.precision(17);
+  os << "Q1,QInf,EObj,ESelf,nrSelfCollision" << std::endl;
+  for(sizeType i=0; i<ret.rows(); i++)
+    os << ret(i,0) << "," << ret(i,1) << "," << ret(i,2) << "," << ret(i,3) << "," << (sizeType)ret(i,4) << std::endl;
+  return 0;
+}
@@ -16,6 +16,10 @@ int main()
   FGTTreeNode<T>::debugFGT(10,2,true,0.1f,1e-3f,false);
   FGTTreeNode<T>::debugFGT(10,2,true,1.0f,1e-3f,true);
   FGTTreeNode<T>::debugFGT(10,2,true,1.0f,1e-3f,false);
+  FGTTreeNode<T>::debugFGTIncremental(10,2,true,0.1f,1e-3f,true);
+  FGTTreeNode<T>::debugFGTIncremental(10,2,true,0.1f,1e-3f,false);
+  FGTTreeNode<T>::debugKernels(10,2,true,0.1f,1e-3f,true);
+  FGTTreeNode<T>::debugKernels(10,2,true,0.1f,1e-3f,false);
   //std::cout << FGTTreeNode<T>::combination(10,3) << std::endl;
   return 0;
 }
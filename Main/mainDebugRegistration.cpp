@@ -23,7 +23,7 @@ int main(int argn,char** argc)
 
   //test objective
   PointCloudObject<T> object;
-  object.SerializableBase::read(pathObj);
+  object.readMapped(pathObj);
   object.writeVTK("pointCloud",1);
 
   //load objects
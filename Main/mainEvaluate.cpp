@@ -67,11 +67,11 @@ int main(int argn,char** argc)
   pathIO.replace_extension(".dat");
   GraspPlanner<T> planner;
   ASSERT_MSG(exists(pathIO.string()),"Use mainGripper to create gripper first")
-  planner.SerializableBase::read(pathIO.string());
+  planner.readMapped(pathIO.string());
 
   //test objective
   PointCloudObject<T> obj;
-  obj.SerializableBase::read(pathObj);
+  obj.readMapped(pathObj);
   Vec x0=Vec::Zero(planner.body().nrDOF());
   std::cout << "dofnum = " << planner.body().nrDOF() << std::endl;
   std::string handName=" ";
@@ -3,9 +3,13 @@
 #include <Quasistatic/ObjectClosednessEnergy.h>
 #include <Quasistatic/LogBarrierObjEnergy.h>
 #include <Quasistatic/ConvexLogBarrierSelfEnergy.h>
+#include <Quasistatic/SQPTelemetry.h>
+#include <CommonFile/Profiler.h>
 #include <Utils/Utils.h>
 #include <string>
 #include <fstream>
+#include <sstream>
+#include <chrono>
 
 USE_PRJ_NAMESPACE
 
@@ -21,7 +25,7 @@ Vec initializeParams(std::string path, Vec &x)
   fin.open((path));
   float a;
   std::cout << "Initial parameters are: ";
-  while (fin >> a) {
+  while (i < x.size() && fin >> a) {
     x[i] = a;
     std::cout << x[i] << " ";
     i++;
@@ -29,13 +33,85 @@ Vec initializeParams(std::string path, Vec &x)
   std::cout << std::endl;
   return x;
 }
+std::vector<Vec> initializeMultiStartParams(std::string path, const Vec& x)
+{
+  //one initial configuration per (non-empty) line
+  std::vector<Vec> xs;
+  std::string line;
+  std::ifstream fin(path);
+  while(std::getline(fin,line)) {
+    std::istringstream iss(line);
+    Vec xl=x;
+    sizeType i=0;
+    float a;
+    while(iss >> a && i<xl.size())
+      xl[i++]=a;
+    if(i>0)
+      xs.push_back(xl);
+  }
+  return xs;
+}
+void writeRanking(const std::string& path,const std::vector<Vec>& xs,const std::vector<T>& QInf,const std::vector<sizeType>& iters)
+{
+  std::vector<sizeType> order(xs.size());
+  for(sizeType i=0; i<(sizeType)order.size(); i++)
+    order[i]=i;
+  std::stable_sort(order.begin(),order.end(),[&](sizeType a,sizeType b) {
+    return QInf[a]>QInf[b];
+  });
+  std::ofstream os(path);
+  os << "#rank start Q_INF iterations parameters" << std::endl;
+  for(sizeType r=0; r<(sizeType)order.size(); r++) {
+    sizeType i=order[r];
+    os << r << " " << i << " " << QInf[i] << " " << iters[i];
+    if(xs[i].size()==0)
+      os << " failed";
+    for(sizeType d=0; d<xs[i].size(); d++)
+      os << " " << xs[i][d];
+    os << std::endl;
+    INFOV("Rank %d: start %d Q_INF=%f iterations=%d",r,i,QInf[i],iters[i])
+  }
+}
+//wall-clock budget shared by the optimization phases (LIBDIFF_TIME_BUDGET), with the time each phase used
+struct PhaseBudget
+{
+  typedef std::chrono::steady_clock Clock;
+  PhaseBudget(scalarD budget):_budget(budget),_beg(Clock::now()),_begPhase(_beg) {}
+  //the budget of the next phase: the given fraction of what is left, 0 (no budget) if there is none
+  scalarD begin(scalarD frac) {
+    _begPhase=Clock::now();
+    if(_budget<=0)
+      return 0;
+    scalarD left=_budget-std::chrono::duration<scalarD>(_begPhase-_beg).count();
+    return std::max<scalarD>(left*frac,std::numeric_limits<scalarD>::min());
+  }
+  void end(const std::string& name,scalarD budget) {
+    _phases.push_back(std::make_tuple(name,budget,std::chrono::duration<scalarD>(Clock::now()-_begPhase).count()));
+    INFOV("Phase %s: %fs used of a budget of %fs",name.c_str(),std::get<2>(_phases.back()),budget)
+  }
+  void write(const std::string& path) const {
+    if(_budget<=0)
+      return;
+    std::ofstream os(path);
+    os << "#phase budget used" << std::endl;
+    for(const std::tuple<std::string,scalarD,scalarD>& p:_phases)
+      os << std::get<0>(p) << " " << std::get<1>(p) << " " << std::get<2>(p) << std::endl;
+    os << "total " << _budget << " " << std::chrono::duration<scalarD>(Clock::now()-_beg).count() << std::endl;
+  }
+  scalarD _budget;
+  Clock::time_point _beg,_begPhase;
+  std::vector<std::tuple<std::string,scalarD,scalarD>> _phases;
+};
 int main(int argn,char** argc)
 {
   mpfr_set_default_prec(1024U);
   RandEngine::useDeterministic();
   RandEngine::seed(0);
+  //LIBDIFF_PROFILE=<path> records the profiler spans and writes <path>.json (Chrome trace) and <path>.txt (summary) on exit
+  const char* profilePath=std::getenv("LIBDIFF_PROFILE");
+  ProfileSession profile(profilePath?profilePath:"");
 
-  ASSERT_MSG(argn>=7,"mainGraspPlan: [urdf path] [sample density] [obj path] [obj name] [obj scale] [use_FGT] [max_iters] [saving dir] [initial parameters]")
+  ASSERT_MSG(argn>=7,"mainGraspPlan: [urdf path] [sample density] [obj path] [obj name] [obj scale] [use_FGT] [max_iters] [saving dir] [initial parameters (one configuration per line for multi-start)] [FGT threshold or -] [telemetry path (.jsonl/.csv)]")
   std::string path(argc[1]);
   sizeType density=std::atoi(argc[2]);
   std::string pathObj(argc[3]);
@@ -67,11 +143,11 @@ int main(int argn,char** argc)
   pathIO.replace_extension(".dat");
   GraspPlanner<T> planner;
   ASSERT_MSG(exists(pathIO.string()),"Use mainGripper to create gripper first")
-  planner.SerializableBase::read(pathIO.string());
+  planner.readMapped(pathIO.string());
 
   //test objective
   PointCloudObject<T> obj;
-  obj.SerializableBase::read(pathObj);
+  obj.readMapped(pathObj);
   Vec x0=Vec::Zero(planner.body().nrDOF());
   std::cout << "dofnum = " << planner.body().nrDOF() << std::endl;
   std::string handName=" ";
@@ -86,10 +162,37 @@ int main(int argn,char** argc)
   Options ops;
   std::string type;
   GraspPlannerParameter param(ops);
-  if(argn>=11) {
+  //"-" keeps the default FGT threshold, e.g. when only a telemetry path is given
+  if(argn>=11 && std::string(argc[10])!="-") {
     param._FGTThres=std::atof(argc[10]);
     std::cout << "setting FGTThres=" << param._FGTThres << std::endl;
   }
+  std::string telemetryPath;
+  if(argn>=12) {
+    telemetryPath=argc[11];
+    std::cout << "writing SQP telemetry to " << telemetryPath << std::endl;
+  }
+  //LIBDIFF_CHECKPOINT=<path> writes the SQP state to <path> every LIBDIFF_CHECKPOINT_INTERVAL iterations (default 10),
+  //LIBDIFF_RESUME=1 continues a preempted run from it, the finished phases and starts return their stored results
+  const char* checkpointPath=std::getenv("LIBDIFF_CHECKPOINT");
+  const char* checkpointInterval=std::getenv("LIBDIFF_CHECKPOINT_INTERVAL");
+  const char* resume=std::getenv("LIBDIFF_RESUME");
+  std::string checkpoint=checkpointPath?checkpointPath:"";
+  if(!checkpoint.empty()) {
+    if(checkpointInterval)
+      param._checkpointInterval=std::atoi(checkpointInterval);
+    param._resume=resume && std::atoi(resume)!=0;
+    std::cout << "writing SQP checkpoints to " << checkpoint << (param._resume?" (resuming)":"") << std::endl;
+  }
+  //LIBDIFF_TIME_BUDGET=<seconds> bounds the wall-clock time of the optimization, the normalExtrude=10 phase gets half of it,
+  //LIBDIFF_TARGET_QINF=<Q_INF> ends the normalExtrude=2 phase once a feasible configuration reaches it,
+  //with either the best feasible configuration of every phase is kept, and budget.txt lists the time each phase used
+  const char* timeBudget=std::getenv("LIBDIFF_TIME_BUDGET");
+  const char* targetQInf=std::getenv("LIBDIFF_TARGET_QINF");
+  PhaseBudget budget(timeBudget?std::atof(timeBudget):0);
+  scalarD target=targetQInf?std::atof(targetQInf):0;
+  if(budget._budget>0 || target>0)
+    std::cout << "anytime optimization: time budget=" << budget._budget << "s target Q_INF=" << target << std::endl;
   if(initParamsPath!="") {
     x0=initializeParams(initParamsPath, x0);
     if(pathIO.string().find("BarrettHand")!=std::string::npos) {
@@ -154,16 +257,88 @@ int main(int argn,char** argc)
     std::cout << "using Q_1" << std::endl;
     param._metric=Q_1;
   }
+  std::vector<Vec> inits;
+  if(initParamsPath!="")
+    inits=initializeMultiStartParams(initParamsPath,Vec::Zero(planner.body().nrDOF()));
+  if(inits.size()>1) {
+    //multi-start: every line of the initial parameters is optimized concurrently, sharing the loaded gripper and object
+    INFOV("Multi-start mode with %d initial configurations",(sizeType)inits.size())
+    std::vector<sizeType> iters(inits.size(),0),itersPhase;
+    std::vector<T> QInf(inits.size(),-std::numeric_limits<T>::infinity());
+    std::vector<Vec> xs=inits;
+    if(max_iters==1) {
+      param._normalExtrude=2;
+      param._metric=Q_INF;
+      for(sizeType i=0; i<(sizeType)xs.size(); i++) {
+        Vec x=xs[i];
+        QInf[i]=planner.evaluateQInf(x,obj,param);
+      }
+    } else {
+      if(max_iters<0) {
+        param._normalExtrude=10;
+        param._maxIter=std::abs(max_iters);
+        param._telemetry=SQPTelemetry::suffixPath(telemetryPath,"_extrude10");
+        param._checkpoint=SQPTelemetry::suffixPath(checkpoint,"_extrude10");
+        param._timeBudget=budget.begin(0.5f);
+        param._targetQInf=0;
+        INFO("Optimizing using normalExtrude=10")
+        xs=planner.optimizeMultiStart(xs,obj,param,&iters);
+        budget.end("extrude10",param._timeBudget);
+        //failed starts are retried from their initial configuration in the second phase
+        for(sizeType i=0; i<(sizeType)xs.size(); i++)
+          if(xs[i].size()==0)
+            xs[i]=inits[i];
+      }
+      param._normalExtrude=2;
+      param._maxIter=std::abs(max_iters);
+      param._telemetry=telemetryPath;
+      param._checkpoint=checkpoint;
+      param._timeBudget=budget.begin(1);
+      param._targetQInf=target;
+      INFO("Optimizing using normalExtrude=2")
+      xs=planner.optimizeMultiStart(xs,obj,param,&itersPhase,&QInf);
+      budget.end("extrude2",param._timeBudget);
+      for(sizeType i=0; i<(sizeType)xs.size(); i++)
+        iters[i]+=itersPhase[i];
+    }
+    std::string multiStartFileName=savingDir+"multiStart_"+handName+ "_" + objName+"_"+objScale;
+    create(multiStartFileName);
+    writeRanking(multiStartFileName+"/ranking.txt",xs,QInf,iters);
+    budget.write(multiStartFileName+"/budget.txt");
+    std::cout << "Ranking saved at: " << multiStartFileName << "/ranking.txt" << std::endl;
+    //the best start is also saved as the regular result
+    sizeType best=std::max_element(QInf.begin(),QInf.end())-QInf.begin();
+    if(max_iters!=1 && xs[best].size()>0) {
+      std::string afterOptimizeFileName=savingDir+"afterOptimize_"+handName+ "_" + objName+"_"+objScale;
+      std::cout << "Output paramters saved at: " << afterOptimizeFileName << std::endl;
+      planner.writeVTK(xs[best],afterOptimizeFileName, 1);
+      std::ofstream afterOptimizeFile(afterOptimizeFileName + "/parameters.txt");
+      for(sizeType i=0; i<xs[best].size(); i++)
+        afterOptimizeFile << xs[best][i] << " ";
+    }
+    return 0;
+  }
   if(max_iters==1) {
     param._normalExtrude=2;
-    planner.evaluateQInf(x0, obj, param);
+    INFOV("Q_INF=%.10g",std::to_double(planner.evaluateQInf(x0, obj, param)))
   } else {
     if(max_iters<0) {
       param._normalExtrude=10;
       param._maxIter=std::abs(max_iters);
+      param._telemetry=SQPTelemetry::suffixPath(telemetryPath,"_extrude10");
+      param._checkpoint=SQPTelemetry::suffixPath(checkpoint,"_extrude10");
+      param._timeBudget=budget.begin(0.5f);
+      param._targetQInf=0;
       INFO("Optimizing using normalExtrude=10")
       x0=planner.optimize(false,x0,obj,param);
+      budget.end("extrude10",param._timeBudget);
       if(savingDir.empty() || savingDir=="profile") {
+        //quality of the profiled result, used by benchmarkFGT.py to measure the accuracy of FGT
+        if(x0.size()>0) {
+          param._normalExtrude=2;
+          param._metric=Q_INF;
+          INFOV("Q_INF=%.10g",std::to_double(planner.evaluateQInf(x0,obj,param)))
+        }
         INFO("No savingDir specified, this is a performance profile, exiting!")
         return 0;
       }
@@ -171,8 +346,13 @@ int main(int argn,char** argc)
 
     param._normalExtrude=2;
     param._maxIter=std::abs(max_iters);
+    param._telemetry=telemetryPath;
+    param._checkpoint=checkpoint;
+    param._timeBudget=budget.begin(1);
+    param._targetQInf=target;
     INFO("Optimizing using normalExtrude=2")
     x0=planner.optimize(false,x0,obj,param);
+    budget.end("extrude2",param._timeBudget);
 
     std::string afterOptimizeFileName=savingDir+"afterOptimize_"+handName+ "_" + objName+"_"+objScale;
     std::cout << "Output paramters saved at: " << afterOptimizeFileName << std::endl;
@@ -181,6 +361,7 @@ int main(int argn,char** argc)
     std::ofstream afterOptimizeFile(afterOptimizeFileName + "/parameters.txt");
     for(sizeType i=0; i<x0.size(); i++)
       afterOptimizeFile << x0[i] << " ";
+    budget.write(afterOptimizeFileName+"/budget.txt");
   }
   return 0;
 }
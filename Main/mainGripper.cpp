@@ -6,6 +6,7 @@
 #include <Quasistatic/ConvexLogBarrierSelfEnergy.h>
 #include <Quasistatic/LogBarrierObjEnergy.h>
 #include <Quasistatic/MetricEnergy.h>
+#include <Articulated/PBDArticulatedBatchInfo.h>
 #include <Utils/Utils.h>
 
 USE_PRJ_NAMESPACE
@@ -31,7 +32,7 @@ int main(int argn,char** argc)
   pathIO.replace_extension(".dat");
   GraspPlanner<T> planner;
   if(exists(pathIO.string())) {
-    planner.SerializableBase::read(pathIO.string());
+    planner.readMapped(pathIO.string());
   } else {
     planner.reset(path,1.0f/density);
     if(pathIO.string().find("BarrettHand")!=std::string::npos) {
@@ -53,12 +54,20 @@ int main(int argn,char** argc)
         else return n.dot(Vec3T(0,-1,0))>0.9f;
       });
     }
-    planner.SerializableBase::write(pathIO.string());
+    planner.writeMapped(pathIO.string());
   }
+  //the link pairs that can come within a few sample radii of each other, computed once per gripper
+  if(planner.selfIndex().empty()) {
+    planner.buildSelfIndex(1000,planner.rad()*4);
+    planner.writeMapped(pathIO.string());
+  }
+
+  //batched forward kinematics against PBDArticulatedGradientInfo
+  PBDArticulatedBatchInfo<T>::debug(planner.body(),1000);
 
   //test objective
   PointCloudObject<T> object;
-  object.SerializableBase::read(pathObj);
+  object.readMapped(pathObj);
   Vec x0=Vec::Zero(planner.body().nrDOF());
   if(pathIO.string().find("BarrettHand")!=std::string::npos)
     x0.template segment<3>(0)=Vec3T(0,0,-0.2f);
@@ -81,6 +90,11 @@ int main(int argn,char** argc)
     PBDArticulatedGradientInfo<T> info;
     MetricEnergy<T>(obj,info,planner,object,0,0.1f,10,Q_1,SQR_EXP_ACTIVATION,1).debug(1,0,&x0,true);
   }
+  {
+    DSSQPObjectiveCompound<T> obj;
+    PBDArticulatedGradientInfo<T> info;
+    MetricEnergy<T>(obj,info,planner,object,0,0.1f,10,Q_1,SQR_EXP_ACTIVATION,1,1e-10f).debug(1,0,&x0,true);
+  }
   {
     DSSQPObjectiveCompound<T> obj;
     PBDArticulatedGradientInfo<T> info;
@@ -1,4 +1,5 @@
 #include <Quasistatic/PointCloudObject.h>
+#include <Environment/ObjMeshGeomCellExact.h>
 #include <CommonFile/MakeMesh.h>
 #include <Utils/Utils.h>
 #include <fstream>
@@ -20,7 +21,7 @@ Vec maxRange(const PointCloudObject<T>& q) {
   return x;
 }
 int main(int argn,char** argc) {
-  ASSERT_MSG(argn>=4,"mainPointCloudObject: [ObjMesh path] [radius of disk] [scale] [scaleY]")
+  ASSERT_MSG(argn>=4,"mainPointCloudObject: [ObjMesh path] [radius of disk] [scale] [scaleY] [gij storage: dense/sparse/lowrank] [gij tolerance]")
   std::string path(argc[1]);
   sizeType density=std::atoi(argc[2]);
   T scale=std::atof(argc[3]);
@@ -66,14 +67,25 @@ int main(int argn,char** argc) {
   pathIO.replace_extension(".dat");
   PointCloudObject<T> q;
   if(exists(pathIO.string())) {
-    q.SerializableBase::read(pathIO.string());
+    q.readMapped(pathIO.string());
   } else {
     if(graspable) {
       q.resetGraspable(m,1.0f/density);
     } else {
       q.reset(m,1.0f/density);
     }
-    q.SerializableBase::write(pathIO.string());
+    q.writeMapped(pathIO.string());
+  }
+  //compressed gij: sparse drops the entries below tolerance*max|gij|, lowrank keeps the relative Frobenius error below tolerance
+  if(argn>=6 && graspable) {
+    std::string gijMode(argc[5]);
+    T gijTol=argn>=7?std::atof(argc[6]):0;
+    GijMatrix<T>::MODE mode=gijMode=="sparse"?GijMatrix<T>::SPARSE:gijMode=="lowrank"?GijMatrix<T>::LOW_RANK:GijMatrix<T>::DENSE;
+    //a cached .dat that is already compressed is not compressed again
+    if(mode!=q.gij().mode()) {
+      q.compressGij(mode,gijTol);
+      q.writeMapped(pathIO.string());
+    }
   }
   Vec max = maxRange(q);
   std::cout << max[0] <<" "<< max[1]<<" "<<max[2]<<std::endl;
@@ -84,6 +96,10 @@ int main(int argn,char** argc) {
   file << "\n";
   file<<scale;
   q.debug(10);
+  //the check of the double-precision distance filter against the rational queries is only run on request
+  const char* debugFilter=std::getenv("LIBDIFF_DEBUG_FILTER");
+  if(debugFilter && std::atoi(debugFilter)>0)
+    q.dist().debugFilter(std::atoi(debugFilter));
   pathIO.replace_extension("");
   recreate(pathIO.filename().string());
   q.writeVTK(pathIO.filename().string(),0);
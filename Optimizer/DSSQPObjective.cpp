@@ -1,6 +1,7 @@
 #include <Utils/Scalar.h>
 #include "DSSQPObjective.h"
 #include <CommonFile/Timing.h>
+#include <CommonFile/Profiler.h>
 #include <Utils/DebugGradient.h>
 #include <Utils/Utils.h>
 
@@ -365,8 +366,10 @@ int DSSQPObjectiveCompound<T>::operator()(const Vec& x,Vec& fvec,STrips* fjac)
   fvec.setZero(values());
   if(fjac)
     fjac->clear();
-  for(const std::pair<std::string,std::shared_ptr<DSSQPObjectiveComponent<T>>>& v:_components)
+  for(const std::pair<std::string,std::shared_ptr<DSSQPObjectiveComponent<T>>>& v:_components) {
+    ProfileScope scope(v.second->_name);
     v.second->operator()(x,fvec,fjac);
+  }
   return 0;
 }
 template <typename T>
@@ -1,5 +1,7 @@
 #include "DSSQPObjective.h"
 #include "QCQPSolverQPOASES.h"
+#include <CommonFile/Profiler.h>
+#include <CommonFile/IO.h>
 
 USE_PRJ_NAMESPACE
 
@@ -8,6 +10,7 @@ QCQPSolverQPOASES<T>::QCQPSolverQPOASES() {}
 template <typename T>
 typename QCQPSolver<T>::QCQP_RETURN_CODE QCQPSolverQPOASES<T>::solveQP(Vec& x,const MatT& H,const Vec& g,const MatT* cjac,const Vec* lb,const Vec* ub,const Vec* lbA,const Vec* ubA,const std::vector<Coli,Eigen::aligned_allocator<Coli>>& QCones,bool callback)
 {
+  PROFILE_SCOPE("QCQPSolverQPOASES::solveQP")
   ASSERT_MSG(QCones.empty(),"QPOASES does not support second order cone with QP interface")
   qpOASES::int_t nWSR=10000;
   qpOASES::returnValue ret;
@@ -40,6 +43,10 @@ typename QCQPSolver<T>::QCQP_RETURN_CODE QCQPSolverQPOASES<T>::solveQP(Vec& x,co
     return (scalarD)std::to_double(in);
   });
   if(!_prob.isInitialised() || _prob.getNV()!=x.size() || _prob.getNC()!=(cjac?cjac->rows():0)) {
+    Cold xGuess,yGuess;
+    qpOASES::Bounds bounds;
+    qpOASES::Constraints constraints;
+    bool warm=warmStart(x.size(),cjac?cjac->rows():0,xGuess,yGuess,bounds,constraints);
     _prob=qpOASES::SQProblem(x.size(),cjac?cjac->rows():0);
     ret=_prob.init(Hd.data(),
                    gd.data(),
@@ -48,7 +55,11 @@ typename QCQPSolver<T>::QCQP_RETURN_CODE QCQPSolverQPOASES<T>::solveQP(Vec& x,co
                    ub?ubd.data():NULL,
                    lbA?lbAd.data():NULL,
                    ubA?ubAd.data():NULL,
-                   nWSR);
+                   nWSR,NULL,
+                   warm?xGuess.data():NULL,
+                   warm?yGuess.data():NULL,
+                   warm?&bounds:NULL,
+                   warm?&constraints:NULL);
   } else {
     ret=_prob.hotstart(Hd.data(),
                        gd.data(),
@@ -75,6 +86,7 @@ typename QCQPSolver<T>::QCQP_RETURN_CODE QCQPSolverQPOASES<T>::solveQP(Vec& x,co
 template <typename T>
 typename QCQPSolver<T>::QCQP_RETURN_CODE QCQPSolverQPOASES<T>::solveQP(Vec& x,const SMat& H,const Vec& g,const SMat* cjac,const Vec* lb,const Vec* ub,const Vec* lbA,const Vec* ubA,const std::vector<Coli,Eigen::aligned_allocator<Coli>>& QCones,bool callback)
 {
+  PROFILE_SCOPE("QCQPSolverQPOASES::solveQP")
   ASSERT_MSG(QCones.empty(),"QPOASES does not support second order cone with QP interface")
   qpOASES::int_t nWSR=10000;
   qpOASES::returnValue ret;
@@ -114,6 +126,10 @@ typename QCQPSolver<T>::QCQP_RETURN_CODE QCQPSolverQPOASES<T>::solveQP(Vec& x,co
     return (scalarD)std::to_double(in);
   });
   if(!_prob.isInitialised() || _prob.getNV()!=x.size() || _prob.getNC()!=(cjac?cjac->rows():0)) {
+    Cold xGuess,yGuess;
+    qpOASES::Bounds bounds;
+    qpOASES::Constraints constraints;
+    bool warm=warmStart(x.size(),cjac?cjac->rows():0,xGuess,yGuess,bounds,constraints);
     _prob=qpOASES::SQProblem(x.size(),cjac?cjac->rows():0);
     ret=_prob.init(&HQP,
                    gd.data(),
@@ -122,7 +138,11 @@ typename QCQPSolver<T>::QCQP_RETURN_CODE QCQPSolverQPOASES<T>::solveQP(Vec& x,co
                    ub?ubd.data():NULL,
                    lbA?lbAd.data():NULL,
                    ubA?ubAd.data():NULL,
-                   nWSR);
+                   nWSR,NULL,
+                   warm?xGuess.data():NULL,
+                   warm?yGuess.data():NULL,
+                   warm?&bounds:NULL,
+                   warm?&constraints:NULL);
   } else {
     ret=_prob.hotstart(&HQP,
                        gd.data(),
@@ -158,6 +178,68 @@ typename QCQPSolver<T>::QCQP_RETURN_CODE QCQPSolverQPOASES<T>::solveL1QP(Vec& x,
   FUNCTION_NOT_IMPLEMENTED
   return QCQPSolver<T>::UNKNOWN;
 }
+template <typename T>
+bool QCQPSolverQPOASES<T>::readState(std::istream& is)
+{
+  readBinaryData(_guessBounds,is);
+  readBinaryData(_guessConstraints,is);
+  readBinaryData(_guessX,is);
+  readBinaryData(_guessY,is);
+  _prob=qpOASES::SQProblem();
+  return is.good() && _guessX.size()==_guessBounds.size() && _guessY.size()==_guessBounds.size()+_guessConstraints.size();
+}
+template <typename T>
+bool QCQPSolverQPOASES<T>::writeState(std::ostream& os) const
+{
+  Coli bounds=_guessBounds,constraints=_guessConstraints;
+  Cold x=_guessX,y=_guessY;
+  if(_prob.isInitialised() && _prob.isSolved()) {
+    sizeType nV=_prob.getNV(),nC=_prob.getNC();
+    qpOASES::Bounds b;
+    qpOASES::Constraints c;
+    _prob.getBounds(b);
+    _prob.getConstraints(c);
+    bounds.resize(nV);
+    for(sizeType i=0; i<nV; i++)
+      bounds[i]=b.getStatus(i);
+    constraints.resize(nC);
+    for(sizeType i=0; i<nC; i++)
+      constraints[i]=c.getStatus(i);
+    x.resize(nV);
+    y.resize(nV+nC);
+    _prob.getPrimalSolution(x.data());
+    _prob.getDualSolution(y.data());
+  }
+  writeBinaryData(bounds,os);
+  writeBinaryData(constraints,os);
+  writeBinaryData(x,os);
+  writeBinaryData(y,os);
+  return os.good();
+}
+template <typename T>
+bool QCQPSolverQPOASES<T>::warmStart(sizeType nV,sizeType nC,Cold& x,Cold& y,qpOASES::Bounds& bounds,qpOASES::Constraints& constraints)
+{
+  //the stored working set is used once, by the first QP of the same size
+  bool warm=_guessBounds.size()==nV && _guessConstraints.size()==nC;
+  std::function<qpOASES::SubjectToStatus(sizeType)> status=[&](sizeType s) {
+    return s==qpOASES::ST_LOWER || s==qpOASES::ST_UPPER?(qpOASES::SubjectToStatus)s:qpOASES::ST_INACTIVE;
+  };
+  if(warm) {
+    bounds.init(nV);
+    for(sizeType i=0; i<nV; i++)
+      bounds.setupBound(i,status(_guessBounds[i]));
+    constraints.init(nC);
+    for(sizeType i=0; i<nC; i++)
+      constraints.setupConstraint(i,status(_guessConstraints[i]));
+    x=_guessX;
+    y=_guessY;
+  }
+  _guessBounds.resize(0);
+  _guessConstraints.resize(0);
+  _guessX.resize(0);
+  _guessY.resize(0);
+  return warm;
+}
 //instance
 PRJ_BEGIN
 template struct QCQPSolverQPOASES<double>;
@@ -19,8 +19,15 @@ struct QCQPSolverQPOASES : public QCQPSolver<T>
   //inconsistent QP
   QCQP_RETURN_CODE solveL1QP(Vec& x,const MatT& H,const Vec& g,const MatT* cjac,const Vec* lb,const Vec* ub,const Vec* lbA,const Vec* ubA,T TR,T rho,const std::vector<Coli,Eigen::aligned_allocator<Coli>>& QCones,bool callback=false) override;
   QCQP_RETURN_CODE solveL1QP(Vec& x,const SMat& H,const Vec& g,const SMat* cjac,const Vec* lb,const Vec* ub,const Vec* lbA,const Vec* ubA,T TR,T rho,const std::vector<Coli,Eigen::aligned_allocator<Coli>>& QCones,bool callback=false) override;
+  //the working set and the solution of the last QP, a solver that read them initializes its next QP from them
+  //(qpOASES cannot store its factorizations, so the first QP after reading is not bitwise the same as a hot start)
+  bool readState(std::istream& is);
+  bool writeState(std::ostream& os) const;
 private:
+  bool warmStart(sizeType nV,sizeType nC,Cold& x,Cold& y,qpOASES::Bounds& bounds,qpOASES::Constraints& constraints);
   qpOASES::SQProblem _prob;
+  Coli _guessBounds,_guessConstraints;
+  Cold _guessX,_guessY;
 };
 
 PRJ_END
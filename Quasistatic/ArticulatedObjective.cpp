@@ -86,6 +86,16 @@ void ArticulatedObjective<T>::setUpdateCache(const Vec& x,bool)
     info.reset(_planner.body(),x.segment(0,nDOF));
 }
 template <typename T>
+bool ArticulatedObjective<T>::readState(std::istream& is)
+{
+  return is.good();
+}
+template <typename T>
+bool ArticulatedObjective<T>::writeState(std::ostream& os) const
+{
+  return os.good();
+}
+template <typename T>
 const PBDArticulatedGradientInfo<T>& ArticulatedObjective<T>::info() const
 {
   return _info;
@@ -33,6 +33,10 @@ public:
   virtual T operator()(const Vec& x,Vec* fgrad=NULL,STrips* fhess=NULL) override;
   //whether modifying objective function expression is allowed
   virtual void setUpdateCache(const Vec& x,bool) override;
+  //state kept across SQP iterations (caches, separating planes) for the checkpoints of GraspPlanner::optimizeSQP,
+  //nothing for objectives that only depend on x
+  virtual bool readState(std::istream& is);
+  virtual bool writeState(std::ostream& os) const;
   const PBDArticulatedGradientInfo<T>& info() const;
   PBDArticulatedGradientInfo<T>& info();
   const PointCloudObject<T>& object() const;
@@ -1,9 +1,11 @@
+#include <Utils/Scalar.h>
 #include "ConvexLogBarrierSelfEnergy.h"
 #include <Articulated/MultiPrecisionSeparatingPlane.h>
 #include <Environment/ObjMeshGeomCellExact.h>
 #include <Optimizer/QCQPSolverQPOASES.h>
 #include "GraspPlanner.h"
 #include <Utils/CLog.h>
+#include <CommonFile/Profiler.h>
 #include <stack>
 
 USE_PRJ_NAMESPACE
@@ -32,9 +34,23 @@ int ConvexLogBarrierSelfEnergy<T>::operator()(const Vec&,ParallelMatrix<T>& e,Pa
   const std::vector<Node<std::shared_ptr<StaticGeomCell>,BBox<scalar>>>& bvhHand=_planner.body().getGeom().getBVH();
   std::vector<KDOP18<scalar>> bbs=updateBVH();
   //update plane 
+  ProfileScope scopeBVH("ConvexLogBarrierSelfEnergy::BVH");
+  bool useIndex=!_planner.selfIndex().empty() && !_allPairs;
+  //only the pairs of the planner's self-collision index can ever come close
+  if(_updateCache && useIndex)
+    for(const std::pair<Vec2i,Vec4T>& p:_planner.selfIndex()) {
+      if(!bbs[p.first[0]].intersect(bbs[p.first[1]]))
+        continue;
+      else if(_exclude.find(p.first)!=_exclude.end())
+        continue;
+      else if(_plane.find(p.first)!=_plane.end())
+        continue;
+      else if(!initializePlane(p.first[0],p.first[1],p.second.isZero()?NULL:&p.second))
+        _exclude.insert(p.first);
+    }
   std::stack<std::pair<sizeType,sizeType>> ss;
   ss.push(std::make_pair((sizeType)bvhHand.size()-1,(sizeType)bvhHand.size()-1));
-  while(_updateCache && !ss.empty()) {
+  while(_updateCache && !useIndex && !ss.empty()) {
     sizeType idHand=ss.top().first;
     sizeType idHand2=ss.top().second;
     ss.pop();
@@ -63,12 +79,24 @@ int ConvexLogBarrierSelfEnergy<T>::operator()(const Vec&,ParallelMatrix<T>& e,Pa
       ss.push(std::make_pair(bvhHand[idHand]._r,bvhHand[idHand2]._r));
     }
   }
+  scopeBVH.stop();
   //compute plane gradient
-  std::vector<std::tuple<Vec2i,sizeType,sizeType>> terms;
+  PROFILE_SCOPE("ConvexLogBarrierSelfEnergy::terms")
+  //the terms are summed in the order of the link pairs, not of the hash map, which differs between
+  //a map that grew during the optimization and one restored from a checkpoint
+  std::vector<Vec2i,Eigen::aligned_allocator<Vec2i>> ids;
   for(const std::pair<Vec2i,SeparatingPlane>& sp:_plane)
+    ids.push_back(sp.first);
+  std::sort(ids.begin(),ids.end(),[](const Vec2i& a,const Vec2i& b) {
+    return a[0]<b[0] || (a[0]==b[0] && a[1]<b[1]);
+  });
+  std::vector<std::tuple<Vec2i,sizeType,sizeType>> terms;
+  for(const Vec2i& id:ids) {
+    const SeparatingPlane& sp=_plane.find(id)->second;
     for(sizeType pass=0; pass<2; pass++)
-      for(sizeType pid=0; pid<sp.second._pss[pass].cols(); pid++)
-        terms.push_back(std::make_tuple(sp.first,pass,pid));
+      for(sizeType pid=0; pid<sp._pss[pass].cols(); pid++)
+        terms.push_back(std::make_tuple(id,pass,pid));
+  }
 
   bool valid=true;
   if(std::is_same<T,mpfr::mpreal>::value) {
@@ -84,7 +112,10 @@ int ConvexLogBarrierSelfEnergy<T>::operator()(const Vec&,ParallelMatrix<T>& e,Pa
 template <typename T>
 void ConvexLogBarrierSelfEnergy<T>::updatePlanes()
 {
-  std::vector<std::pair<Vec2i,SeparatingPlane>> pss(_plane.begin(),_plane.end());
+  std::vector<std::pair<Vec2i,SeparatingPlane>> pss;
+  for(const std::pair<Vec2i,SeparatingPlane>& sp:_plane)
+    if(margin(sp.first,sp.second)<_d0)
+      pss.push_back(sp);
   if(std::is_same<T,mpfr::mpreal>::value) {
     for(sizeType i=0; i<(sizeType)pss.size(); i++)
       pss[i].second._plane=updatePlane(pss[i].first,pss[i].second,true);
@@ -93,8 +124,8 @@ void ConvexLogBarrierSelfEnergy<T>::updatePlanes()
     for(sizeType i=0; i<(sizeType)pss.size(); i++)
       pss[i].second._plane=updatePlane(pss[i].first,pss[i].second,false);
   }
-  _plane.clear();
-  _plane.insert(pss.begin(),pss.end());
+  for(const std::pair<Vec2i,SeparatingPlane>& sp:pss)
+    _plane[sp.first]=sp.second;
 }
 template <typename T>
 void ConvexLogBarrierSelfEnergy<T>::setUpdateCache(const Vec& x,bool update)
@@ -103,7 +134,7 @@ void ConvexLogBarrierSelfEnergy<T>::setUpdateCache(const Vec& x,bool update)
   _updateCache=update;
 }
 template <typename T>
-bool ConvexLogBarrierSelfEnergy<T>::initializePlane(sizeType idL,sizeType idR)
+bool ConvexLogBarrierSelfEnergy<T>::initializePlane(sizeType idL,sizeType idR,const Vec4T* planeL)
 {
   SeparatingPlane sp;
   {
@@ -136,20 +167,41 @@ bool ConvexLogBarrierSelfEnergy<T>::initializePlane(sizeType idL,sizeType idR)
     //mR.applyTrans(Vec3::Zero());
     //mR.writeVTK("mR.vtk",true);
   }
+  if(planeL) {
+    //the plane of the self-collision index is stored in the frame of link idL, it is kept as long as it still separates
+    sp._plane.template segment<3>(0)=ROTI(_info._TM,idL)*planeL->template segment<3>(0);
+    sp._plane[3]=(*planeL)[3]-sp._plane.template segment<3>(0).dot(CTRI(_info._TM,idL));
+    if(margin(Vec2i(idL,idR),sp)>0) {
+      _plane[Vec2i(idL,idR)]=sp;
+      return true;
+    }
+  }
+  Mat3XT pssL=ROTI(_info._TM,idL)*sp._pss[0]+CTRI(_info._TM,idL)*Vec::Ones(sp._pss[0].cols()).transpose();
+  Mat3XT pssR=ROTI(_info._TM,idR)*sp._pss[1]+CTRI(_info._TM,idR)*Vec::Ones(sp._pss[1].cols()).transpose();
+  if(!separatingPlane(pssL,pssR,sp._plane)) {
+    _inseparable.insert(Vec2i(idL,idR));
+    return false;
+  }
+  _plane[Vec2i(idL,idR)]=sp;
+  return true;
+}
+template <typename T>
+bool ConvexLogBarrierSelfEnergy<T>::separatingPlane(const Mat3XT& pssL,const Mat3XT& pssR,Vec4T& plane)
+{
   //problem
-  MatT A=MatT::Zero(sp._pss[0].cols()+sp._pss[1].cols(),4);
+  MatT A=MatT::Zero(pssL.cols()+pssR.cols(),4);
   Vec lbA=Vec::Zero(A.rows());
   Vec ubA=Vec::Zero(A.rows());
   sizeType k=0;
   A.col(3).setOnes();
-  for(sizeType i=0; i<sp._pss[0].cols(); i++) {
-    A.template block<1,3>(k,0)=(ROTI(_info._TM,idL)*sp._pss[0].col(i)+CTRI(_info._TM,idL)).transpose();
+  for(sizeType i=0; i<pssL.cols(); i++) {
+    A.template block<1,3>(k,0)=pssL.col(i).transpose();
     lbA[k]=1;
     ubA[k]= DSSQPObjective<T>::infty();
     k++;
   }
-  for(sizeType i=0; i<sp._pss[1].cols(); i++) {
-    A.template block<1,3>(k,0)=(ROTI(_info._TM,idR)*sp._pss[1].col(i)+CTRI(_info._TM,idR)).transpose();
+  for(sizeType i=0; i<pssR.cols(); i++) {
+    A.template block<1,3>(k,0)=pssR.col(i).transpose();
     lbA[k]=-DSSQPObjective<T>::infty();
     ubA[k]=-1;
     k++;
@@ -161,12 +213,62 @@ bool ConvexLogBarrierSelfEnergy<T>::initializePlane(sizeType idL,sizeType idR)
     return false;
   else {
     dwd/=std::sqrt(dwd.template segment<3>(0).squaredNorm());
-    sp._plane=dwd;
-    _plane[Vec2i(idL,idR)]=sp;
+    plane=dwd;
     return true;
   }
 }
 template <typename T>
+bool ConvexLogBarrierSelfEnergy<T>::readState(std::istream& is)
+{
+  sizeType nr;
+  Vec2i id;
+  SeparatingPlane sp;
+  _plane.clear();
+  readBinaryData(nr,is);
+  for(sizeType i=0; i<nr && is.good(); i++) {
+    readBinaryData(id,is);
+    readBinaryData(sp._pss[0],is);
+    readBinaryData(sp._pss[1],is);
+    readBinaryData(sp._plane,is);
+    _plane[id]=sp;
+  }
+  readBinaryData(_exclude,is);
+  readBinaryData(_inseparable,is);
+  return is.good();
+}
+template <typename T>
+bool ConvexLogBarrierSelfEnergy<T>::writeState(std::ostream& os) const
+{
+  writeBinaryData((sizeType)_plane.size(),os);
+  for(const std::pair<Vec2i,SeparatingPlane>& sp:_plane) {
+    writeBinaryData(sp.first,os);
+    writeBinaryData(sp.second._pss[0],os);
+    writeBinaryData(sp.second._pss[1],os);
+    writeBinaryData(sp.second._plane,os);
+  }
+  writeBinaryData(_exclude,os);
+  writeBinaryData(_inseparable,os);
+  return os.good();
+}
+template <typename T>
+const std::unordered_set<Vec2i,Hash>& ConvexLogBarrierSelfEnergy<T>::inseparable() const
+{
+  return _inseparable;
+}
+template <typename T>
+T ConvexLogBarrierSelfEnergy<T>::margin(const Vec2i& linkId,const SeparatingPlane& sp) const
+{
+  T ret=DSSQPObjective<T>::infty();
+  for(sizeType pass=0; pass<2; pass++) {
+    T sgn=pass==0?1:-1;
+    for(sizeType pid=0; pid<sp._pss[pass].cols(); pid++) {
+      Vec3T P=ROTI(_info._TM,linkId[pass])*sp._pss[pass].col(pid)+CTRI(_info._TM,linkId[pass]);
+      ret=std::min<T>(ret,(P.dot(sp._plane.template segment<3>(0))+sp._plane[3])*sgn);
+    }
+  }
+  return ret;
+}
+template <typename T>
 typename ConvexLogBarrierSelfEnergy<T>::Vec4T ConvexLogBarrierSelfEnergy<T>::updatePlane(const Vec2i& linkId,const SeparatingPlane& sp,bool callback) const
 {
   bool succ;
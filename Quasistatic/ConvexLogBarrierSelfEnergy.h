@@ -23,14 +23,22 @@ public:
   };
   ConvexLogBarrierSelfEnergy(DSSQPObjectiveCompound<T>& obj,const PBDArticulatedGradientInfo<T>& info,const GraspPlanner<T>& planner,const PointCloudObject<T>& object,T d0,T mu,bool allPairs=false);
   virtual int operator()(const Vec& x,ParallelMatrix<T>& e,ParallelMatrix<Mat3XT>* g,ParallelMatrix<Mat12XT>* h,Vec* fgrad,STrips* fhess) override;
+  //only the planes of pairs closer than d0, whose barrier is active, are updated
   void updatePlanes();
   virtual void setUpdateCache(const Vec& x,bool update) override;
+  virtual bool readState(std::istream& is) override;
+  virtual bool writeState(std::ostream& os) const override;
+  //plane n^T*x+d (|n|=1) with pssL on the positive and pssR on the negative side, both at distance >=1/|n| before normalization
+  static bool separatingPlane(const Mat3XT& pssL,const Mat3XT& pssR,Vec4T& plane);
+  //link pairs whose convex hulls overlapped when their plane was initialized
+  const std::unordered_set<Vec2i,Hash>& inseparable() const;
 protected:
-  bool initializePlane(sizeType idL,sizeType idR);
+  bool initializePlane(sizeType idL,sizeType idR,const Vec4T* planeL=NULL);
+  T margin(const Vec2i& linkId,const SeparatingPlane& sp) const;
   Vec4T updatePlane(const Vec2i& linkId,const SeparatingPlane& sp,bool callback) const;
   void addTerm(bool& valid,const std::tuple<Vec2i,sizeType,sizeType>& termId,ParallelMatrix<T>& e,ParallelMatrix<Mat3XT>* g,ParallelMatrix<Mat12XT>* h) const;
   std::unordered_map<Vec2i,SeparatingPlane,Hash> _plane;
-  std::unordered_set<Vec2i,Hash> _exclude;
+  std::unordered_set<Vec2i,Hash> _exclude,_inseparable;
   bool _updateCache;
   bool _allPairs;
   T _d0,_mu;
@@ -1,26 +1,14 @@
 #include "FGTTreeNode.h"
 #include <Utils/RotationUtil.h>
 #include <Utils/DebugGradient.h>
+#include <CommonFile/Timing.h>
 
 USE_PRJ_NAMESPACE
 
-template <typename T>
-struct AtomicAdd
-{
-  static void eval(T& A,T B) {
-    OMP_CRITICAL_ {
-      A+=B;
-    }
-  }
-};
-template <>
-struct AtomicAdd<scalarD>
-{
-  static void eval(scalarD& A,scalarD B) {
-    OMP_ATOMIC_
-    A+=B;
-  }
-};
+//y points per partial sum of the taylor coefficients, and x points below which a traversal is not split into tasks,
+//both are fixed so that the result does not depend on the number of threads
+#define TAYLOR_CHUNK 64
+#define TASK_THRES 256
 #define SY_COND (Sy?Sy->coeff(idy):1)
 template <typename T>
 FGTTreeNode<T>::FGTTreeNode() {}
@@ -176,11 +164,28 @@ T FGTTreeNode<T>::distTo(const FGTTreeNode<T>& other) const
   return std::max<T>(_sphere.distTo(other._sphere),_bb.distTo(other._bb));
 }
 template <typename T>
+T FGTTreeNode<T>::motionBound(const Mat3X4T& from,const Mat3X4T& to) const
+{
+  //largest displacement of a point in the local bounding sphere between the two rigid poses
+  Mat3T dR=ROT(to)-ROT(from);
+  return std::sqrt((dR*_spherel._ctr+CTR(to)-CTR(from)).squaredNorm())+std::sqrt(dR.squaredNorm())*_spherel._rad;
+}
+template <typename T>
 sizeType FGTTreeNode<T>::size() const
 {
   return _range[1]-_range[0];
 }
+template <typename T>
+void FGTTreeNode<T>::nodes(std::vector<FGTTreeNode<T>*>& ns)
+{
+  ns.push_back(this);
+  if(_l) {
+    _l->nodes(ns);
+    _r->nodes(ns);
+  }
+}
 //FGT
+#define MEAN_CTR
 template <typename T>
 void FGTTreeNode<T>::closestYNode(const FGTTreeNode<T>** minLeaf,T& minDist,const FGTTreeNode<T>& yNode,const FGTTreeNode<T>& xNode)
 {
@@ -204,8 +209,15 @@ template <typename T>
 void FGTTreeNode<T>::initErrorBound(const Vec* Sy,const Mat3XT& y,const Mat3XT& x,const FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T invHSqr)
 {
   if(xNode._l) {
-    initErrorBound(Sy,y,x,yNode,*(xNode._l),invHSqr);
-    initErrorBound(Sy,y,x,yNode,*(xNode._r),invHSqr);
+    if(xNode.size()>=TASK_THRES) {
+      OMP_TASK_
+      initErrorBound(Sy,y,x,yNode,*(xNode._l),invHSqr);
+      initErrorBound(Sy,y,x,yNode,*(xNode._r),invHSqr);
+      OMP_TASKWAIT_
+    } else {
+      initErrorBound(Sy,y,x,yNode,*(xNode._l),invHSqr);
+      initErrorBound(Sy,y,x,yNode,*(xNode._r),invHSqr);
+    }
     xNode._tildeGMinInit=std::min(xNode._l->_tildeGMinInit,xNode._r->_tildeGMinInit);
     xNode._tildeGMin=0;
     xNode._FtSave=0;
@@ -229,14 +241,116 @@ void FGTTreeNode<T>::FGT(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const
 {
   if(profile)
     profile->setZero();
-  initErrorBound(Sy,y,x,yNode,xNode,invHSqr);
-  contrib(G,DGDT,Sy,y,yl,x,yNode,xNode,yNode._Fs,invHSqr,eps,profile);
+  //the x subtrees are traversed as tasks, leaf loops run serially inside them
+  OMP_PARALLEL_
+  {
+    OMP_SINGLE_
+    {
+      initErrorBound(Sy,y,x,yNode,xNode,invHSqr);
+      contrib(G,DGDT,Sy,y,yl,x,yNode,xNode,yNode._Fs,invHSqr,eps,profile);
+    }
+  }
 }
 template <typename T>
-void FGTTreeNode<T>::contrib(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T F,T invHSqr,T eps,Vec3i* profile)
+void FGTTreeNode<T>::FGTIncremental(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T invHSqr,T eps,std::vector<FGTInteraction<T>>& interactions,Vec3i* profile)
+{
+  if(profile)
+    profile->setZero();
+  std::vector<FGTInteraction<T>> last;
+  last.swap(interactions);
+  if(last.empty()) {
+    OMP_PARALLEL_
+    {
+      OMP_SINGLE_
+      {
+        initErrorBound(Sy,y,x,yNode,xNode,invHSqr);
+        contrib(G,DGDT,Sy,y,yl,x,yNode,xNode,yNode._Fs,invHSqr,eps,profile,&interactions);
+      }
+    }
+    return;
+  }
+  OMP_PARALLEL_
+  {
+    OMP_SINGLE_
+    initErrorBound(Sy,y,x,yNode,xNode,invHSqr);
+  }
+  //pairs whose x nodes overlap are replayed in the order of the last traversal, so that the error bounds evolve as in contrib,
+  //groups of pairs with disjoint x ranges touch disjoint parts of G, DGDT and the x tree and are replayed concurrently
+  std::vector<sizeType> order(last.size()),group(last.size());
+  for(sizeType i=0; i<(sizeType)last.size(); i++)
+    order[i]=i;
+  std::sort(order.begin(),order.end(),[&](sizeType a,sizeType b) {
+    return last[a]._x->_range[0]<last[b]._x->_range[0];
+  });
+  sizeType nrGroup=0,end=-1;
+  for(sizeType i:order) {
+    if(last[i]._x->_range[0]>=end)
+      nrGroup++;
+    end=std::max<sizeType>(end,last[i]._x->_range[1]);
+    group[i]=nrGroup-1;
+  }
+  std::vector<std::vector<FGTInteraction<T>>> groupLast(nrGroup),groupRecord(nrGroup);
+  std::vector<Vec3i,Eigen::aligned_allocator<Vec3i>> groupProfile(nrGroup,Vec3i::Zero());
+  for(sizeType i=0; i<(sizeType)last.size(); i++)
+    groupLast[group[i]].push_back(last[i]);
+  OMP_PARALLEL_FOR_DYNAMIC_X(OmpSettings::getOmpSettings().nrThreads())
+  for(sizeType g=0; g<nrGroup; g++)
+    for(const FGTInteraction<T>& I:groupLast[g])
+      replay(G,DGDT,Sy,y,yl,x,I,yNode._Fs,invHSqr,eps,profile?&groupProfile[g]:NULL,groupRecord[g]);
+  for(sizeType g=0; g<nrGroup; g++) {
+    interactions.insert(interactions.end(),groupRecord[g].begin(),groupRecord[g].end());
+    if(profile)
+      *profile+=groupProfile[g];
+  }
+}
+template <typename T>
+void FGTTreeNode<T>::replay(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const FGTInteraction<T>& I,T F,T invHSqr,T eps,Vec3i* profile,std::vector<FGTInteraction<T>>& record)
+{
+  //a mean pair that violates its bound at the new configuration is traversed again from that pair
+  Vec2T minMax;
+  sizeType p;
+  FGTTreeNode<T>& yNode=*(I._y);
+  FGTTreeNode<T>& xNode=*(I._x);
+  T errBound=eps*std::max(xNode._tildeGMin,xNode._tildeGMinInit)*(yNode._Fs+xNode._FtSave)/F;
+  if(I._type==FGTInteraction<T>::MEAN) {
+#ifdef MEAN_CTR
+    T errMean=errorMeanCtr(yNode,xNode,minMax,invHSqr);
+#else
+    T errMean=errorMean(yNode,xNode,minMax,invHSqr);
+#endif
+    if(errMean<errBound) {
+#ifdef MEAN_CTR
+      meanCtr(G,DGDT,yNode,xNode,F,invHSqr,errMean,eps);
+#else
+      mean(G,DGDT,yNode,xNode,minMax,F,invHSqr,errMean,eps);
+#endif
+      record.push_back(I);
+      if(profile)
+        profile->coeffRef(0)++;
+    } else contrib(G,DGDT,Sy,y,yl,x,yNode,xNode,F,invHSqr,eps,profile,&record);
+  } else if(I._type==FGTInteraction<T>::DIRECT) {
+    directMixed(G,DGDT,Sy,y,yl,x,yNode,xNode,F,invHSqr,errBound,eps);
+    record.push_back(I);
+    if(profile)
+      profile->coeffRef(1)++;
+  } else {
+    //the expansion order is chosen again for the current error bound, a pair whose order reaches the cap
+    //or whose expansion now costs more than direct evaluation or its children is traversed again from that pair
+    sizeType cTaylor=costTaylor(yNode,xNode,p,invHSqr,errBound);
+    if(p>100 || costDirect(yNode,xNode)<=cTaylor || costChildren(yNode,xNode,invHSqr,errBound)<=cTaylor)
+      contrib(G,DGDT,Sy,y,yl,x,yNode,xNode,F,invHSqr,eps,profile,&record);
+    else {
+      taylorBatch(G,DGDT,Sy,y,yl,x,yNode,xNode,invHSqr,p);
+      record.push_back(I);
+      if(profile)
+        profile->coeffRef(2)++;
+    }
+  }
+}
+template <typename T>
+void FGTTreeNode<T>::contrib(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T F,T invHSqr,T eps,Vec3i* profile,std::vector<FGTInteraction<T>>* record)
 {
   Vec2T minMax;
-#define MEAN_CTR
 #ifdef MEAN_CTR
   T errMean=errorMeanCtr(yNode,xNode,minMax,invHSqr);
 #else
@@ -249,11 +363,15 @@ void FGTTreeNode<T>::contrib(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,c
 #else
     mean(G,DGDT,yNode,xNode,minMax,F,invHSqr,errMean,eps);
 #endif
+    if(record)
+      record->push_back(FGTInteraction<T> {&yNode,&xNode,FGTInteraction<T>::MEAN});
     if(profile)
       profile->coeffRef(0)++;
   } else {
     if(!yNode._l || !xNode._l) {
-      direct(G,DGDT,Sy,y,yl,x,yNode,xNode,invHSqr);
+      directMixed(G,DGDT,Sy,y,yl,x,yNode,xNode,F,invHSqr,errBound,eps);
+      if(record)
+        record->push_back(FGTInteraction<T> {&yNode,&xNode,FGTInteraction<T>::DIRECT});
       if(profile)
         profile->coeffRef(1)++;
     } else {
@@ -261,12 +379,33 @@ void FGTTreeNode<T>::contrib(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,c
       sizeType cDirect=costDirect(yNode,xNode);
       sizeType cTaylor=costTaylor(yNode,xNode,p,invHSqr,errBound);
       if(cDirect<=cTaylor || costChildren(yNode,xNode,invHSqr,errBound)<=cTaylor) {
-        contrib(G,DGDT,Sy,y,yl,x,*(yNode._l),*(xNode._l),F,invHSqr,eps,profile);
-        contrib(G,DGDT,Sy,y,yl,x,*(yNode._r),*(xNode._l),F,invHSqr,eps,profile);
-        contrib(G,DGDT,Sy,y,yl,x,*(yNode._l),*(xNode._r),F,invHSqr,eps,profile);
-        contrib(G,DGDT,Sy,y,yl,x,*(yNode._r),*(xNode._r),F,invHSqr,eps,profile);
+        if(xNode.size()>=TASK_THRES) {
+          //the pairs of the two x children touch disjoint parts of G, DGDT and the x tree,
+          //the right ones are recorded separately and appended after the left ones as in the serial order
+          Vec3i profileR=Vec3i::Zero();
+          std::vector<FGTInteraction<T>> recordR;
+          OMP_TASK_
+          {
+            contrib(G,DGDT,Sy,y,yl,x,*(yNode._l),*(xNode._l),F,invHSqr,eps,profile,record);
+            contrib(G,DGDT,Sy,y,yl,x,*(yNode._r),*(xNode._l),F,invHSqr,eps,profile,record);
+          }
+          contrib(G,DGDT,Sy,y,yl,x,*(yNode._l),*(xNode._r),F,invHSqr,eps,profile?&profileR:NULL,record?&recordR:NULL);
+          contrib(G,DGDT,Sy,y,yl,x,*(yNode._r),*(xNode._r),F,invHSqr,eps,profile?&profileR:NULL,record?&recordR:NULL);
+          OMP_TASKWAIT_
+          if(profile)
+            *profile+=profileR;
+          if(record)
+            record->insert(record->end(),recordR.begin(),recordR.end());
+        } else {
+          contrib(G,DGDT,Sy,y,yl,x,*(yNode._l),*(xNode._l),F,invHSqr,eps,profile,record);
+          contrib(G,DGDT,Sy,y,yl,x,*(yNode._r),*(xNode._l),F,invHSqr,eps,profile,record);
+          contrib(G,DGDT,Sy,y,yl,x,*(yNode._l),*(xNode._r),F,invHSqr,eps,profile,record);
+          contrib(G,DGDT,Sy,y,yl,x,*(yNode._r),*(xNode._r),F,invHSqr,eps,profile,record);
+        }
       } else {
-        taylor(G,DGDT,Sy,y,yl,x,yNode,xNode,invHSqr,p);
+        taylorBatch(G,DGDT,Sy,y,yl,x,yNode,xNode,invHSqr,p);
+        if(record)
+          record->push_back(FGTInteraction<T> {&yNode,&xNode,FGTInteraction<T>::TAYLOR});
         if(profile)
           profile->coeffRef(2)++;
       }
@@ -365,6 +504,102 @@ void FGTTreeNode<T>::direct(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,co
   xNode._tildeGMin=G.segment(xNode._range[0],xNode.size()).minCoeff();
   xNode._FtSave+=yNode._Fs;
 }
+//exp of a vector, vectorized by Eigen for float and double
+template <typename S>
+void FGTExp(Eigen::Matrix<S,-1,1>& v) {
+  for(sizeType i=0; i<v.size(); i++)
+    v[i]=std::exp(v[i]);
+}
+void FGTExp(Eigen::Matrix<float,-1,1>& v) {
+  v.array()=v.array().exp();
+}
+void FGTExp(Eigen::Matrix<double,-1,1>& v) {
+  v.array()=v.array().exp();
+}
+//batched direct kernel: the y points of a node pair are evaluated per x point as one array expression in precision S,
+//coordinates are centered at the x sphere in T before they are rounded to S
+template <typename T,typename S>
+struct FGTDirectKernel
+{
+  DECL_MAP_TYPES_T
+  typedef Eigen::Matrix<S,-1,1> VecS;
+  typedef Eigen::Matrix<S,3,-1> Mat3XS;
+  typedef Eigen::Matrix<S,-1,4> MatX4S;
+  static void eval(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const Vec2i& yRange,const Vec2i& xRange,const Vec3T& ctr,T invHSqr) {
+    sizeType ny=yRange[1]-yRange[0];
+    Mat3XS yc=(y.middleCols(yRange[0],ny).colwise()-ctr).template cast<S>();
+    VecS sy=Sy?VecS(Sy->segment(yRange[0],ny).template cast<S>()):VecS(VecS::Ones(ny));
+    MatX4S ylH;
+    if(DGDT) {
+      ylH.resize(ny,4);
+      ylH.template leftCols<3>()=yl->middleCols(yRange[0],ny).transpose().template cast<S>();
+      ylH.col(3).setOnes();
+    }
+    S invHSqrS=S(invHSqr);
+    Mat3XS dir;
+    VecS coef;
+    OMP_PARALLEL_FOR_I(OMP_PRI(dir,coef))
+    for(sizeType idx=xRange[0]; idx<xRange[1]; idx++) {
+      dir=yc.colwise()-(x.col(idx)-ctr).template cast<S>();
+      coef=dir.colwise().squaredNorm().transpose()*-invHSqrS;
+      FGTExp(coef);
+      coef.array()*=sy.array();
+      G[idx]+=T(coef.sum());
+      if(DGDT)
+        DGDT->template block<3,4>(idx*3,0)-=((dir*coef.asDiagonal())*ylH*(invHSqrS*2)).template cast<T>();
+    }
+  }
+};
+//single precision is only offered for double, the other types evaluate the batched kernel in their own precision
+template <typename T>
+struct FGTDirectDispatch
+{
+  DECL_MAP_TYPES_T
+  static void eval(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const Vec2i& yRange,const Vec2i& xRange,const Vec3T& ctr,T invHSqr,bool) {
+    FGTDirectKernel<T,T>::eval(G,DGDT,Sy,y,yl,x,yRange,xRange,ctr,invHSqr);
+  }
+};
+template <>
+struct FGTDirectDispatch<double>
+{
+  typedef double T;
+  DECL_MAP_TYPES_T
+  static void eval(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const Vec2i& yRange,const Vec2i& xRange,const Vec3T& ctr,T invHSqr,bool single) {
+    if(single)
+      FGTDirectKernel<T,float>::eval(G,DGDT,Sy,y,yl,x,yRange,xRange,ctr,invHSqr);
+    else FGTDirectKernel<T,T>::eval(G,DGDT,Sy,y,yl,x,yRange,xRange,ctr,invHSqr);
+  }
+};
+template <typename T>
+void FGTTreeNode<T>::directBatch(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T invHSqr,bool single)
+{
+  FGTDirectDispatch<T>::eval(G,DGDT,Sy,y,yl,x,yNode._range,xNode._range,xNode._sphere._ctr,invHSqr,single);
+  xNode._tildeGMin=G.segment(xNode._range[0],xNode.size()).minCoeff();
+  xNode._FtSave+=yNode._Fs;
+}
+template <typename T>
+void FGTTreeNode<T>::directMixed(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T F,T invHSqr,T errBound,T eps)
+{
+  //the rounding error of single precision is charged to the error budget like the error of mean
+  T errSingle=errorDirectSingle(yNode,xNode,invHSqr);
+  bool single=errSingle<errBound;
+  directBatch(G,DGDT,Sy,y,yl,x,yNode,xNode,invHSqr,single);
+  if(single)
+    xNode._FtSave-=errSingle*F/(eps*std::max(xNode._tildeGMin,xNode._tildeGMinInit));
+}
+template <typename T>
+T FGTTreeNode<T>::errorDirectSingle(const FGTTreeNode<T>& yNode,const FGTTreeNode<T>& xNode,T invHSqr)
+{
+  if(!std::is_same<T,double>::value)
+    return ScalarUtil<T>::scalar_max();
+  //relative error of a term: rounding of the centered coordinates and of the squared distance amplified by the exponent A,
+  //a few ulps of exp and of the product with Sy, plus the error of summing ny terms, and the terms that underflow
+  T u=T(std::numeric_limits<float>::epsilon()/2);
+  T dMin=yNode.distTo(xNode);
+  T dMax=std::sqrt((yNode._sphere._ctr-xNode._sphere._ctr).squaredNorm())+yNode._sphere._rad+xNode._sphere._rad;
+  T A=std::min<T>(dMax*dMax*invHSqr,88);
+  return u*(yNode.size()+4*A+8)*yNode._Fs*std::exp(-dMin*dMin*invHSqr)+yNode._Fs*T(std::numeric_limits<float>::min());
+}
 template <typename T>
 sizeType FGTTreeNode<T>::costDirect(const FGTTreeNode<T>& yNode,const FGTTreeNode<T>& xNode)
 {
@@ -384,41 +619,60 @@ void FGTTreeNode<T>::taylor(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,co
   sizeType pSqr=p*p;
   T invH=std::sqrt(invHSqr);
 
-  //build M
-  Vec M[4];
-  MatX4T DMDT;
-  M[3].setZero(p*p*p);
-  if(DGDT) {
-    M[0]=M[1]=M[2]=M[3];
-    DMDT.setZero(3*p*p*p,4);
-  }
+  //build M, one partial sum per chunk of y points, summed in order
+  sizeType nrChunk=(yNode.size()+TAYLOR_CHUNK-1)/TAYLOR_CHUNK;
+  std::vector<Vec> MChunk(nrChunk*4);
+  std::vector<MatX4T,Eigen::aligned_allocator<MatX4T>> DMDTChunk(nrChunk);
   OMP_PARALLEL_FOR_
-  for(sizeType idy=yNode._range[0]; idy<yNode._range[1]; idy++) {
-    //build coef
-    Vec4T ylH=Vec4T((*yl)(0,idy),(*yl)(1,idy),(*yl)(2,idy),1);
-    T coef=SY_COND*std::exp(-(y.col(idy)-yNode._sphere._ctr).squaredNorm()*invHSqr);
-    coef*=std::exp(2*(y.col(idy)-yNode._sphere._ctr).dot(xNode._sphere._ctr-yNode._sphere._ctr)*invHSqr);
-    //build cache
-    Mat3XT cache;
-    cache.setOnes(3,p);
-    Vec3T dy=(y.col(idy)-yNode._sphere._ctr)*invH;
-    for(sizeType i=1; i<p; i++)
-      cache.col(i).array()=cache.col(i-1).array()*dy.array()*2/i;
-    dy=(y.col(idy)-xNode._sphere._ctr)*(-2*invHSqr);
-    //accumulate M
-    for(sizeType a0=0,off0=0; a0<p; a0++,off0+=pSqr)
-      for(sizeType a1=0,off1=off0; a0+a1<p; a1++,off1+=p)
-        for(sizeType a2=0,off2=off1; a0+a1+a2<p; a2++,off2++) {
-          T coefCache=cache(0,a0)*cache(1,a1)*cache(2,a2)*coef;
-          if(DGDT) {
-            for(sizeType r=0,offr=off2*3; r<3; r++,offr++) {
-              AtomicAdd<T>::eval(M[r][off2],ylH[r]*coefCache);
-              for(sizeType c=0; c<4; c++)
-                AtomicAdd<T>::eval(DMDT(offr,c),dy[r]*ylH[c]*coefCache);
+  for(sizeType chunk=0; chunk<nrChunk; chunk++) {
+    Vec* M=&MChunk[chunk*4];
+    MatX4T& DMDT=DMDTChunk[chunk];
+    M[3].setZero(p*p*p);
+    if(DGDT) {
+      M[0]=M[1]=M[2]=M[3];
+      DMDT.setZero(3*p*p*p,4);
+    }
+    sizeType idyEnd=std::min<sizeType>(yNode._range[0]+(chunk+1)*TAYLOR_CHUNK,yNode._range[1]);
+    for(sizeType idy=yNode._range[0]+chunk*TAYLOR_CHUNK; idy<idyEnd; idy++) {
+      //build coef
+      Vec4T ylH=Vec4T((*yl)(0,idy),(*yl)(1,idy),(*yl)(2,idy),1);
+      T coef=SY_COND*std::exp(-(y.col(idy)-yNode._sphere._ctr).squaredNorm()*invHSqr);
+      coef*=std::exp(2*(y.col(idy)-yNode._sphere._ctr).dot(xNode._sphere._ctr-yNode._sphere._ctr)*invHSqr);
+      //build cache
+      Mat3XT cache;
+      cache.setOnes(3,p);
+      Vec3T dy=(y.col(idy)-yNode._sphere._ctr)*invH;
+      for(sizeType i=1; i<p; i++)
+        cache.col(i).array()=cache.col(i-1).array()*dy.array()*2/i;
+      dy=(y.col(idy)-xNode._sphere._ctr)*(-2*invHSqr);
+      //accumulate M
+      for(sizeType a0=0,off0=0; a0<p; a0++,off0+=pSqr)
+        for(sizeType a1=0,off1=off0; a0+a1<p; a1++,off1+=p)
+          for(sizeType a2=0,off2=off1; a0+a1+a2<p; a2++,off2++) {
+            T coefCache=cache(0,a0)*cache(1,a1)*cache(2,a2)*coef;
+            if(DGDT) {
+              for(sizeType r=0,offr=off2*3; r<3; r++,offr++) {
+                M[r][off2]+=ylH[r]*coefCache;
+                for(sizeType c=0; c<4; c++)
+                  DMDT(offr,c)+=dy[r]*ylH[c]*coefCache;
+              }
             }
+            M[3][off2]+=coefCache;
           }
-          AtomicAdd<T>::eval(M[3][off2],coefCache);
-        }
+    }
+  }
+  Vec M[4];
+  MatX4T DMDT;
+  for(sizeType d=0; d<4; d++)
+    M[d].swap(MChunk[d]);
+  DMDT.swap(DMDTChunk[0]);
+  for(sizeType chunk=1; chunk<nrChunk; chunk++) {
+    M[3]+=MChunk[chunk*4+3];
+    if(DGDT) {
+      for(sizeType d=0; d<3; d++)
+        M[d]+=MChunk[chunk*4+d];
+      DMDT+=DMDTChunk[chunk];
+    }
   }
 
   //use M
@@ -452,6 +706,86 @@ void FGTTreeNode<T>::taylor(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,co
   xNode._tildeGMin=G.segment(xNode._range[0],xNode.size()).minCoeff();
 }
 template <typename T>
+void FGTTreeNode<T>::taylorBatch(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T invHSqr,sizeType p)
+{
+  //same expansion as taylor, the monomials of a chunk of points are stored as the columns of a matrix,
+  //so that M and its use become matrix products over the K multi-indices a0+a1+a2<p
+  std::vector<Vec3i,Eigen::aligned_allocator<Vec3i>> as;
+  for(sizeType a0=0; a0<p; a0++)
+    for(sizeType a1=0; a0+a1<p; a1++)
+      for(sizeType a2=0; a0+a1+a2<p; a2++)
+        as.push_back(Vec3i(a0,a1,a2));
+  sizeType K=(sizeType)as.size(),nrCol=DGDT?16:4;
+  T invH=std::sqrt(invHSqr);
+  const Vec3T& yCtr=yNode._sphere._ctr;
+  const Vec3T& xCtr=xNode._sphere._ctr;
+
+  //build M=[M0 M1 M2 M3 DMDT] as a Kx16 matrix, DMDT(k,4+r*4+c) is DMDT(k*3+r,c) of taylor,
+  //one partial sum per chunk of y points, summed in order
+  sizeType nrChunk=(yNode.size()+TAYLOR_CHUNK-1)/TAYLOR_CHUNK;
+  std::vector<MatT,Eigen::aligned_allocator<MatT>> MChunk(nrChunk);
+  OMP_PARALLEL_FOR_
+  for(sizeType chunk=0; chunk<nrChunk; chunk++) {
+    sizeType idyBeg=yNode._range[0]+chunk*TAYLOR_CHUNK;
+    sizeType n=std::min<sizeType>(idyBeg+TAYLOR_CHUNK,yNode._range[1])-idyBeg;
+    MatT mono(K,n),W=MatT::Zero(n,nrCol);
+    Mat3XT cache;
+    cache.setOnes(3,p);
+    for(sizeType j=0,idy=idyBeg; j<n; j++,idy++) {
+      T coef=SY_COND*std::exp(-(y.col(idy)-yCtr).squaredNorm()*invHSqr);
+      coef*=std::exp(2*(y.col(idy)-yCtr).dot(xCtr-yCtr)*invHSqr);
+      Vec3T dy=(y.col(idy)-yCtr)*invH;
+      for(sizeType i=1; i<p; i++)
+        cache.col(i).array()=cache.col(i-1).array()*dy.array()*2/i;
+      for(sizeType k=0; k<K; k++)
+        mono(k,j)=cache(0,as[k][0])*cache(1,as[k][1])*cache(2,as[k][2])*coef;
+      W(j,3)=1;
+      if(DGDT) {
+        Vec4T ylH=Vec4T((*yl)(0,idy),(*yl)(1,idy),(*yl)(2,idy),1);
+        dy=(y.col(idy)-xCtr)*(-2*invHSqr);
+        W.block(j,0,1,4)=ylH.transpose();
+        for(sizeType r=0; r<3; r++)
+          W.block(j,4+r*4,1,4)=ylH.transpose()*dy[r];
+      }
+    }
+    MChunk[chunk]=mono*W;
+  }
+  MatT M;
+  M.swap(MChunk[0]);
+  for(sizeType chunk=1; chunk<nrChunk; chunk++)
+    M+=MChunk[chunk];
+
+  //use M, each chunk of x points is one product of its monomials with M
+  nrChunk=(xNode.size()+TAYLOR_CHUNK-1)/TAYLOR_CHUNK;
+  OMP_PARALLEL_FOR_
+  for(sizeType chunk=0; chunk<nrChunk; chunk++) {
+    sizeType idxBeg=xNode._range[0]+chunk*TAYLOR_CHUNK;
+    sizeType n=std::min<sizeType>(idxBeg+TAYLOR_CHUNK,xNode._range[1])-idxBeg;
+    MatT mono(K,n),P;
+    Mat3XT cache;
+    cache.setOnes(3,p);
+    for(sizeType j=0,idx=idxBeg; j<n; j++,idx++) {
+      T coef=std::exp(-(x.col(idx)-yCtr).squaredNorm()*invHSqr);
+      Vec3T dx=(x.col(idx)-xCtr)*invH;
+      for(sizeType i=1; i<p; i++)
+        cache.col(i).array()=cache.col(i-1).array()*dx.array();
+      for(sizeType k=0; k<K; k++)
+        mono(k,j)=cache(0,as[k][0])*cache(1,as[k][1])*cache(2,as[k][2])*coef;
+    }
+    P=mono.transpose()*M;
+    G.segment(idxBeg,n)+=P.col(3);
+    if(DGDT)
+      for(sizeType j=0,idx=idxBeg; j<n; j++,idx++) {
+        Vec3T dx=(x.col(idx)-xCtr)*(2*invHSqr);
+        Eigen::Block<MatX4T,3,4> blk=DGDT->template block<3,4>(idx*3,0);
+        blk+=dx*P.block(j,0,1,4);
+        for(sizeType r=0; r<3; r++)
+          blk.row(r)+=P.block(j,4+r*4,1,4);
+      }
+  }
+  xNode._tildeGMin=G.segment(xNode._range[0],xNode.size()).minCoeff();
+}
+template <typename T>
 sizeType FGTTreeNode<T>::costTaylor(const FGTTreeNode<T>& yNode,const FGTTreeNode<T>& xNode,sizeType& p,T invHSqr,T errBound)
 {
   T radSum=yNode._sphere._rad+xNode._sphere._rad;
@@ -566,6 +900,86 @@ void FGTTreeNode<T>::debugFGT(sizeType N,sizeType leafThres,bool random,T invHSq
   INFOV("#mean=%d #direct=%d #taylor=%d",profile[0],profile[1],profile[2])
 }
 template <typename T>
+void FGTTreeNode<T>::debugFGTIncremental(sizeType N,sizeType leafThres,bool random,T invHSqr,T eps,bool useSy) {
+  Vec Sy;
+  Mat3XT y,x,yl;
+  FGTTreeNode<T> yNode,xNode;
+  randomTree(useSy?&Sy:NULL,y,yl,x,yNode,xNode,N,leafThres,random);
+  std::string strSy=useSy?"-Sy":"";
+
+  //record the node pairs at the rest pose, then replay them after a small rigid motion
+  Vec3i profile;
+  std::vector<FGTInteraction<T>> interactions;
+  Vec GIncremental=Vec::Zero(x.cols());
+  MatX4T DGDTIncremental=MatX4T::Zero(3*x.cols(),4);
+  FGTIncremental(GIncremental,&DGDTIncremental,useSy?&Sy:NULL,y,&yl,x,yNode,xNode,invHSqr,eps,interactions);
+
+  Mat3T R=expWGradV<T,Vec3T>(Vec3T::Random()*0.05f);
+  Vec3T t=Vec3T::Random()*0.05f;
+  y=R*yl+t*Vec::Ones(yl.cols()).transpose();
+  yNode.transform(R,t,y,true);
+  Vec GDirect=Vec::Zero(x.cols());
+  MatX4T DGDTDirect=MatX4T::Zero(3*x.cols(),4);
+  direct(GDirect,&DGDTDirect,useSy?&Sy:NULL,y,&yl,x,yNode,xNode,invHSqr);
+  GIncremental.setZero();
+  DGDTIncremental.setZero();
+  FGTIncremental(GIncremental,&DGDTIncremental,useSy?&Sy:NULL,y,&yl,x,yNode,xNode,invHSqr,eps,interactions,&profile);
+
+  DEFINE_NUMERIC_DELTA_T(T)
+  DEBUG_GRADIENT("FGTIncremental-G"+strSy,std::sqrt(GDirect.squaredNorm()),std::sqrt((GDirect-GIncremental).squaredNorm()))
+  DEBUG_GRADIENT("FGTIncremental-DGDT"+strSy,std::sqrt(DGDTDirect.squaredNorm()),std::sqrt((DGDTDirect-DGDTIncremental).squaredNorm()))
+  INFOV("#mean=%d #direct=%d #taylor=%d #interactions=%d",profile[0],profile[1],profile[2],(sizeType)interactions.size())
+}
+template <typename T>
+void FGTTreeNode<T>::debugKernels(sizeType N,sizeType leafThres,bool random,T invHSqr,T eps,bool useSy) {
+  Vec Sy;
+  Mat3XT y,x,yl;
+  FGTTreeNode<T> yNode,xNode;
+  randomTree(useSy?&Sy:NULL,y,yl,x,yNode,xNode,N,leafThres,random);
+  std::string strSy=useSy?"-Sy":"";
+
+  //the reference kernels against the batched ones on the root pair
+  DEFINE_NUMERIC_DELTA_T(T)
+  Vec GRef[2],GBatch[3];
+  MatX4T DGDTRef[2],DGDTBatch[3];
+  scalarD tRef[2],tBatch[3];
+  for(sizeType i=0; i<2; i++) {
+    GRef[i]=Vec::Zero(x.cols());
+    DGDTRef[i]=MatX4T::Zero(3*x.cols(),4);
+  }
+  for(sizeType i=0; i<3; i++) {
+    GBatch[i]=Vec::Zero(x.cols());
+    DGDTBatch[i]=MatX4T::Zero(3*x.cols(),4);
+  }
+  sizeType p;
+  costTaylor(yNode,xNode,p,invHSqr,eps);
+  TBEG();
+  direct(GRef[0],&DGDTRef[0],useSy?&Sy:NULL,y,&yl,x,yNode,xNode,invHSqr);
+  tRef[0]=TENDV();
+  TBEG();
+  directBatch(GBatch[0],&DGDTBatch[0],useSy?&Sy:NULL,y,&yl,x,yNode,xNode,invHSqr,false);
+  tBatch[0]=TENDV();
+  TBEG();
+  directBatch(GBatch[1],&DGDTBatch[1],useSy?&Sy:NULL,y,&yl,x,yNode,xNode,invHSqr,true);
+  tBatch[1]=TENDV();
+  TBEG();
+  taylor(GRef[1],&DGDTRef[1],useSy?&Sy:NULL,y,&yl,x,yNode,xNode,invHSqr,p);
+  tRef[1]=TENDV();
+  TBEG();
+  taylorBatch(GBatch[2],&DGDTBatch[2],useSy?&Sy:NULL,y,&yl,x,yNode,xNode,invHSqr,p);
+  tBatch[2]=TENDV();
+  DEBUG_GRADIENT("DirectBatch-G"+strSy,std::sqrt(GRef[0].squaredNorm()),std::sqrt((GRef[0]-GBatch[0]).squaredNorm()))
+  DEBUG_GRADIENT("DirectBatch-DGDT"+strSy,std::sqrt(DGDTRef[0].squaredNorm()),std::sqrt((DGDTRef[0]-DGDTBatch[0]).squaredNorm()))
+  DEBUG_GRADIENT("TaylorBatch-G"+strSy,std::sqrt(GRef[1].squaredNorm()),std::sqrt((GRef[1]-GBatch[2]).squaredNorm()))
+  DEBUG_GRADIENT("TaylorBatch-DGDT"+strSy,std::sqrt(DGDTRef[1].squaredNorm()),std::sqrt((DGDTRef[1]-DGDTBatch[2]).squaredNorm()))
+  //the single precision error has to stay below its a priori bound
+  T errSingle=(GRef[0]-GBatch[1]).cwiseAbs().maxCoeff();
+  INFOV("DirectSingle-G%s: err=%g bound=%g relDGDT=%g",strSy.c_str(),std::to_double(errSingle),std::to_double(errorDirectSingle(yNode,xNode,invHSqr)),
+        std::to_double(std::sqrt((DGDTRef[0]-DGDTBatch[1]).squaredNorm()/DGDTRef[0].squaredNorm())))
+  INFOV("direct: %fs batch: %fs (%fx) single: %fs (%fx)",tRef[0],tBatch[0],tRef[0]/tBatch[0],tBatch[1],tRef[0]/tBatch[1])
+  INFOV("taylor(p=%d): %fs batch: %fs (%fx)",p,tRef[1],tBatch[2],tRef[1]/tBatch[2])
+}
+template <typename T>
 void FGTTreeNode<T>::debugTree(sizeType N,sizeType leafThres,bool random,bool useSy) {
   Vec Sy;
   Mat3XT y,x,yl;
@@ -8,6 +8,17 @@ PRJ_BEGIN
 
 #include <Utils/MapTypePragma.h>
 template <typename T>
+struct FGTTreeNode;
+//a node pair evaluated by FGTTreeNode::contrib, replayed by the next FGTTreeNode::FGTIncremental
+template <typename T>
+struct FGTInteraction
+{
+  enum TYPE {MEAN,DIRECT,TAYLOR};
+  FGTTreeNode<T>* _y;
+  FGTTreeNode<T>* _x;
+  TYPE _type;
+};
+template <typename T>
 struct FGTTreeNode
 {
 public:
@@ -22,12 +33,17 @@ public:
   Sphere<T> computeSphere(const Mat3XT& y,const Vec3T& ctr) const;
   Sphere<T> mergeSphere(const Sphere<T>& l,const Sphere<T>& r) const;
   T distTo(const FGTTreeNode<T>& other) const;
+  T motionBound(const Mat3X4T& from,const Mat3X4T& to) const;
   sizeType size() const;
+  //all nodes in preorder, the index of a node identifies it in a tree built from the same points
+  void nodes(std::vector<FGTTreeNode<T>*>& ns);
   //FGT
   static void closestYNode(const FGTTreeNode<T>** minLeaf,T& minDist,const FGTTreeNode<T>& yNode,const FGTTreeNode<T>& xNode);
   static void initErrorBound(const Vec* Sy,const Mat3XT& y,const Mat3XT& x,const FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T invHSqr);
   static void FGT(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T invHSqr,T eps,Vec3i* profile=NULL);
-  static void contrib(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T F,T invHSqr,T eps,Vec3i* profile=NULL);
+  static void FGTIncremental(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T invHSqr,T eps,std::vector<FGTInteraction<T>>& interactions,Vec3i* profile=NULL);
+  static void replay(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const FGTInteraction<T>& I,T F,T invHSqr,T eps,Vec3i* profile,std::vector<FGTInteraction<T>>& record);
+  static void contrib(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T F,T invHSqr,T eps,Vec3i* profile=NULL,std::vector<FGTInteraction<T>>* record=NULL);
   static sizeType cost(const FGTTreeNode<T>& yNode,const FGTTreeNode<T>& xNode,sizeType& p,T invHSqr,T errBound);
   static sizeType costChildren(const FGTTreeNode<T>& yNode,const FGTTreeNode<T>& xNode,T invHSqr,T errBound);
   //mean
@@ -40,10 +56,14 @@ public:
   static sizeType costMeanCtr(const FGTTreeNode<T>& yNode,const FGTTreeNode<T>& xNode);
   //direct
   static void direct(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T invHSqr);
+  static void directBatch(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T invHSqr,bool single);
+  static void directMixed(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T F,T invHSqr,T errBound,T eps);
+  static T errorDirectSingle(const FGTTreeNode<T>& yNode,const FGTTreeNode<T>& xNode,T invHSqr);
   static sizeType costDirect(const FGTTreeNode<T>& yNode,const FGTTreeNode<T>& xNode);
   //taylor
   static void taylor(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T invHSqr,T eps);
   static void taylor(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T invHSqr,sizeType p);
+  static void taylorBatch(Vec& G,MatX4T* DGDT,const Vec* Sy,const Mat3XT& y,const Mat3XT* yl,const Mat3XT& x,const FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,T invHSqr,sizeType p);
   static sizeType costTaylor(const FGTTreeNode<T>& yNode,const FGTTreeNode<T>& xNode,sizeType& p,T invHSqr,T errBound);
   //helper
   static void debugSwapId(sizeType base,sizeType N);
@@ -51,6 +71,8 @@ public:
   static void randomTree(Vec* Sy,Mat3XT& y,Mat3XT& yl,Mat3XT& x,FGTTreeNode<T>& yNode,FGTTreeNode<T>& xNode,sizeType N,sizeType leafThres,bool random);
   static void debugTaylor(sizeType N,sizeType leafThres,bool random,T invHSqr,T eps,bool useSy);
   static void debugFGT(sizeType N,sizeType leafThres,bool random,T invHSqr,T eps,bool useSy);
+  static void debugFGTIncremental(sizeType N,sizeType leafThres,bool random,T invHSqr,T eps,bool useSy);
+  static void debugKernels(sizeType N,sizeType leafThres,bool random,T invHSqr,T eps,bool useSy);
   static void debugTree(sizeType N,sizeType leafThres,bool random,bool useSy);
   static sizeType combination(sizeType n,sizeType p);
   static sizeType factorial(sizeType p);
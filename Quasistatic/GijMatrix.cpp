@@ -0,0 +1,258 @@
+#include <Utils/Scalar.h>
+#include "GijMatrix.h"
+#include <Eigen/Eigenvalues>
+
+USE_PRJ_NAMESPACE
+
+template <typename T>
+GijMatrix<T>::GijMatrix():_mode(DENSE),_mappedData(NULL),_mappedRows(0),_mappedCols(0),_err(0),_maxErr(0) {}
+template <typename T>
+GijMatrix<T>::GijMatrix(const MatT& gij):_mode(DENSE),_dense(gij),_mappedData(NULL),_mappedRows(0),_mappedCols(0),_err(0),_maxErr(0) {}
+template <typename T>
+void GijMatrix<T>::compress(MODE mode,T tol)
+{
+  MatT gij=toDense();
+  _file=NULL;
+  _mappedData=NULL;
+  _dense.resize(0,0);
+  _sparse.resize(0,0);
+  _U.resize(0,0);
+  _V.resize(0,0);
+  _mode=mode;
+  T maxAbs=gij.size()>0?gij.cwiseAbs().maxCoeff():T(0);
+  if(mode==DENSE)
+    _dense=gij;
+  else if(mode==SPARSE) {
+    STrips trips;
+    for(sizeType c=0; c<gij.cols(); c++)
+      for(sizeType r=0; r<gij.rows(); r++)
+        if(gij(r,c)!=0 && std::abs(gij(r,c))>tol*maxAbs)
+          trips.push_back(STrip(r,c,gij(r,c)));
+    _sparse.resize(gij.rows(),gij.cols());
+    _sparse.setFromTriplets(trips.begin(),trips.end());
+  } else {
+    //the eigenvalues of gij^T*gij (#directions^2) are the squared singular values,
+    //the smallest are dropped as long as the relative Frobenius error stays below tol
+    Matd G=gij.unaryExpr([&](const T& in) {
+      return (scalarD)std::to_double(in);
+    });
+    Eigen::SelfAdjointEigenSolver<Matd> eig(G.transpose()*G);
+    Cold ev=eig.eigenvalues().cwiseMax(0);
+    scalarD total=ev.sum(),dropped=0,tolD=std::to_double(tol);
+    sizeType nrDrop=0;
+    while(nrDrop<ev.size() && std::sqrt((dropped+ev[nrDrop])/std::max<scalarD>(total,1e-30f))<=tolD)
+      dropped+=ev[nrDrop++];
+    Matd V=eig.eigenvectors().rightCols(ev.size()-nrDrop);
+    _U=(G*V).template cast<T>();
+    _V=V.template cast<T>();
+  }
+  MatT err=gij-toDense();
+  _err=gij.size()>0?T(std::sqrt(err.squaredNorm()/std::max<T>(gij.squaredNorm(),ScalarUtil<T>::scalar_eps()))):T(0);
+  _maxErr=gij.size()>0?T(err.cwiseAbs().maxCoeff()/std::max<T>(maxAbs,ScalarUtil<T>::scalar_eps())):T(0);
+  INFOV("gij %dx%d compressed (mode=%d,tol=%g): %d bytes (dense %d bytes), relative error=%g, max error=%g",
+        rows(),cols(),(sizeType)_mode,std::to_double(tol),memory(),rows()*cols()*(sizeType)sizeof(T),std::to_double(_err),std::to_double(_maxErr))
+}
+template <typename T>
+bool GijMatrix<T>::read(std::istream& is)
+{
+  //a dense gij is stored as the plain matrix of older files, a compressed one follows an empty 0 x mode matrix
+  MatT dense;
+  _file=NULL;
+  _mappedData=NULL;
+  readBinaryData(dense,is);
+  if(dense.rows()==0 && dense.cols()>0) {
+    _mode=(MODE)dense.cols();
+    readBinaryData(_sparse,is);
+    readBinaryData(_U,is);
+    readBinaryData(_V,is);
+    readBinaryData(_err,is);
+    readBinaryData(_maxErr,is);
+  } else {
+    _mode=DENSE;
+    _dense.swap(dense);
+    _err=_maxErr=0;
+  }
+  return is.good();
+}
+template <typename T>
+bool GijMatrix<T>::write(std::ostream& os) const
+{
+  if(_mode==DENSE)
+    writeBinaryData(MatT(dense()),os);
+  else {
+    writeBinaryData(MatT(0,(sizeType)_mode),os);
+    writeBinaryData(_sparse,os);
+    writeBinaryData(_U,os);
+    writeBinaryData(_V,os);
+    writeBinaryData(_err,os);
+    writeBinaryData(_maxErr,os);
+  }
+  return os.good();
+}
+template <typename T>
+bool GijMatrix<T>::writeMapped(std::ostream& os) const
+{
+  bool raw=_mode==DENSE && std::is_same<T,scalarD>::value;
+  writeBinaryData(raw,os);
+  if(!raw)
+    return write(os);
+  Eigen::Map<const MatT> D=dense();
+  writeBinaryData((sizeType)D.rows(),os);
+  writeBinaryData((sizeType)D.cols(),os);
+  std::string pad(SectionFile::ALIGN-sizeof(bool)-2*sizeof(sizeType),'\0');
+  os.write(pad.data(),pad.size());
+  os.write((const char*)D.data(),D.size()*sizeof(T));
+  return os.good();
+}
+template <typename T>
+bool GijMatrix<T>::readMapped(const char* data,sizeType size,std::shared_ptr<MappedFile> file)
+{
+  bool raw;
+  sizeType rows,cols;
+  IMemoryStream is(data,size);
+  readBinaryData(raw,is);
+  if(!raw)
+    return read(is);
+  readBinaryData(rows,is);
+  readBinaryData(cols,is);
+  if(!is.good() || !std::is_same<T,scalarD>::value || SectionFile::ALIGN+rows*cols*(sizeType)sizeof(T)>size)
+    return false;
+  _mode=DENSE;
+  _dense.resize(0,0);
+  _sparse.resize(0,0);
+  _U.resize(0,0);
+  _V.resize(0,0);
+  _file=file;
+  _mappedData=(const T*)(data+SectionFile::ALIGN);
+  _mappedRows=rows;
+  _mappedCols=cols;
+  _err=_maxErr=0;
+  return true;
+}
+template <typename T>
+bool GijMatrix<T>::mapped() const
+{
+  return _mappedData!=NULL;
+}
+template <typename T>
+typename GijMatrix<T>::MODE GijMatrix<T>::mode() const
+{
+  return _mode;
+}
+template <typename T>
+T GijMatrix<T>::error() const
+{
+  return _err;
+}
+template <typename T>
+T GijMatrix<T>::maxError() const
+{
+  return _maxErr;
+}
+template <typename T>
+sizeType GijMatrix<T>::rows() const
+{
+  if(_mode==DENSE)
+    return dense().rows();
+  else if(_mode==SPARSE)
+    return _sparse.rows();
+  else return _U.rows();
+}
+template <typename T>
+sizeType GijMatrix<T>::cols() const
+{
+  if(_mode==DENSE)
+    return dense().cols();
+  else if(_mode==SPARSE)
+    return _sparse.cols();
+  else return _V.rows();
+}
+template <typename T>
+sizeType GijMatrix<T>::size() const
+{
+  return rows()*cols();
+}
+template <typename T>
+sizeType GijMatrix<T>::memory() const
+{
+  if(_mode==DENSE)
+    return dense().size()*(sizeType)sizeof(T);
+  else if(_mode==SPARSE)
+    return _sparse.nonZeros()*(sizeType)(sizeof(T)+sizeof(sizeType))+(_sparse.cols()+1)*(sizeType)sizeof(sizeType);
+  else return (_U.size()+_V.size())*(sizeType)sizeof(T);
+}
+template <typename T>
+T GijMatrix<T>::coeff(sizeType r,sizeType c) const
+{
+  if(_mode==DENSE)
+    return dense()(r,c);
+  else if(_mode==SPARSE)
+    return _sparse.coeff(r,c);
+  else return _U.row(r).dot(_V.row(c));
+}
+template <typename T>
+typename GijMatrix<T>::Vec GijMatrix<T>::col(sizeType c) const
+{
+  if(_mode==DENSE)
+    return dense().col(c);
+  else if(_mode==SPARSE)
+    return _sparse.col(c);
+  else return _U*_V.row(c).transpose();
+}
+template <typename T>
+typename GijMatrix<T>::MatT GijMatrix<T>::toDense() const
+{
+  if(_mode==DENSE)
+    return dense();
+  else if(_mode==SPARSE)
+    return _sparse.toDense();
+  else return _U*_V.transpose();
+}
+template <typename T>
+typename GijMatrix<T>::Vec GijMatrix<T>::transposeTimes(const Vec& w) const
+{
+  if(_mode==DENSE)
+    return dense().transpose()*w;
+  else if(_mode==SPARSE)
+    return _sparse.transpose()*w;
+  else return _V*(_U.transpose()*w);
+}
+template <typename T>
+typename GijMatrix<T>::MatT GijMatrix<T>::leftTimes(const SMat& A) const
+{
+  if(_mode==DENSE)
+    return A*dense();
+  else if(_mode==SPARSE)
+    return SMat(A*_sparse).toDense();
+  else return (A*_U)*_V.transpose();
+}
+template <typename T>
+typename GijMatrix<T>::Vec GijMatrix<T>::maxTimes(const Vec& w) const
+{
+  if(_mode==DENSE)
+    return (dense().transpose()*w.asDiagonal()).rowwise().maxCoeff();
+  Vec ret(cols());
+  for(sizeType c=0; c<cols(); c++)
+    if(_mode==SPARSE) {
+      //the entries that are not stored contribute 0
+      ret[c]=_sparse.col(c).nonZeros()<rows()?T(0):-ScalarUtil<T>::scalar_max();
+      for(typename SMat::InnerIterator it(_sparse,c); it; ++it)
+        ret[c]=std::max<T>(ret[c],it.value()*w[it.row()]);
+    } else ret[c]=col(c).cwiseProduct(w).maxCoeff();
+  return ret;
+}
+template <typename T>
+Eigen::Map<const typename GijMatrix<T>::MatT> GijMatrix<T>::dense() const
+{
+  if(_mappedData)
+    return Eigen::Map<const MatT>(_mappedData,_mappedRows,_mappedCols);
+  else return Eigen::Map<const MatT>(_dense.data(),_dense.rows(),_dense.cols());
+}
+//instance
+PRJ_BEGIN
+template class GijMatrix<double>;
+#ifdef ALL_TYPES
+template class GijMatrix<__float128>;
+template class GijMatrix<mpfr::mpreal>;
+#endif
+PRJ_END
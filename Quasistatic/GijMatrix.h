@@ -0,0 +1,61 @@
+#ifndef GIJ_MATRIX_H
+#define GIJ_MATRIX_H
+
+#include <CommonFile/MathBasic.h>
+#include <Utils/SparseUtils.h>
+#include <CommonFile/SectionFile.h>
+
+PRJ_BEGIN
+
+#include <Utils/MapTypePragma.h>
+//grasp wrench matrix of PointCloudObject (#points x #directions), stored dense, as a sparse matrix without the entries
+//below tol*max|gij|, or as a truncated SVD U*V^T whose relative Frobenius error is below tol
+template <typename T>
+class GijMatrix
+{
+public:
+  DECL_MAP_TYPES_T
+  enum MODE {DENSE=0,SPARSE=1,LOW_RANK=2};
+  GijMatrix();
+  GijMatrix(const MatT& gij);
+  void compress(MODE mode,T tol);
+  bool read(std::istream& is);
+  bool write(std::ostream& os) const;
+  //a dense double gij is written as (true,rows,cols) followed by the raw column-major entries at offset SectionFile::ALIGN,
+  //readMapped then uses the mapped entries in place, other modes and types are written as false followed by write
+  bool writeMapped(std::ostream& os) const;
+  bool readMapped(const char* data,sizeType size,std::shared_ptr<MappedFile> file);
+  bool mapped() const;
+  MODE mode() const;
+  //relative Frobenius and max entrywise (relative to max|gij|) error of the compression
+  T error() const;
+  T maxError() const;
+  sizeType rows() const;
+  sizeType cols() const;
+  sizeType size() const;
+  sizeType memory() const;
+  T coeff(sizeType r,sizeType c) const;
+  Vec col(sizeType c) const;
+  MatT toDense() const;
+  //gij^T*w
+  Vec transposeTimes(const Vec& w) const;
+  //A*gij
+  MatT leftTimes(const SMat& A) const;
+  //max_i gij(i,c)*w[i] for every direction c
+  Vec maxTimes(const Vec& w) const;
+  //the dense entries in place (mapped or owned), only meaningful in DENSE mode
+  Eigen::Map<const MatT> dense() const;
+private:
+  MODE _mode;
+  MatT _dense,_U,_V;
+  //dense entries inside a mapped file, used instead of _dense when set
+  std::shared_ptr<MappedFile> _file;
+  const T* _mappedData;
+  sizeType _mappedRows,_mappedCols;
+  SMat _sparse;
+  T _err,_maxErr;
+};
+
+PRJ_END
+
+#endif
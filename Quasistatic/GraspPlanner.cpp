@@ -6,11 +6,16 @@
 #include <Articulated/ArticulatedUtils.h>
 #include <Articulated/ArticulatedLoader.h>
 #include <Articulated/MultiPrecisionLQP.h>
+#include <Articulated/PBDArticulatedBatchInfo.h>
 #include <CommonFile/ParallelPoissonDiskSampling.h>
 #include <Environment/ObjMeshGeomCellExact.h>
 #include <Environment/ConvexHullExact.h>
 #include <Environment/Environment.h>
 #include <CommonFile/Timing.h>
+#include <CommonFile/Profiler.h>
+#include <CommonFile/SectionFile.h>
+#include <chrono>
+#include <cstdio>
 #include <Eigen/Sparse>
 #include <Eigen/Eigen>
 //energy
@@ -22,6 +27,7 @@
 #include "ObjectClosednessEnergy.h"
 #include "LogBarrierObjEnergy.h"
 #include "MetricEnergy.h"
+#include "SQPTelemetry.h"
 
 USE_PRJ_NAMESPACE
 
@@ -30,23 +36,35 @@ GraspPlannerParameter::GraspPlannerParameter(Options& ops)
 {
   REGISTER_FLOAT_TYPE("d0",GraspPlannerParameter,scalarD,t._d0)
   REGISTER_FLOAT_TYPE("alpha",GraspPlannerParameter,scalarD,t._alpha)
+  REGISTER_FLOAT_TYPE("metricTol",GraspPlannerParameter,scalarD,t._metricTol)
   REGISTER_INT_TYPE("metric",GraspPlannerParameter,sizeType,t._metric)
   REGISTER_INT_TYPE("activation",GraspPlannerParameter,sizeType,t._activation)
   REGISTER_FLOAT_TYPE("normalExtrude",GraspPlannerParameter,scalarD,t._normalExtrude)
   REGISTER_FLOAT_TYPE("FGTThres",GraspPlannerParameter,scalarD,t._FGTThres)
+  REGISTER_BOOL_TYPE("FGTIncremental",GraspPlannerParameter,bool,t._FGTIncremental)
   REGISTER_FLOAT_TYPE("coefM",GraspPlannerParameter,scalarD,t._coefM)
   REGISTER_FLOAT_TYPE("coefOC",GraspPlannerParameter,scalarD,t._coefOC)
   REGISTER_FLOAT_TYPE("coefCC",GraspPlannerParameter,scalarD,t._coefCC)
   REGISTER_FLOAT_TYPE("coefO",GraspPlannerParameter,scalarD,t._coefO)
   REGISTER_FLOAT_TYPE("coefS",GraspPlannerParameter,scalarD,t._coefS)
   REGISTER_FLOAT_TYPE("useGJK",GraspPlannerParameter,bool,t._useGJK)
+  REGISTER_FLOAT_TYPE("skin",GraspPlannerParameter,scalarD,t._skin)
+  REGISTER_INT_TYPE("levels",GraspPlannerParameter,sizeType,t._levels)
+  REGISTER_FLOAT_TYPE("levelRatio",GraspPlannerParameter,scalarD,t._levelRatio)
+  REGISTER_INT_TYPE("levelIter",GraspPlannerParameter,sizeType,t._levelIter)
+  REGISTER_FLOAT_TYPE("levelThres",GraspPlannerParameter,scalarD,t._levelThres)
   //solver
   REGISTER_FLOAT_TYPE("rho0",GraspPlannerParameter,scalarD,t._rho0)
   REGISTER_FLOAT_TYPE("thres",GraspPlannerParameter,scalarD,t._thres)
   REGISTER_FLOAT_TYPE("alphaThres",GraspPlannerParameter,scalarD,t._alphaThres)
+  REGISTER_INT_TYPE("lineSearchBatch",GraspPlannerParameter,sizeType,t._lineSearchBatch)
   REGISTER_BOOL_TYPE("callback",GraspPlannerParameter,bool,t._callback)
   REGISTER_BOOL_TYPE("sparse",GraspPlannerParameter,bool,t._sparse)
   REGISTER_INT_TYPE("maxIter",GraspPlannerParameter,sizeType,t._maxIter)
+  REGISTER_FLOAT_TYPE("timeBudget",GraspPlannerParameter,scalarD,t._timeBudget)
+  REGISTER_FLOAT_TYPE("targetQInf",GraspPlannerParameter,scalarD,t._targetQInf)
+  REGISTER_INT_TYPE("checkpointInterval",GraspPlannerParameter,sizeType,t._checkpointInterval)
+  REGISTER_BOOL_TYPE("resume",GraspPlannerParameter,bool,t._resume)
   reset(ops);
 }
 void GraspPlannerParameter::reset(Options& ops)
@@ -58,23 +76,37 @@ void GraspPlannerParameter::initOptions(GraspPlannerParameter& sol)
 {
   sol._d0=1;
   sol._alpha=1e-3f;
+  sol._metricTol=1e-10f;
   sol._metric=Q_INF_CONSTRAINT;
   sol._activation=SQR_EXP_ACTIVATION;
   sol._normalExtrude=1;
   sol._FGTThres=1e-6f;
+  sol._FGTIncremental=false;
   sol._coefM=-1;
   sol._coefOC=0;
   sol._coefCC=0;
   sol._coefO=100;
   sol._coefS=1;
   sol._useGJK=false;
+  sol._skin=0.5f;
+  sol._levels=0;
+  sol._levelRatio=2;
+  sol._levelIter=20;
+  sol._levelThres=1e-3f;
   //solver
   sol._rho0=1;
   sol._thres=1e-10f;
   sol._alphaThres=1e-20f;
+  sol._lineSearchBatch=4;
   sol._callback=true;
   sol._sparse=false;
   sol._maxIter=2000;
+  sol._timeBudget=0;
+  sol._targetQInf=0;
+  sol._telemetry="";
+  sol._checkpoint="";
+  sol._checkpointInterval=10;
+  sol._resume=false;
 }
 //GraspPlanner
 template <typename T>
@@ -83,6 +115,7 @@ template <typename T>
 void GraspPlanner<T>::reset(T rad,bool convex,T SDFRes,T SDFExtension,bool SDFRational,bool checkValid)
 {
   _pnss.resize(_body.nrJ());
+  _selfIndex.clear();
   _rad=rad;
   //reset geom
   ObjMesh m;
@@ -109,6 +142,7 @@ void GraspPlanner<T>::reset(T rad,bool convex,T SDFRes,T SDFExtension,bool SDFRa
   _l=l.template cast<T>();
   _u=u.template cast<T>();
   //distExact
+  _envLazy=NULL;
   _env.resize(_body.nrJ());
   for(sizeType i=0; i<_body.nrJ(); i++)
     if(SDFRes>0) {
@@ -189,6 +223,11 @@ bool GraspPlanner<T>::read(std::istream& is,IOData* dat)
   //sample
   readBinaryData(_pnss,is);
   readBinaryData(_rad,is);
+  //files written before the self-collision index end here
+  _selfIndex.clear();
+  if(is.peek()!=std::char_traits<char>::eof())
+    readBinaryData(_selfIndex,is);
+  _envLazy=NULL;
   return is.good();
 }
 template <typename T>
@@ -197,7 +236,7 @@ bool GraspPlanner<T>::write(std::ostream& os,IOData* dat) const
   registerType<EnvironmentCubic<T>>(dat);
   registerType<EnvironmentExact<T>>(dat);
   registerType<GraspPlanner<T>>(dat);
-  writeBinaryData(_env,os,dat);
+  writeBinaryData(envs(),os,dat);
   _body.write(os,dat);
   //mimic
   writeBinaryData(_A,os);
@@ -210,9 +249,73 @@ bool GraspPlanner<T>::write(std::ostream& os,IOData* dat) const
   //sample
   writeBinaryData(_pnss,os);
   writeBinaryData(_rad,os);
+  writeBinaryData(_selfIndex,os);
   return os.good();
 }
 template <typename T>
+bool GraspPlanner<T>::readMapped(const std::string& path)
+{
+  if(!SectionFile::isSectionFile(path))
+    return SerializableBase::read(path);
+  std::shared_ptr<SectionFile> file(new SectionFile(path));
+  if(!file->valid() || file->type()!=type()) {
+    WARNINGV("Cannot read %s as %s",path.c_str(),type().c_str())
+    return false;
+  }
+  std::shared_ptr<IOData> dat=getIOData();
+  _body.read(*(file->stream("body")),dat.get());
+  std::shared_ptr<IMemoryStream> is=file->stream("mimic");
+  readBinaryData(_A,*is);
+  readBinaryData(_b,*is);
+  readBinaryData(_l,*is);
+  readBinaryData(_u,*is);
+  readBinaryData(_pnss,*(file->stream("pnss")));
+  readBinaryData(_rad,*(file->stream("rad")));
+  _selfIndex.clear();
+  if(file->has("self"))
+    readBinaryData(_selfIndex,*(file->stream("self")));
+  //the environments are only used by the contact and registration terms and writeLocalVTK
+  _env.clear();
+  _envLazy.reset(new LazySection<std::vector<std::shared_ptr<Environment<T>>>>(file,"env",[](std::istream& is,std::vector<std::shared_ptr<Environment<T>>>& env) {
+    std::shared_ptr<IOData> dat=getIOData();
+    registerType<EnvironmentCubic<T>>(dat.get());
+    registerType<EnvironmentExact<T>>(dat.get());
+    readBinaryData(env,is,dat.get());
+  }));
+  return is->good();
+}
+template <typename T>
+bool GraspPlanner<T>::writeMapped(const std::string& path) const
+{
+  SectionFileWriter writer(type());
+  writer.add("env",[&](std::ostream& os) {
+    std::shared_ptr<IOData> dat=getIOData();
+    registerType<EnvironmentCubic<T>>(dat.get());
+    registerType<EnvironmentExact<T>>(dat.get());
+    writeBinaryData(envs(),os,dat.get());
+  });
+  writer.add("body",[&](std::ostream& os) {
+    std::shared_ptr<IOData> dat=getIOData();
+    _body.write(os,dat.get());
+  });
+  writer.add("mimic",[&](std::ostream& os) {
+    writeBinaryData(_A,os);
+    writeBinaryData(_b,os);
+    writeBinaryData(_l,os);
+    writeBinaryData(_u,os);
+  });
+  writer.add("pnss",[&](std::ostream& os) {
+    writeBinaryData(_pnss,os);
+  });
+  writer.add("rad",[&](std::ostream& os) {
+    writeBinaryData(_rad,os);
+  });
+  writer.add("self",[&](std::ostream& os) {
+    writeBinaryData(_selfIndex,os);
+  });
+  return writer.write(path);
+}
+template <typename T>
 std::shared_ptr<SerializableBase> GraspPlanner<T>::copy() const
 {
   return std::shared_ptr<SerializableBase>(new GraspPlanner<T>);
@@ -235,12 +338,17 @@ const ArticulatedBody& GraspPlanner<T>::body() const
 template <typename T>
 const Environment<T>& GraspPlanner<T>::env(sizeType jid) const
 {
-  return *(_env.at(jid));
+  return *(envs().at(jid));
 }
 template <typename T>
 const ObjMeshGeomCellExact& GraspPlanner<T>::dist(sizeType jid) const
 {
-  return std::dynamic_pointer_cast<EnvironmentExact<T>>(_env.at(jid))->getObj();
+  return std::dynamic_pointer_cast<EnvironmentExact<T>>(envs().at(jid))->getObj();
+}
+template <typename T>
+const std::vector<std::shared_ptr<Environment<T>>>& GraspPlanner<T>::envs() const
+{
+  return _envLazy?_envLazy->get():_env;
 }
 template <typename T>
 const typename GraspPlanner<T>::PNSS& GraspPlanner<T>::pnss() const
@@ -248,6 +356,63 @@ const typename GraspPlanner<T>::PNSS& GraspPlanner<T>::pnss() const
   return _pnss;
 }
 template <typename T>
+void GraspPlanner<T>::buildSelfIndex(sizeType nrSample,T margin)
+{
+  //link vertices
+  ObjMesh m;
+  std::vector<Mat3XT> vss(_body.nrJ());
+  for(sizeType i=0; i<_body.nrJ(); i++) {
+    _body.getGeom().getG(i).getMesh(m);
+    vss[i].resize(3,(sizeType)m.getV().size());
+    for(sizeType j=0; j<(sizeType)m.getV().size(); j++)
+      vss[i].col(j)=m.getV(j).template cast<T>();
+  }
+  //the first sample is the reference configuration, the zero pose clamped to the limits,
+  //the others are uniform within the limits, the unbounded (base) DOFs move all links rigidly and stay at zero
+  _selfIndex.clear();
+  Vec x0=Vec::Zero(_l.size()).cwiseMax(_l).cwiseMin(_u);
+  MatT xs(_body.nrDOF(),nrSample);
+  for(sizeType s=0; s<nrSample; s++) {
+    Vec x=x0;
+    if(s>0)
+      for(sizeType i=0; i<x.size(); i++)
+        if(_l[i]>-DSSQPObjective<T>::infty() && _u[i]<DSSQPObjective<T>::infty())
+          x[i]=_l[i]+(_u[i]-_l[i])*T(RandEngine::randR01());
+    xs.col(s)=_A*x+_b;
+  }
+  PBDArticulatedBatchInfo<T> batch(_body,xs,false);
+  for(sizeType s=0; s<nrSample; s++) {
+    Mat3XT TM=batch.TM(s);
+    std::vector<Mat3XT> pss(_body.nrJ());
+    std::vector<BBox<scalarD>> bbs(_body.nrJ());
+    for(sizeType i=0; i<_body.nrJ(); i++) {
+      pss[i]=ROTI(TM,i)*vss[i]+CTRI(TM,i)*Vec::Ones(vss[i].cols()).transpose();
+      for(sizeType j=0; j<pss[i].cols(); j++)
+        bbs[i].setUnion(Vec3d(pss[i].col(j).unaryExpr([&](const T& in) {
+          return (scalarD)std::to_double(in);
+        })));
+      bbs[i].enlarged(std::to_double(margin)/2);
+    }
+    for(sizeType i=0; i<_body.nrJ(); i++)
+      for(sizeType j=i+1; j<_body.nrJ(); j++)
+        if(vss[i].cols()>0 && vss[j].cols()>0 && bbs[i].intersect(bbs[j]) && _selfIndex.find(Vec2i(i,j))==_selfIndex.end()) {
+          //the plane is only computed at the reference configuration and stored in the frame of link i
+          Vec4T plane=Vec4T::Zero(),planeL=Vec4T::Zero();
+          if(s==0 && ConvexLogBarrierSelfEnergy<T>::separatingPlane(pss[i],pss[j],plane)) {
+            planeL.template segment<3>(0)=ROTI(TM,i).transpose()*plane.template segment<3>(0);
+            planeL[3]=plane[3]+plane.template segment<3>(0).dot(CTRI(TM,i));
+          }
+          _selfIndex[Vec2i(i,j)]=planeL;
+        }
+  }
+  INFOV("Self-collision index: %d/%d link pairs from %d samples",(sizeType)_selfIndex.size(),_body.nrJ()*(_body.nrJ()-1)/2,nrSample)
+}
+template <typename T>
+const std::unordered_map<Vec2i,typename GraspPlanner<T>::Vec4T,Hash>& GraspPlanner<T>::selfIndex() const
+{
+  return _selfIndex;
+}
+template <typename T>
 void GraspPlanner<T>::writeVTK(const Vec& x,const std::string& path,T len) const
 {
   sizeType lid=0;
@@ -302,7 +467,7 @@ void GraspPlanner<T>::writeLocalVTK(const std::string& path,T len) const
       os.appendCells(VTKWriter<scalar>::IteratorIndex<Vec3i>(0,2,0),
                      VTKWriter<scalar>::IteratorIndex<Vec3i>((sizeType)vss.size()/2,2,0),
                      VTKWriter<scalar>::LINE);
-      _env[j]->getMesh().writeVTK(path+"/jointMesh"+std::to_string(j)+".vtk",true);
+      envs()[j]->getMesh().writeVTK(path+"/jointMesh"+std::to_string(j)+".vtk",true);
     }
 }
 template <typename T>
@@ -327,24 +492,23 @@ void GraspPlanner<T>::writeLimitsVTK(const std::string& path) const
   }
 }
 template <typename T>
-typename GraspPlanner<T>::Vec GraspPlanner<T>::optimize(bool debug,const Vec& init,PointCloudObject<T>& object,GraspPlannerParameter& ops)
+typename GraspPlanner<T>::Vec GraspPlanner<T>::optimize(bool debug,const Vec& init,PointCloudObject<T>& object,GraspPlannerParameter& ops,sizeType* nrIter)
 {
-  _objs=DSSQPObjectiveCompound<T>();
-  _info=PBDArticulatedGradientInfo<T>();
-  if(ops._metric==Q_1 || ops._metric==Q_INF || ops._metric==Q_INF_BARRIER)
-    _objs.addComponent(std::shared_ptr<ArticulatedObjective<T>>(new MetricEnergy<T>(_objs,_info,*this,object,ops._d0,ops._alpha,ops._coefM,(METRIC_TYPE)ops._metric,(METRIC_ACTIVATION)ops._activation,_rad*ops._normalExtrude)));
-  if(ops._metric==Q_INF_CONSTRAINT)
-    _objs.addComponent(std::shared_ptr<PrimalDualQInfMetricEnergy<T>>(new PrimalDualQInfMetricEnergy<T>(_objs,_info,*this,object,ops._alpha,ops._coefM,(METRIC_ACTIVATION)ops._activation,_rad*ops._normalExtrude)));
-  if(ops._metric==Q_INF_CONSTRAINT_FGT)
-    _objs.addComponent(std::shared_ptr<PrimalDualQInfMetricEnergyFGT<T>>(new PrimalDualQInfMetricEnergyFGT<T>(_objs,_info,*this,object,ops._alpha,ops._coefM,_rad*ops._normalExtrude,ops._FGTThres)));
-  if(ops._coefOC>0)
-    _objs.addComponent(std::shared_ptr<ArticulatedObjective<T>>(new ObjectClosednessEnergy<T>(_objs,_info,*this,object,ops._coefOC)));
-  if(ops._coefCC>0)
-    _objs.addComponent(std::shared_ptr<ArticulatedObjective<T>>(new CentroidClosednessEnergy<T>(_objs,_info,*this,object,ops._coefCC)));
-  if(ops._coefO>0)
-    _objs.addComponent(std::shared_ptr<ArticulatedObjective<T>>(new LogBarrierObjEnergy<T>(_objs,_info,*this,object,_rad*ops._d0,ops._coefO,ops._useGJK)));
-  if(ops._coefS>0)
-    _objs.addComponent(std::shared_ptr<ArticulatedObjective<T>>(new ConvexLogBarrierSelfEnergy<T>(_objs,_info,*this,object,_rad*ops._d0,ops._coefS)));
+  PROFILE_SCOPE("GraspPlanner::optimize")
+  //the levels share the time budget, which includes building the levels and objectives,
+  //half of it is reserved for the full-resolution level, the coarse levels split the rest evenly
+  std::chrono::steady_clock::time_point begBudget=std::chrono::steady_clock::now();
+  std::function<scalarD(scalarD,sizeType)> remaining=[&](scalarD reserve,sizeType nrLevel) {
+    if(ops._timeBudget<=0)
+      return ops._timeBudget;
+    scalarD used=std::chrono::duration<scalarD>(std::chrono::steady_clock::now()-begBudget).count();
+    return std::max<scalarD>((ops._timeBudget*(1-reserve)-used)/nrLevel,std::numeric_limits<scalarD>::min());
+  };
+  //coarse-to-fine: the iterations far from convergence run on the coarse levels of the object,
+  //the last level is always the full object, so that the converged result is that of the full resolution
+  sizeType nrCoarse=debug?0:ops._levels;
+  object.buildLevels(ops._levels,ops._levelRatio);
+  initObjectives(object.level(nrCoarse),ops);
 
   Vec x;
 
@@ -358,24 +522,221 @@ typename GraspPlanner<T>::Vec GraspPlanner<T>::optimize(bool debug,const Vec& in
     _l=concat<Vec,Vec>(_l,Vec::Constant(nAdd,-DSSQPObjective<T>::infty()));
     _u=concat<Vec,Vec>(_u,Vec::Constant(nAdd, DSSQPObjective<T>::infty()));
   }
-  sizeType it;
-  TBEG();
+  sizeType it=0;
+  //not using TBEG/TENDV, the global timer stack is shared by concurrent optimizations
+  std::chrono::steady_clock::time_point beg=std::chrono::steady_clock::now();
   if(debug)
     debugSystem(x);
-  else x=optimizeSQP(x,ops,it);
-  scalarD time=TENDV();
-  INFOV("OptimizeSQP %d iterations, average time=%f",it,time/it)
+  else {
+    for(sizeType l=nrCoarse; l>0; l--) {
+      //the objectives hold references into ops (LogBarrierObjEnergy::_useGJK, switched by the line search),
+      //so optimizeSQP runs on ops itself with the level settings, which are reverted afterwards
+      GraspPlannerParameter opsSaved=ops;
+      scalarD budget=remaining(0.5f,l);
+      ops._maxIter=opsSaved._levelIter;
+      ops._thres=opsSaved._levelThres;
+      ops._telemetry=SQPTelemetry::suffixPath(opsSaved._telemetry,"_level"+std::to_string(l));
+      ops._checkpoint=SQPTelemetry::suffixPath(opsSaved._checkpoint,"_level"+std::to_string(l));
+      ops._timeBudget=budget;
+      sizeType itLevel=0;
+      std::chrono::steady_clock::time_point begLevel=std::chrono::steady_clock::now();
+      Vec xLevel=optimizeSQP(x,ops,itLevel);
+      ops=opsSaved;
+      INFOV("Level %d (%d points): %d iterations, %fs",l,object.level(l).pss().cols(),itLevel,std::chrono::duration<scalarD>(std::chrono::steady_clock::now()-begLevel).count())
+      it+=itLevel;
+      //an invalid configuration on a coarse level is not final, the finer level restarts from the last valid x
+      if(xLevel.size()>0)
+        x=xLevel;
+      initObjectives(object.level(l-1),ops);
+      ASSERT_MSG(_objs.inputs()==x.size(),"The levels of the object have different numbers of variables")
+    }
+    sizeType itFine=0;
+    scalarD timeBudget=ops._timeBudget;
+    ops._timeBudget=remaining(0,1);
+    x=optimizeSQP(x,ops,itFine);
+    ops._timeBudget=timeBudget;
+    it+=itFine;
+  }
+  scalarD time=std::chrono::duration<scalarD>(std::chrono::steady_clock::now()-beg).count();
+  INFOV("OptimizeSQP %d iterations, average time=%f",it,time/std::max<sizeType>(it,1))
+  if(ops._timeBudget>0) {
+    INFOV("Time budget: %fs used of %fs",std::chrono::duration<scalarD>(std::chrono::steady_clock::now()-begBudget).count(),ops._timeBudget)
+  }
+  if(nrIter)
+    *nrIter=it;
   if(nAdd>0) {
     _b=_b.segment(0,_b.size()-nAdd).eval();
     _A=_A.block(0,0,_A.rows()-nAdd,_A.cols()-nAdd).eval();
     _l=_l.segment(0,_l.size()-nAdd).eval();
     _u=_u.segment(0,_u.size()-nAdd).eval();
   }
+  if(x.size()==0)
+    return x;
   return _A*x.segment(0,_A.cols())+_b;
 }
 template <typename T>
+void GraspPlanner<T>::initObjectives(const PointCloudObject<T>& object,const GraspPlannerParameter& ops)
+{
+  _objs=DSSQPObjectiveCompound<T>();
+  _info=PBDArticulatedGradientInfo<T>();
+  if(ops._metric==Q_1 || ops._metric==Q_INF || ops._metric==Q_INF_BARRIER)
+    _objs.addComponent(std::shared_ptr<ArticulatedObjective<T>>(new MetricEnergy<T>(_objs,_info,*this,object,ops._d0,ops._alpha,ops._coefM,(METRIC_TYPE)ops._metric,(METRIC_ACTIVATION)ops._activation,_rad*ops._normalExtrude,ops._metricTol)));
+  if(ops._metric==Q_INF_CONSTRAINT)
+    _objs.addComponent(std::shared_ptr<PrimalDualQInfMetricEnergy<T>>(new PrimalDualQInfMetricEnergy<T>(_objs,_info,*this,object,ops._alpha,ops._coefM,(METRIC_ACTIVATION)ops._activation,_rad*ops._normalExtrude)));
+  if(ops._metric==Q_INF_CONSTRAINT_FGT)
+    _objs.addComponent(std::shared_ptr<PrimalDualQInfMetricEnergyFGT<T>>(new PrimalDualQInfMetricEnergyFGT<T>(_objs,_info,*this,object,ops._alpha,ops._coefM,_rad*ops._normalExtrude,ops._FGTThres,ops._FGTIncremental)));
+  if(ops._coefOC>0)
+    _objs.addComponent(std::shared_ptr<ArticulatedObjective<T>>(new ObjectClosednessEnergy<T>(_objs,_info,*this,object,ops._coefOC)));
+  if(ops._coefCC>0)
+    _objs.addComponent(std::shared_ptr<ArticulatedObjective<T>>(new CentroidClosednessEnergy<T>(_objs,_info,*this,object,ops._coefCC)));
+  if(ops._coefO>0)
+    _objs.addComponent(std::shared_ptr<ArticulatedObjective<T>>(new LogBarrierObjEnergy<T>(_objs,_info,*this,object,_rad*ops._d0,ops._coefO,ops._useGJK,_rad*ops._skin)));
+  if(ops._coefS>0)
+    _objs.addComponent(std::shared_ptr<ArticulatedObjective<T>>(new ConvexLogBarrierSelfEnergy<T>(_objs,_info,*this,object,_rad*ops._d0,ops._coefS)));
+}
+template <typename T>
+bool GraspPlanner<T>::writeCheckpoint(const std::string& path,const Vec& x,sizeType it,T alpha,T rho,T reg,bool done,const Vec& xBest,T EBest,sizeType itBest,T QInfBest) const
+{
+  PROFILE_SCOPE("GraspPlanner::writeCheckpoint")
+  SectionFileWriter writer("SQPCheckpoint");
+  writer.add("solver",[&](std::ostream& os) {
+    writeBinaryData(done,os);
+    writeBinaryData(it,os);
+    writeBinaryData(x,os);
+    writeBinaryData(alpha,os);
+    writeBinaryData(rho,os);
+    writeBinaryData(reg,os);
+    writeBinaryData(xBest,os);
+    writeBinaryData(EBest,os);
+    writeBinaryData(itBest,os);
+    writeBinaryData(QInfBest,os);
+  });
+  //the forward kinematics at x, which the line search may have taken from a batch, and the warm start of the next QP
+  writer.add("kinematics",[&](std::ostream& os) {
+    _info.write(os);
+  });
+  writer.add("qp",[&](std::ostream& os) {
+    _sol.writeState(os);
+  });
+  //one section per objective, named after the component
+  for(const std::pair<std::string,std::shared_ptr<DSSQPObjectiveComponent<T>>>& p:_objs.components()) {
+    std::shared_ptr<ArticulatedObjective<T>> obj=std::dynamic_pointer_cast<ArticulatedObjective<T>>(p.second);
+    if(obj)
+      writer.add(p.first,[&](std::ostream& os) {
+        obj->writeState(os);
+      });
+  }
+  //the new checkpoint replaces the old one only once it is complete, a run preempted while writing keeps the old one
+  if(!writer.write(path)) {
+    WARNINGV("Cannot write SQP checkpoint %s",path.c_str())
+    return false;
+  }
+  return true;
+}
+template <typename T>
+bool GraspPlanner<T>::readCheckpoint(const std::string& path,Vec& x,sizeType& it,T& alpha,T& rho,T& reg,bool& done,Vec& xBest,T& EBest,sizeType& itBest,T& QInfBest)
+{
+  PROFILE_SCOPE("GraspPlanner::readCheckpoint")
+  SectionFile file(path);
+  if(!file.valid() || file.type()!="SQPCheckpoint" || !file.has("solver") || !file.has("kinematics") || !file.has("qp"))
+    return false;
+  bool doneFile;
+  sizeType itFile,itBestFile;
+  Vec xFile,xBestFile;
+  T alphaFile,rhoFile,regFile,EBestFile,QInfBestFile;
+  std::shared_ptr<IMemoryStream> is=file.stream("solver");
+  readBinaryData(doneFile,*is);
+  readBinaryData(itFile,*is);
+  readBinaryData(xFile,*is);
+  readBinaryData(alphaFile,*is);
+  readBinaryData(rhoFile,*is);
+  readBinaryData(regFile,*is);
+  readBinaryData(xBestFile,*is);
+  readBinaryData(EBestFile,*is);
+  readBinaryData(itBestFile,*is);
+  readBinaryData(QInfBestFile,*is);
+  //a failed optimization is stored with an empty x
+  if(!is->good() || (xFile.size()!=x.size() && !(doneFile && xFile.size()==0)) || (xBestFile.size()!=x.size() && xBestFile.size()>0)) {
+    WARNINGV("SQP checkpoint %s does not match the problem (%d variables, expected %d)",path.c_str(),xFile.size(),x.size())
+    return false;
+  }
+  for(const std::pair<std::string,std::shared_ptr<DSSQPObjectiveComponent<T>>>& p:_objs.components())
+    if(std::dynamic_pointer_cast<ArticulatedObjective<T>>(p.second) && !file.has(p.first)) {
+      WARNINGV("SQP checkpoint %s has no state of objective %s",path.c_str(),p.first.c_str())
+      return false;
+    }
+  for(const std::pair<std::string,std::shared_ptr<DSSQPObjectiveComponent<T>>>& p:_objs.components()) {
+    std::shared_ptr<ArticulatedObjective<T>> obj=std::dynamic_pointer_cast<ArticulatedObjective<T>>(p.second);
+    if(obj && !obj->readState(*(file.stream(p.first)))) {
+      WARNINGV("Cannot read the state of objective %s from SQP checkpoint %s",p.first.c_str(),path.c_str())
+      return false;
+    }
+  }
+  if(!_info.read(*(file.stream("kinematics"))) || !_sol.readState(*(file.stream("qp")))) {
+    WARNINGV("Cannot read the solver state from SQP checkpoint %s",path.c_str())
+    _info=PBDArticulatedGradientInfo<T>();
+    _sol=QCQPSolverQPOASES<T>();
+    return false;
+  }
+  done=doneFile;
+  it=itFile;
+  x=xFile;
+  alpha=alphaFile;
+  rho=rhoFile;
+  reg=regFile;
+  xBest=xBestFile;
+  EBest=EBestFile;
+  itBest=itBestFile;
+  QInfBest=QInfBestFile;
+  return true;
+}
+template <typename T>
+std::vector<typename GraspPlanner<T>::Vec> GraspPlanner<T>::optimizeMultiStart(const std::vector<Vec>& inits,PointCloudObject<T>& object,const GraspPlannerParameter& ops,std::vector<sizeType>* nrIter,std::vector<T>* QInf) const
+{
+  std::vector<Vec> xs(inits.size());
+  if(nrIter)
+    nrIter->assign(inits.size(),0);
+  if(QInf)
+    QInf->assign(inits.size(),-std::numeric_limits<T>::infinity());
+  //each start optimizes on its own copy of the planner, the per-run state (_objs,_info,_sol,_A/_b/_l/_u padding)
+  //is private to that copy, while the environments (_env is a vector of shared_ptr, _envLazy is shared), the body geometry and
+  //the object (with its BVH) are only read and therefore shared by all starts
+  //mpfr keeps the default precision per thread, forward the caller's
+  mpfr_prec_t prec=mpfr_get_default_prec();
+  //the coarse levels are built once here, the starts only read them
+  object.buildLevels(ops._levels,ops._levelRatio);
+  //the time budget is a deadline for all starts, a start waiting for a thread gets what is left of it
+  std::chrono::steady_clock::time_point beg=std::chrono::steady_clock::now();
+  sizeType nrT=std::min<sizeType>(OmpSettings::getOmpSettings().nrThreads(),(sizeType)inits.size());
+  OMP_PARALLEL_FOR_DYNAMIC_X(nrT)
+  for(sizeType i=0; i<(sizeType)inits.size(); i++) {
+    mpfr_set_default_prec(prec);
+    GraspPlanner<T> planner(*this);
+    GraspPlannerParameter param=ops;
+    param._telemetry=SQPTelemetry::suffixPath(ops._telemetry,"_start"+std::to_string(i));
+    param._checkpoint=SQPTelemetry::suffixPath(ops._checkpoint,"_start"+std::to_string(i));
+    if(ops._timeBudget>0)
+      param._timeBudget=std::max<scalarD>(ops._timeBudget-std::chrono::duration<scalarD>(std::chrono::steady_clock::now()-beg).count(),std::numeric_limits<scalarD>::min());
+    sizeType it=0;
+    xs[i]=planner.optimize(false,inits[i],object,param,&it);
+    if(nrIter)
+      nrIter->at(i)=it;
+    if(xs[i].size()==0) {
+      WARNINGV("Start %d failed (invalid configuration)",i)
+      continue;
+    }
+    if(QInf) {
+      Vec x=xs[i];
+      param._metric=Q_INF;
+      QInf->at(i)=planner.evaluateQInf(x,object,param);
+    }
+  }
+  return xs;
+}
+template <typename T>
 bool GraspPlanner<T>::solveDenseQP(Vec& d, const Vec& x,const Vec& g,MatT& h,const Vec* c,const MatT* cjac,T TR,T rho)
 {
+  PROFILE_SCOPE("GraspPlanner::solveQP")
   scalarD maxConditionNumber=1e5f,minDiagonalValue=1e-5f;
   Eigen::SelfAdjointEigenSolver<Matd> eig(h.unaryExpr([&](const T& in) {
     return (scalarD)std::to_double(in);
@@ -410,6 +771,7 @@ bool GraspPlanner<T>::solveDenseQP(Vec& d, const Vec& x,const Vec& g,MatT& h,con
 template <typename T>
 bool GraspPlanner<T>::solveSparseQP(Vec& d,const Vec& x,const Vec& g,SMat& h,const Vec* c,const SMat* cjac,T TR,T rho,T& reg)
 {
+  PROFILE_SCOPE("GraspPlanner::solveQP")
   scalarD maxRegularization=1e5f,regInc=10.0f,regDec=0.9f;
   SMat Id=MatT::Identity(h.rows(),h.cols()).sparseView();
 
@@ -451,6 +813,7 @@ bool GraspPlanner<T>::solveSparseQP(Vec& d,const Vec& x,const Vec& g,SMat& h,con
 template <typename T>
 bool GraspPlanner<T>::assemble(Vec x,bool update,T& e,Vec* g,MatT* h,Vec* c,MatT* cjac)
 {
+  PROFILE_SCOPE("GraspPlanner::assemble")
   x=_A*x+_b;
   sizeType nCons=_objs.values();
   ParallelMatrix<Mat3XT> G;
@@ -467,6 +830,7 @@ bool GraspPlanner<T>::assemble(Vec x,bool update,T& e,Vec* g,MatT* h,Vec* c,MatT
   bool valid=true;
   for(typename std::unordered_map<std::string,std::shared_ptr<DSSQPObjectiveComponent<T>>>::const_iterator beg=_objs.components().begin(),end=_objs.components().end(); beg!=end; beg++) {
     beg->second->setUpdateCache(x,update);
+    ProfileScope scope(beg->second->_name);
     // std::cout << beg->second->_name << " " << std::dynamic_pointer_cast<ArticulatedObjective<T>>(beg->second)->operator()(x,E,g?&G:NULL,h?&H:NULL,g,h) << std::endl;
     // std::cout << "E value" << E.getValue() << std::endl;
     if(std::dynamic_pointer_cast<ArticulatedObjective<T>>(beg->second)->operator()(x,E,g?&G:NULL,h?&H:NULL,g,h)<0) {
@@ -524,6 +888,7 @@ bool GraspPlanner<T>::assemble(Vec x,bool update,T& e,Vec* g,MatT* h,Vec* c,MatT
 template <typename T>
 bool GraspPlanner<T>::assemble(Vec x,bool update,T& e,Vec* g,SMat* h,Vec* c,SMat* cjac)
 {
+  PROFILE_SCOPE("GraspPlanner::assemble")
   x=_A*x+_b;
   sizeType nCons=_objs.values();
   ParallelMatrix<Mat3XT> G;
@@ -540,6 +905,7 @@ bool GraspPlanner<T>::assemble(Vec x,bool update,T& e,Vec* g,SMat* h,Vec* c,SMat
   bool valid=true;
   for(typename std::unordered_map<std::string,std::shared_ptr<DSSQPObjectiveComponent<T>>>::const_iterator beg=_objs.components().begin(),end=_objs.components().end(); beg!=end; beg++) {
     beg->second->setUpdateCache(x,update);
+    ProfileScope scope(beg->second->_name);
     if(std::dynamic_pointer_cast<ArticulatedObjective<T>>(beg->second)->operator()(x,E,g?&G:NULL,h?&H:NULL,g,h)<0) {
       valid=false;
       break;
@@ -591,15 +957,94 @@ typename GraspPlanner<T>::Vec GraspPlanner<T>::optimizeSQP(Vec x,GraspPlannerPar
   T dNorm,cNorm,cNorm2,alphaDec=0.5f,alphaInc=1.5f,coefWolfe=0.1f,alpha=1,rho=ops._rho0,gamma=0.1f,reg=0;
   _gl=_objs.gl(),_gu=_objs.gu();
   bool tmpUseGJK=ops._useGJK;
+  //anytime mode: the feasible iterate of lowest energy so far
+  Vec xBest;
+  T EBest=std::numeric_limits<T>::infinity(),QInfBest=-std::numeric_limits<T>::infinity();
+  sizeType itBest=-1;
+  //checkpoint: a finished optimization returns its result, otherwise the loop continues from the stored iteration
+  bool resumed=false,done=false;
+  sizeType itBeg=0;
+  if(!ops._checkpoint.empty() && ops._resume && readCheckpoint(ops._checkpoint,x,itBeg,alpha,rho,reg,done,xBest,EBest,itBest,QInfBest)) {
+    INFOV("Resuming from SQP checkpoint %s at iteration %d%s",ops._checkpoint.c_str(),itBeg,done?" (finished)":"")
+    if(done) {
+      it=itBeg;
+      return x;
+    }
+    resumed=true;
+  }
+  //telemetry, the phase times are measured even if no file is written,
+  //a resumed run appends, repeating the iterations done after the checkpoint it resumes from
+  SQPTelemetry telemetry(ops._telemetry,resumed);
+  SQPTelemetryRow row;
+  std::function<void(const char*)> record=[&](const char* status) {
+    row._status=status;
+    row._rho=std::to_double(rho);
+    row._reg=std::to_double(reg);
+    row._time=telemetry.elapsed();
+    telemetry.write(row);
+  };
+  //the Q_INF of the best iterate is compared with the target on the object of the objectives
+  bool anytime=ops._timeBudget>0 || ops._targetQInf>0;
+  bool targetReached=ops._targetQInf>0 && xBest.size()>0 && QInfBest>=ops._targetQInf;
+  const PointCloudObject<T>* object=NULL;
+  for(const std::pair<std::string,std::shared_ptr<DSSQPObjectiveComponent<T>>>& p:_objs.components())
+    if(std::dynamic_pointer_cast<ArticulatedObjective<T>>(p.second))
+      object=&(std::dynamic_pointer_cast<ArticulatedObjective<T>>(p.second)->object());
+  std::function<void(const Vec&,T,const Vec&)> track=[&](const Vec& xk,T ek,const Vec& ck) {
+    if(!anytime || ek>=EBest || -ck.cwiseMin(0).sum()>=ops._thres)
+      return;
+    xBest=xk;
+    EBest=ek;
+    itBest=it;
+    if(ops._targetQInf>0 && object) {
+      MatT xs=(_A*xk+_b).segment(0,_body.nrDOF()).transpose();
+      QInfBest=evaluateBatch(xs,*object,ops)(0,1);
+      targetReached=QInfBest>=ops._targetQInf;
+    }
+  };
+  //a failed optimization also returns the best feasible iterate in anytime mode
+  std::function<Vec(const Vec&)> finish=[&](const Vec& ret) {
+    Vec xRet=anytime && xBest.size()>0?xBest:ret;
+    if(anytime) {
+      INFOV("Anytime: %fs used of a budget of %fs, best feasible iterate %d (E=%f, Q_INF=%f)",
+            telemetry.elapsed(),ops._timeBudget,itBest,std::to_double(EBest),std::to_double(QInfBest))
+    }
+    if(!ops._checkpoint.empty())
+      writeCheckpoint(ops._checkpoint,xRet,it,alpha,rho,reg,true,xBest,EBest,itBest,QInfBest);
+    return xRet;
+  };
 
-  for(it=0; it<ops._maxIter; it++) {
+  for(it=itBeg; it<ops._maxIter; it++) {
+    bool save=!ops._checkpoint.empty() && (it==itBeg?!resumed:ops._checkpointInterval>0 && it%ops._checkpointInterval==0);
+    if(save)
+      writeCheckpoint(ops._checkpoint,x,it,alpha,rho,reg,false,xBest,EBest,itBest,QInfBest);
+    row=SQPTelemetryRow();
+    row._it=it;
+    telemetry.lap();
+    if(targetReached) {
+      if(ops._callback) {
+        INFOV("Iter=%d succeed(Q_INF=%f>=targetQInf=%f)",it,std::to_double(QInfBest),ops._targetQInf)
+      }
+      record("target_reached");
+      break;
+    }
+    if(ops._timeBudget>0 && telemetry.elapsed()>=ops._timeBudget) {
+      if(ops._callback) {
+        INFOV("Iter=%d stopped(time budget %fs used)",it,ops._timeBudget)
+      }
+      record("time_budget");
+      break;
+    }
     if(ops._sparse) {
       if(!assemble(x,true,e,&g,&hS,&c,&cjacS)) {
         if(ops._callback) {
           INFOV("Iter=%d failed(invalid configuration)",it)
         }
-        return Vec::Zero(0);
+        row._timeAssemble=telemetry.lap();
+        record("invalid_configuration");
+        return finish(Vec::Zero(0));
       }
+      row._timeAssemble=telemetry.lap();
       if(reg==0)
         reg=std::max<T>(1e-3f,hS.toDense().diagonal().unaryExpr([&](const T& in) {
         return (scalarD)std::abs(in);
@@ -608,6 +1053,9 @@ typename GraspPlanner<T>::Vec GraspPlanner<T>::optimizeSQP(Vec x,GraspPlannerPar
         if(ops._callback) {
           INFOV("Iter=%d failed(qp failed)",it)
         }
+        row._timeQP=telemetry.lap();
+        row._E=std::to_double(e);
+        record("qp_failed");
         break;
       }
     } else {
@@ -615,22 +1063,34 @@ typename GraspPlanner<T>::Vec GraspPlanner<T>::optimizeSQP(Vec x,GraspPlannerPar
         if(ops._callback) {
           INFOV("Iter=%d failed(invalid configuration)",it)
         }
-        return Vec::Zero(0);
+        row._timeAssemble=telemetry.lap();
+        record("invalid_configuration");
+        return finish(Vec::Zero(0));
       }
+      row._timeAssemble=telemetry.lap();
       if(!solveDenseQP(d,x,g,hD,&c,&cjacD,0,0)) {
         if(ops._callback) {
           INFOV("Iter=%d failed(qp failed)",it)
         }
+        row._timeQP=telemetry.lap();
+        row._E=std::to_double(e);
+        record("qp_failed");
         break;
       }
     }
+    row._timeQP=telemetry.lap();
     //termination & callback
     dNorm=std::sqrt(d.squaredNorm());
     cNorm=-c.cwiseMin(0).sum();
+    row._E=std::to_double(e);
+    row._dNorm=std::to_double(dNorm);
+    row._cNorm=std::to_double(cNorm);
+    track(x,e,c);
     if(dNorm<ops._thres && cNorm<ops._thres) {
       if(ops._callback) {
         INFOV("Iter=%d succeed(dNorm=%f<thres=%f,cNorm=%f<thres=%f)",it,std::to_double(dNorm),std::to_double(ops._thres),std::to_double(cNorm),std::to_double(ops._thres))
       }
+      record("converged");
       break;
     } else if(ops._callback) {
       INFOV("Iter=%d E=%f dNorm=%f cNorm=%f alpha=%f rho=%f",it,std::to_double(e),std::to_double(dNorm),std::to_double(cNorm),std::to_double(alpha),std::to_double(rho))
@@ -649,10 +1109,30 @@ typename GraspPlanner<T>::Vec GraspPlanner<T>::optimizeSQP(Vec x,GraspPlannerPar
         }
     }
     //line search
+    const char* status="accept";
     m=e+cNorm*rho;
     ops._useGJK=true;
+    //the first trial is usually accepted and computes its own forward kinematics, after a rejection those of
+    //the next _lineSearchBatch step lengths are computed together and handed to the objectives through _info,
+    //whose cache then matches the trial configuration
+    PBDArticulatedBatchInfo<T> ladder;
+    sizeType trial=0;
     while(alpha>ops._alphaThres) {
+      row._lineSearchTrials++;
       xTmp=x+d*alpha;
+      if(ops._lineSearchBatch>1 && trial>0) {
+        if((trial-1)%ops._lineSearchBatch==0) {
+          MatT xs(_body.nrDOF(),ops._lineSearchBatch);
+          T alphaLadder=alpha;
+          for(sizeType k=0; k<xs.cols(); k++,alphaLadder*=alphaDec) {
+            Vec xLadder=x+d*alphaLadder;
+            xs.col(k)=(_A*xLadder+_b).segment(0,_body.nrDOF());
+          }
+          ladder.reset(_body,xs);
+        }
+        _info.reset(_body,ladder,(trial-1)%ops._lineSearchBatch);
+      }
+      trial++;
       if(!assemble(xTmp,false,e2,(Vec*)NULL,(DMat*)NULL,&c2)) {
         alpha*=alphaDec;
         continue;
@@ -664,6 +1144,7 @@ typename GraspPlanner<T>::Vec GraspPlanner<T>::optimizeSQP(Vec x,GraspPlannerPar
         alpha*=alphaDec;
         continue;
       } else {
+        row._alpha=std::to_double(alpha);
         alpha=std::min<T>(alpha*alphaInc,1);
         // alpha *= alphaInc;
         xTmpTmp=xTmp;
@@ -676,11 +1157,16 @@ typename GraspPlanner<T>::Vec GraspPlanner<T>::optimizeSQP(Vec x,GraspPlannerPar
       if(ops._callback) {
         INFOV("Iter=%d failed(alpha=%f<alphaThres=%f)",it,std::to_double(alpha),std::to_double(ops._alphaThres))
       }
+      row._timeLineSearch=telemetry.lap();
+      row._alpha=std::to_double(alpha);
+      record("line_search_failed");
       break;
     }
     if(!assemble(xTmpTmp,false,e2,(Vec*)NULL,(DMat*)NULL,&c2)) {
       std::cout << "Cannot use GJK.\n Redoing the line search..." << std::endl;
+      status="reject";
       while(alpha>ops._alphaThres) {
+        row._lineSearchTrials++;
         xTmp=x+d*alpha;
         if(!assemble(xTmp,false,e2,(Vec*)NULL,(DMat*)NULL,&c2)) {
           alpha*=alphaDec;
@@ -693,6 +1179,8 @@ typename GraspPlanner<T>::Vec GraspPlanner<T>::optimizeSQP(Vec x,GraspPlannerPar
           alpha*=alphaDec;
           continue;
         } else {
+          row._alpha=std::to_double(alpha);
+          status="accept_retry";
           alpha=std::min<T>(alpha*alphaInc,1);
           // alpha *= alphaInc;
           x=xTmp;
@@ -702,6 +1190,7 @@ typename GraspPlanner<T>::Vec GraspPlanner<T>::optimizeSQP(Vec x,GraspPlannerPar
       }
     }
     else x=xTmpTmp;
+    row._timeLineSearch=telemetry.lap();
     //update plane
     for(const std::pair<std::string,std::shared_ptr<DSSQPObjectiveComponent<T>>>& p:_objs.components()) {
       std::shared_ptr<ConvexLogBarrierSelfEnergy<T>> ESelf=std::dynamic_pointer_cast<ConvexLogBarrierSelfEnergy<T>>(p.second);
@@ -711,17 +1200,20 @@ typename GraspPlanner<T>::Vec GraspPlanner<T>::optimizeSQP(Vec x,GraspPlannerPar
     }
     if(!assemble(x,false,e2,(Vec*)NULL,(DMat*)NULL,&c2)) {
       std::cout << "after updating plane goes wrong" << std::endl;
-    }
+    } else track(x,e2,c2);
+    row._timeAssemble+=telemetry.lap();
+    record(status);
   }
-  return x;
+  return finish(x);
 }
 template <typename T>
-void GraspPlanner<T>::evaluateQInf( Vec& x, PointCloudObject<T>& object,GraspPlannerParameter& ops)
+T GraspPlanner<T>::evaluateQInf( Vec& x, PointCloudObject<T>& object,GraspPlannerParameter& ops)
 {
   _objs=DSSQPObjectiveCompound<T>();
   _info=PBDArticulatedGradientInfo<T>();
   ParallelMatrix<T> E(0);
-  _objs.addComponent(std::shared_ptr<ArticulatedObjective<T>>(new MetricEnergy<T>(_objs,_info,*this,object,ops._d0,ops._alpha,ops._coefM,(METRIC_TYPE)ops._metric,(METRIC_ACTIVATION)ops._activation,_rad*ops._normalExtrude)));
+  std::shared_ptr<MetricEnergy<T>> metric(new MetricEnergy<T>(_objs,_info,*this,object,ops._d0,ops._alpha,ops._coefM,(METRIC_TYPE)ops._metric,(METRIC_ACTIVATION)ops._activation,_rad*ops._normalExtrude,ops._metricTol));
+  _objs.addComponent(metric);
   sizeType nAdd=_objs.inputs()-x.size();
   if(nAdd>0) {
     x=concat<Vec,Vec>(x,Vec::Zero(nAdd));
@@ -737,8 +1229,62 @@ void GraspPlanner<T>::evaluateQInf( Vec& x, PointCloudObject<T>& object,GraspPla
 
 //    std::cout << beg->second->_name << " " << std::dynamic_pointer_cast<ArticulatedObjective<T>>(beg->second)->Quality(x)<< std::endl;
   }
-
-
+  T quality=metric->Quality(x);
+  //restore the system, so that the planner can be reused
+  if(nAdd>0) {
+    _b=_b.segment(0,_b.size()-nAdd).eval();
+    _A=_A.block(0,0,_A.rows()-nAdd,_A.cols()-nAdd).eval();
+    _l=_l.segment(0,_l.size()-nAdd).eval();
+    _u=_u.segment(0,_u.size()-nAdd).eval();
+  }
+  return quality;
+}
+template <typename T>
+typename GraspPlanner<T>::MatT GraspPlanner<T>::evaluateBatch(const MatT& xs,const PointCloudObject<T>& object,const GraspPlannerParameter& ops) const
+{
+  PROFILE_SCOPE("GraspPlanner::evaluateBatch")
+  ASSERT_MSGV(xs.cols()==_body.nrDOF() || xs.cols()>=_A.cols(),"Configurations have %d values, expected %d (full) or at least %d (reduced)",(sizeType)xs.cols(),_body.nrDOF(),(sizeType)_A.cols())
+  MatT ret=MatT::Zero(xs.rows(),5);
+  //rows are full configurations or reduced ones (optimizer outputs), which are mapped through the mimic joints,
+  //the forward kinematics of all rows are computed together
+  MatT xsFull(_body.nrDOF(),xs.rows());
+  for(sizeType i=0; i<xs.rows(); i++) {
+    Vec x=xs.row(i).transpose();
+    if(x.size()!=_body.nrDOF())
+      x=_A*x.segment(0,_A.cols())+_b;
+    xsFull.col(i)=x;
+  }
+  PBDArticulatedBatchInfo<T> batch(_body,xsFull);
+  //the planner, the object and its precomputation are shared, each configuration has its own energies,
+  //all of which use the same forward kinematics in info
+  //mpfr keeps the default precision per thread, forward the caller's
+  mpfr_prec_t prec=mpfr_get_default_prec();
+  sizeType nrT=std::max<sizeType>(std::min<sizeType>(OmpSettings::getOmpSettings().nrThreads(),xs.rows()),1);
+  OMP_PARALLEL_FOR_DYNAMIC_X(nrT)
+  for(sizeType i=0; i<xs.rows(); i++) {
+    mpfr_set_default_prec(prec);
+    DSSQPObjectiveCompound<T> objs;
+    PBDArticulatedGradientInfo<T> info;
+    T alpha=ops._alpha,inf=std::numeric_limits<T>::infinity();
+    bool useGJK=ops._useGJK;
+    Vec x=batch.x(i);
+    info.reset(_body,batch,i);
+    MetricEnergy<T> metric(objs,info,*this,object,ops._d0,alpha,1,Q_1,(METRIC_ACTIVATION)ops._activation,_rad*ops._normalExtrude,ops._metricTol);
+    LogBarrierObjEnergy<T> EObj(objs,info,*this,object,_rad*ops._d0,1,useGJK);
+    ConvexLogBarrierSelfEnergy<T> ESelf(objs,info,*this,object,_rad*ops._d0,1);
+    metric.setUpdateCache(x,true);
+    EObj.setUpdateCache(x,true);
+    ESelf.setUpdateCache(x,true);
+    Vec w=metric.weights();
+    ret(i,0)=object.computeQ1(w);
+    ret(i,1)=object.computeQInf(w);
+    ParallelMatrix<T> E(0);
+    ret(i,2)=EObj(x,E,NULL,NULL,(Vec*)NULL,(STrips*)NULL)<0?inf:E.getValue();
+    E.assign(0);
+    ret(i,3)=ESelf(x,E,NULL,NULL,(Vec*)NULL,(STrips*)NULL)<0?inf:E.getValue();
+    ret(i,4)=(T)(sizeType)ESelf.inseparable().size();
+  }
+  return ret;
 }
 template <typename T>
 void GraspPlanner<T>::debugSystem(const Vec& x)
@@ -10,6 +10,7 @@
 #include <Optimizer/QCQPSolverQPOASES.h>
 #include <Utils/ParallelVector.h>
 #include <Utils/Options.h>
+#include <CommonFile/Hash.h>
 
 PRJ_BEGIN
 
@@ -23,22 +24,46 @@ struct GraspPlannerParameter
   //data
   scalarD _d0;
   scalarD _alpha;
+  //relative activation below which a hand sample does not contribute to the contact weight of Q_1/Q_INF/Q_INF_BARRIER, 0 for all pairs
+  scalarD _metricTol;
   sizeType _metric,_activation;
   scalarD _normalExtrude;
   scalarD _FGTThres;
+  bool _FGTIncremental;
   scalarD _coefM;
   scalarD _coefOC;
   scalarD _coefCC;
   scalarD _coefO;
   scalarD _coefS;
   bool _useGJK;
+  //skin margin (relative to rad like d0) of the hand-object pair list, which is rebuilt only when a link moves farther
+  scalarD _skin;
+  //coarse-to-fine: number of coarse object levels, their radius ratio, and the iterations/threshold after which
+  //a coarse level hands over to the next finer one, the full object always runs last with _maxIter and _thres
+  sizeType _levels;
+  scalarD _levelRatio;
+  sizeType _levelIter;
+  scalarD _levelThres;
   //solver
   scalarD _rho0;
   scalarD _thres;
   scalarD _alphaThres;
+  //number of backtracking step lengths whose forward kinematics are computed together once the first trial is rejected, 1 to compute them one at a time
+  sizeType _lineSearchBatch;
   bool _callback;
   bool _sparse;
   sizeType _maxIter;
+  //anytime mode: wall-clock budget in seconds of optimize (shared by its levels) and a Q_INF after which it stops, <=0 for none,
+  //with either set the best feasible iterate (constraint violation below _thres, lowest energy) is returned instead of the last one
+  scalarD _timeBudget;
+  scalarD _targetQInf;
+  //per-iteration telemetry file (.jsonl or .csv), empty to disable
+  std::string _telemetry;
+  //binary checkpoint of optimizeSQP written every _checkpointInterval iterations and when it returns, empty to disable,
+  //_resume continues from it (a finished optimization returns its result right away)
+  std::string _checkpoint;
+  sizeType _checkpointInterval;
+  bool _resume;
 };
 template <typename T>
 struct PBDArticulatedGradientInfo;
@@ -59,6 +84,10 @@ public:
   void fliterSample(std::function<bool(sizeType lid,const Vec3T& p,const Vec3T& n)> f);
   bool read(std::istream& is,IOData* dat) override;
   bool write(std::ostream& os,IOData* dat) const override;
+  //memory-mapped SectionFile: the environments are loaded on first access,
+  //readMapped falls back to SerializableBase::read for files in the stream format
+  bool readMapped(const std::string& path);
+  bool writeMapped(const std::string& path) const;
   std::shared_ptr<SerializableBase> copy() const override;
   std::string type() const override;
   ArticulatedBody& body();
@@ -66,17 +95,26 @@ public:
   const Environment<T>& env(sizeType jid) const;
   const ObjMeshGeomCellExact& dist(sizeType jid) const;
   const std::vector<std::pair<Mat3XT,Mat3XT>>& pnss() const;
+  //self-collision index: the link pairs (i<j) whose boxes, enlarged by margin, overlap in one of nrSample configurations
+  //sampled within the joint limits, each with a separating plane at the reference configuration in the frame of link i
+  //(zero if the links are not separable there), ConvexLogBarrierSelfEnergy only considers these pairs when the index is not empty
+  void buildSelfIndex(sizeType nrSample,T margin);
+  const std::unordered_map<Vec2i,Vec4T,Hash>& selfIndex() const;
   void writeVTK(const Vec& x,const std::string& path,T len) const;
   void writeLocalVTK(const std::string& path,T len) const;
   void writeLimitsVTK(const std::string& path) const;
   //optimize
-  Vec optimize(bool debug,const Vec& init,PointCloudObject<T>& object,GraspPlannerParameter& ops);
+  Vec optimize(bool debug,const Vec& init,PointCloudObject<T>& object,GraspPlannerParameter& ops,sizeType* nrIter=NULL);
+  std::vector<Vec> optimizeMultiStart(const std::vector<Vec>& inits,PointCloudObject<T>& object,const GraspPlannerParameter& ops,std::vector<sizeType>* nrIter=NULL,std::vector<T>* QInf=NULL) const;
   bool solveDenseQP(Vec& d,const Vec& x,const Vec& g,MatT& h,const Vec* c,const MatT* cjac,T TR,T rho);
   bool solveSparseQP(Vec& d,const Vec& x,const Vec& g,SMat& h,const Vec* c,const SMat* cjac,T TR,T rho,T& reg);
   bool assemble(Vec x,bool update,T& e,Vec* g=NULL,MatT* h=NULL,Vec* c=NULL,MatT* cjac=NULL);
   bool assemble(Vec x,bool update,T& e,Vec* g=NULL,SMat* h=NULL,Vec* c=NULL,SMat* cjac=NULL);
   Vec optimizeSQP(Vec x,GraspPlannerParameter& ops,sizeType& it);
-  void evaluateQInf( Vec& x,PointCloudObject<T>& object,GraspPlannerParameter& ops);
+  T evaluateQInf( Vec& x,PointCloudObject<T>& object,GraspPlannerParameter& ops);
+  //scores every configuration (a row of xs) in parallel, each row of the result holds
+  //Q_1, Q_INF, the hand-object barrier (infinite when penetrating), the self-collision barrier and the number of colliding link pairs
+  MatT evaluateBatch(const MatT& xs,const PointCloudObject<T>& object,const GraspPlannerParameter& ops) const;
   void debugSystem(const Vec& x);
   const SMat& A() const;
   const Vec& b() const;
@@ -84,7 +122,14 @@ public:
   T rad() const;
   bool validSample(sizeType l,const PBDArticulatedGradientInfo<T>& info,const Vec3T& p) const;
 protected:
+  void initObjectives(const PointCloudObject<T>& object,const GraspPlannerParameter& ops);
+  //the iterate and the state of the SQP loop (including the best iterate of anytime mode), of _info, of every objective and the working set of the last QP
+  bool writeCheckpoint(const std::string& path,const Vec& x,sizeType it,T alpha,T rho,T reg,bool done,const Vec& xBest,T EBest,sizeType itBest,T QInfBest) const;
+  bool readCheckpoint(const std::string& path,Vec& x,sizeType& it,T& alpha,T& rho,T& reg,bool& done,Vec& xBest,T& EBest,sizeType& itBest,T& QInfBest);
+  const std::vector<std::shared_ptr<Environment<T>>>& envs() const;
   std::vector<std::shared_ptr<Environment<T>>> _env;
+  //environments of a mapped file not loaded yet, they replace _env when set
+  std::shared_ptr<LazySection<std::vector<std::shared_ptr<Environment<T>>>>> _envLazy;
   PBDArticulatedGradientInfo<T> _info;
   DSSQPObjectiveCompound<T> _objs;
   ArticulatedBody _body;
@@ -94,6 +139,7 @@ protected:
   Vec _b,_l,_u,_gl,_gu;
   //sampled points
   PNSS _pnss;
+  std::unordered_map<Vec2i,Vec4T,Hash> _selfIndex;
   T _rad;
 };
 
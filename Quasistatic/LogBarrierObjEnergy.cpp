@@ -1,28 +1,94 @@
+#include <Utils/Scalar.h>
 #include "LogBarrierObjEnergy.h"
 #include "GraspPlanner.h"
 #include <Utils/CLog.h>
 #include <Environment/ConvexHullExact.h>
 #include <Environment/ObjMeshGeomCellExact.h>
 #include <Articulated/MultiPrecisionSeparatingPlane.h>
+#include <CommonFile/Profiler.h>
+#include <algorithm>
 #include <stack>
 
 USE_PRJ_NAMESPACE
 
 template <typename T>
-LogBarrierObjEnergy<T>::LogBarrierObjEnergy(DSSQPObjectiveCompound<T>& obj,const PBDArticulatedGradientInfo<T>& info,const GraspPlanner<T>& planner,const PointCloudObject<T>& object,T d0,T mu,const bool& useGJK)
+LogBarrierObjEnergy<T>::LogBarrierObjEnergy(DSSQPObjectiveCompound<T>& obj,const PBDArticulatedGradientInfo<T>& info,const GraspPlanner<T>& planner,const PointCloudObject<T>& object,T d0,T mu,const bool& useGJK,T skin)
   :ArticulatedObjective<T>(obj,"LogBarrierObjEnergy(d0="+std::to_string(d0)+",mu="+std::to_string(mu)+")",info,planner,object),
-   _useGJK(useGJK),_updateCache(false),_d0(d0),_d1(d0/2),_mu(mu) {}
+   _useGJK(useGJK),_updateCache(false),_d0(d0),_d1(d0/2),_mu(mu),_skin(skin) {}
 template <typename T>
 int LogBarrierObjEnergy<T>::operator()(const Vec&,ParallelMatrix<T>& e,ParallelMatrix<Mat3XT>* g,ParallelMatrix<Mat12XT>* h,Vec*,STrips*)
+{
+  if(needUpdatePairs()) {
+    PROFILE_SCOPE("LogBarrierObjEnergy::BVH")
+    updatePairs();
+  }
+  //compute derivative
+  PROFILE_SCOPE("LogBarrierObjEnergy::terms")
+  bool valid=true;
+  _feats.resize(_pairs.size());
+  if(std::is_same<T,mpfr::mpreal>::value) {
+    for(sizeType i=0; i<(sizeType)_pairs.size(); i++)
+      addTerm(valid,_pairs[i],_feats[i],e,g,h);
+  } else {
+    OMP_PARALLEL_FOR_
+    for(sizeType i=0; i<(sizeType)_pairs.size(); i++)
+      addTerm(valid,_pairs[i],_feats[i],e,g,h);
+  }
+  if(valid && _updateCache)
+    for(sizeType i=0; i<(sizeType)_pairs.size(); i++)
+      _cache[_pairs[i]]=_feats[i];
+  return valid?0:-1;
+}
+template <typename T>
+bool LogBarrierObjEnergy<T>::readState(std::istream& is)
+{
+  readBinaryData(_cache,is);
+  readBinaryData(_pairs,is);
+  readBinaryData(_pairTM,is);
+  return is.good();
+}
+template <typename T>
+bool LogBarrierObjEnergy<T>::writeState(std::ostream& os) const
+{
+  writeBinaryData(_cache,os);
+  writeBinaryData(_pairs,os);
+  writeBinaryData(_pairTM,os);
+  return os.good();
+}
+template <typename T>
+const std::vector<Vec2i,Eigen::aligned_allocator<Vec2i>>& LogBarrierObjEnergy<T>::pairs() const
+{
+  return _pairs;
+}
+template <typename T>
+bool LogBarrierObjEnergy<T>::needUpdatePairs() const
+{
+  const std::vector<Node<std::shared_ptr<StaticGeomCell>,BBox<scalar>>>& bvhHand=_planner.body().getGeom().getBVH();
+  if(_pairTM.cols()!=_info._TM.cols())
+    return true;
+  //a point p of link i moves by |(R'-R)*p+t'-t|<=|R'-R|_F*|p|+|t'-t|, |p| is bounded by the farthest corner of its local box
+  for(sizeType i=0; i<(sizeType)bvhHand.size(); i++)
+    if(bvhHand[i]._cell) {
+      scalarD rad=bvhHand[i]._bb._minC.cwiseAbs().cwiseMax(bvhHand[i]._bb._maxC.cwiseAbs()).template cast<scalarD>().norm();
+      scalarD dR=std::to_double((ROTI(_info._TM,i)-ROTI(_pairTM,i)).norm());
+      scalarD dT=std::to_double((CTRI(_info._TM,i)-CTRI(_pairTM,i)).norm());
+      if(dR*rad+dT>std::to_double(_skin))
+        return true;
+    }
+  return false;
+}
+template <typename T>
+void LogBarrierObjEnergy<T>::updatePairs()
 {
   const std::vector<Node<std::shared_ptr<StaticGeomCell>,BBox<scalar>>>& bvhHand=_planner.body().getGeom().getBVH();
   const std::vector<Node<sizeType,BBox<scalarD>>>& bvhObj=_object.getBVH();
   std::vector<KDOP18<scalar>> bbs=updateBVH();
   for(sizeType i=0; i<(sizeType)bbs.size(); i++)
-    bbs[i].enlarged(std::to_double(_d0));
+    bbs[i].enlarged(std::to_double(_d0+_skin));
   //loop
   std::stack<std::pair<sizeType,sizeType>> ss;
-  std::vector<Vec2i,Eigen::aligned_allocator<Vec2i>> pairs,feats;
+  _pairs.clear();
+  _pairTM=_info._TM;
   ss.push(std::make_pair((sizeType)bvhHand.size()-1,(sizeType)bvhObj.size()-1));
   while(!ss.empty()) {
     sizeType idHand=ss.top().first;
@@ -31,7 +97,7 @@ int LogBarrierObjEnergy<T>::operator()(const Vec&,ParallelMatrix<T>& e,ParallelM
     if(!bbs[idHand].intersect(bvhObj[idObj]._bb))
       continue;
     else if(bvhHand[idHand]._cell && bvhObj[idObj]._cell>=0)
-      pairs.push_back(Vec2i(idHand,bvhObj[idObj]._cell));
+      _pairs.push_back(Vec2i(idHand,bvhObj[idObj]._cell));
     else if(bvhHand[idHand]._cell) {
       ss.push(std::make_pair(idHand,bvhObj[idObj]._l));
       ss.push(std::make_pair(idHand,bvhObj[idObj]._r));
@@ -45,21 +111,10 @@ int LogBarrierObjEnergy<T>::operator()(const Vec&,ParallelMatrix<T>& e,ParallelM
       ss.push(std::make_pair(bvhHand[idHand]._r,bvhObj[idObj]._r));
     }
   }
-  //compute derivative
-  bool valid=true;
-  feats.resize(pairs.size());
-  if(std::is_same<T,mpfr::mpreal>::value) {
-    for(sizeType i=0; i<(sizeType)pairs.size(); i++)
-      addTerm(valid,pairs[i],feats[i],e,g,h);
-  } else {
-    OMP_PARALLEL_FOR_
-    for(sizeType i=0; i<(sizeType)pairs.size(); i++)
-      addTerm(valid,pairs[i],feats[i],e,g,h);
-  }
-  if(valid && _updateCache)
-    for(sizeType i=0; i<(sizeType)pairs.size(); i++)
-      _cache[pairs[i]]=feats[i];
-  return valid?0:-1;
+  //pairs of the same link are stored adjacently, so consecutive addTerm calls touch the same link data
+  std::sort(_pairs.begin(),_pairs.end(),[&](const Vec2i& a,const Vec2i& b) {
+    return a[0]<b[0] || (a[0]==b[0] && a[1]<b[1]);
+  });
 }
 template <typename T>
 void LogBarrierObjEnergy<T>::setUpdateCache(const Vec& x,bool update)
@@ -16,15 +16,24 @@ public:
   using ArticulatedObjective<T>::_planner;
   using ArticulatedObjective<T>::_object;
   using ArticulatedObjective<T>::_info;
-  LogBarrierObjEnergy(DSSQPObjectiveCompound<T>& obj,const PBDArticulatedGradientInfo<T>& info,const GraspPlanner<T>& planner,const PointCloudObject<T>& object,T d0,T mu,const bool& useGJK);
+  LogBarrierObjEnergy(DSSQPObjectiveCompound<T>& obj,const PBDArticulatedGradientInfo<T>& info,const GraspPlanner<T>& planner,const PointCloudObject<T>& object,T d0,T mu,const bool& useGJK,T skin=0);
   virtual int operator()(const Vec& x,ParallelMatrix<T>& e,ParallelMatrix<Mat3XT>* g,ParallelMatrix<Mat12XT>* h,Vec* fgrad,STrips* fhess) override;
   virtual void setUpdateCache(const Vec& x,bool update) override;
+  virtual bool readState(std::istream& is) override;
+  virtual bool writeState(std::ostream& os) const override;
+  const std::vector<Vec2i,Eigen::aligned_allocator<Vec2i>>& pairs() const;
 protected:
+  bool needUpdatePairs() const;
+  void updatePairs();
   void addTerm(bool& valid,const Vec2i& termId,Vec2i& feat,ParallelMatrix<T>& e,ParallelMatrix<Mat3XT>* g,ParallelMatrix<Mat12XT>* h) const;
   std::unordered_map<Vec2i,Vec2i,Hash> _cache;
+  //Verlet list of (link,object leaf) pairs whose boxes, enlarged by d0+skin, overlap at the link transforms _pairTM,
+  //reused until some link has moved by more than skin since then
+  std::vector<Vec2i,Eigen::aligned_allocator<Vec2i>> _pairs,_feats;
+  Mat3XT _pairTM;
   const bool& _useGJK;
   bool _updateCache;
-  T _d0,_d1,_mu;
+  T _d0,_d1,_mu,_skin;
 };
 
 PRJ_END
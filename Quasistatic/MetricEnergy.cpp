@@ -1,14 +1,15 @@
 #include "MetricEnergy.h"
 #include "GraspPlanner.h"
+#include <algorithm>
 #include <stack>
 
 USE_PRJ_NAMESPACE
 
 template <typename T>
 MetricEnergy<T>::MetricEnergy(DSSQPObjectiveCompound<T>& obj,const PBDArticulatedGradientInfo<T>& info,const GraspPlanner<T>& planner,const PointCloudObject<T>& object,
-                              T d0,const T& alpha,T coef,METRIC_TYPE m,METRIC_ACTIVATION a,T normalExtrude)
+                              T d0,const T& alpha,T coef,METRIC_TYPE m,METRIC_ACTIVATION a,T normalExtrude,T tol)
   :ArticulatedObjective<T>(obj,"MetricEnergy(d0="+std::to_string(d0)+",alpha="+std::to_string(alpha)+",coef="+std::to_string(coef)+",type="+std::to_string(m)+")",info,planner,object),
-   _d0(d0),_coef(coef),_alpha(alpha),_type(m),_activation(a),_pss(object.pss(normalExtrude))
+   _d0(d0),_coef(coef),_tol(tol),_alpha(alpha),_type(m),_activation(a),_pss(object.pss(normalExtrude)),_cutoff(-1)
 {
   if(_type==Q_INF_BARRIER || _type==Q_INF_CONSTRAINT || _type==Q_INF_CONSTRAINT_FGT)
     _off=obj.addVar("r",-DSSQPObjective<T>::infty(),DSSQPObjective<T>::infty(),DSSQPObjectiveCompound<T>::MUST_NEW)._id;
@@ -18,56 +19,37 @@ template <typename T>
 int MetricEnergy<T>::operator()(const Vec& x,ParallelMatrix<T>& e,ParallelMatrix<Mat3XT>* g,ParallelMatrix<Mat12XT>* h,Vec* fgrad,STrips*)
 {
   T area=_planner.area();
-  Vec w=Vec::Zero(_object.gij().rows());
-//  std::cout << "gij min = " << _object.gij().minCoeff() <<std::endl;
-  //point on object
-  for(sizeType k=0; k<_pss.cols(); k++) {
-    const Vec3T po=_pss.col(k);
-    //point on hand
-    for(sizeType i=0; i<_planner.body().nrJ(); i++) {
-      //point on link i
-      const std::pair<Mat3XT,Mat3XT>& pn=_planner.pnss()[i];
-      Mat3XT p=ROTI(_info._TM,i)*pn.first+CTRI(_info._TM,i)*Vec::Ones(pn.first.cols()).transpose();
-      for(sizeType j=0; j<p.cols(); j++) {
-        T len=std::sqrt((p.col(j)-po).squaredNorm());
-        w[k]+=activation(len)*area;
-      }
-    }
-    if (w[k] < 0) 
-    {
-      std::cout << "w[k] < 0: " << w[k] << " " << k << std::endl;
-    }
-    
-  }
+  updateSamples();
+  Vec w=contactWeights(area);
   //Q-Metric
   Vec gw;
   if(_type==Q_1)
     e+=_object.computeQ1(w,g?&gw:NULL)*_coef;
-  else if(_type==Q_INF){
-    e+=_object.computeQInf(w,g?&gw:NULL)*_coef;
-    std::cout << "QInf = " << _object.computeQInf(w,g?&gw:NULL)<< std::endl;
-  } 
-  else if(_type==Q_INF_BARRIER)
+  else if(_type==Q_INF) {
+    T QInf=_object.computeQInf(w,g?&gw:NULL);
+    e+=QInf*_coef;
+    std::cout << "QInf = " << QInf << std::endl;
+  } else if(_type==Q_INF_BARRIER)
     e+=_object.computeQInfBarrier(w,x[_off],_d0,g?&gw:NULL)*_coef;
   else {
     ASSERT_MSGV(false,"Unknown metric type: %d",_type)
   }
   if(!std::isfinite(e.getValueI()))
     return -1;
-  //assemble gradient/hessian
+  //assemble gradient/hessian, only the pairs within the cutoff contribute
   if(g || h) {
     gw*=_coef;
     if(std::is_same<T,mpfr::mpreal>::value) {
       for(sizeType oid=0; oid<_pss.cols(); oid++)
-        for(sizeType linkId=0; linkId<_planner.body().nrJ(); linkId++)
-          for(sizeType linkPId=0; linkPId<_planner.pnss()[linkId].first.cols(); linkPId++)
-            addTerm(area,gw,linkId,linkPId,oid,g,h);
+        forEachSample(oid,[&](sizeType sid) {
+          addTerm(area,gw,_sampleId[sid][0],_sampleId[sid][1],oid,g,h);
+        });
     } else {
       OMP_PARALLEL_FOR_
       for(sizeType oid=0; oid<_pss.cols(); oid++)
-        for(sizeType linkId=0; linkId<_planner.body().nrJ(); linkId++)
-          for(sizeType linkPId=0; linkPId<_planner.pnss()[linkId].first.cols(); linkPId++)
-            addTerm(area,gw,linkId,linkPId,oid,g,h);
+        forEachSample(oid,[&](sizeType sid) {
+          addTerm(area,gw,_sampleId[sid][0],_sampleId[sid][1],oid,g,h);
+        });
     }
     if(_type==Q_INF_BARRIER)
       fgrad->coeffRef(_off)+=gw[_object.gij().rows()];
@@ -77,40 +59,135 @@ int MetricEnergy<T>::operator()(const Vec& x,ParallelMatrix<T>& e,ParallelMatrix
 template <typename T>
 T MetricEnergy<T>::Quality(const Vec& x)
 {
- T area=_planner.area();
-  Vec w=Vec::Zero(_object.gij().rows());
-  //point on object
-  for(sizeType k=0; k<_pss.cols(); k++) {
-    const Vec3T po=_pss.col(k);
-    //point on hand
-    for(sizeType i=0; i<_planner.body().nrJ(); i++) {
-      //point on link i
-      const std::pair<Mat3XT,Mat3XT>& pn=_planner.pnss()[i];
-      Mat3XT p=ROTI(_info._TM,i)*pn.first+CTRI(_info._TM,i)*Vec::Ones(pn.first.cols()).transpose();
-      for(sizeType j=0; j<p.cols(); j++) {
-        T len=std::sqrt((p.col(j)-po).squaredNorm());
-        w[k]+=activation(len)*area;
-      }
-    }
-    if (w[k] < 0) 
-    {
-      std::cout << "w[k] < 0: " << w[k] << " " << k << std::endl;
-    }
-    
-  }
+  updateSamples();
+  Vec w=contactWeights(_planner.area());
   //Q-Metric
   if(_type==Q_1)
     return _object.computeQ1(w,NULL);
   else if(_type==Q_INF)
     return _object.computeQInf(w,NULL);
   else if(_type==Q_INF_BARRIER)
-   return _object.computeQInfBarrier(w,x[_off],_d0,NULL);
+    return _object.computeQInfBarrier(w,x[_off],_d0,NULL);
   else {
     ASSERT_MSGV(false,"Unknown metric type: %d",_type)
     return 0;
   }
 }
-
+template <typename T>
+typename MetricEnergy<T>::Vec MetricEnergy<T>::weights()
+{
+  updateSamples();
+  return contactWeights(_planner.area());
+}
+template <typename T>
+void MetricEnergy<T>::updateSamples()
+{
+  //point on hand, transformed once per evaluation
+  sizeType nrS=0;
+  for(sizeType i=0; i<_planner.body().nrJ(); i++)
+    nrS+=_planner.pnss()[i].first.cols();
+  _pssHand.resize(3,nrS);
+  _sampleId.resize(nrS);
+  nrS=0;
+  for(sizeType i=0; i<_planner.body().nrJ(); i++) {
+    const std::pair<Mat3XT,Mat3XT>& pn=_planner.pnss()[i];
+    _pssHand.block(0,nrS,3,pn.first.cols())=ROTI(_info._TM,i)*pn.first+CTRI(_info._TM,i)*Vec::Ones(pn.first.cols()).transpose();
+    for(sizeType j=0; j<pn.first.cols(); j++)
+      _sampleId[nrS+j]=Vec2i(i,j);
+    nrS+=pn.first.cols();
+  }
+  //spatial hash with cells of the cutoff size, so that the samples within the cutoff are in the 27 surrounding cells
+  _cutoff=cutoff();
+  _grid.clear();
+  _order.clear();
+  if(_cutoff<=0)
+    return;
+  scalarD invCell=1/std::to_double(_cutoff);
+  std::vector<Vec3i,Eigen::aligned_allocator<Vec3i>> cells(nrS);
+  for(sizeType i=0; i<nrS; i++) {
+    _order.push_back(i);
+    for(sizeType d=0; d<3; d++)
+      cells[i][d]=(sizeType)std::floor(std::to_double(_pssHand(d,i))*invCell);
+  }
+  std::sort(_order.begin(),_order.end(),[&](sizeType a,sizeType b) {
+    const Vec3i& ca=cells[a];
+    const Vec3i& cb=cells[b];
+    return ca[0]<cb[0] || (ca[0]==cb[0] && (ca[1]<cb[1] || (ca[1]==cb[1] && ca[2]<cb[2])));
+  });
+  for(sizeType i=0,j=0; i<nrS; i=j) {
+    for(j=i+1; j<nrS && cells[_order[j]]==cells[_order[i]];)
+      j++;
+    _grid[cells[_order[i]]]=Vec2i(i,j);
+  }
+}
+template <typename T>
+typename MetricEnergy<T>::Vec MetricEnergy<T>::contactWeights(T area) const
+{
+  Vec w=Vec::Zero(_object.gij().rows());
+  //point on object
+  if(std::is_same<T,mpfr::mpreal>::value) {
+    for(sizeType k=0; k<_pss.cols(); k++)
+      forEachSample(k,[&](sizeType sid) {
+        w[k]+=activation(std::sqrt((_pssHand.col(sid)-_pss.col(k)).squaredNorm()))*area;
+      });
+  } else {
+    OMP_PARALLEL_FOR_
+    for(sizeType k=0; k<_pss.cols(); k++)
+      forEachSample(k,[&](sizeType sid) {
+        w[k]+=activation(std::sqrt((_pssHand.col(sid)-_pss.col(k)).squaredNorm()))*area;
+      });
+  }
+  for(sizeType k=0; k<_pss.cols(); k++)
+    if(w[k]<0)
+      std::cout << "w[k] < 0: " << w[k] << " " << k << std::endl;
+  return w;
+}
+template <typename T>
+template <typename F>
+void MetricEnergy<T>::forEachSample(sizeType oid,F f) const
+{
+  if(_cutoff<=0) {
+    for(sizeType sid=0; sid<_pssHand.cols(); sid++)
+      f(sid);
+    return;
+  }
+  const Vec3T po=_pss.col(oid);
+  T cutoffSqr=_cutoff*_cutoff;
+  scalarD invCell=1/std::to_double(_cutoff);
+  Vec3i cell;
+  for(sizeType d=0; d<3; d++)
+    cell[d]=(sizeType)std::floor(std::to_double(po[d])*invCell);
+  for(sizeType x=-1; x<=1; x++)
+    for(sizeType y=-1; y<=1; y++)
+      for(sizeType z=-1; z<=1; z++) {
+        typename std::unordered_map<Vec3i,Vec2i,Hash>::const_iterator it=_grid.find(cell+Vec3i(x,y,z));
+        if(it==_grid.end())
+          continue;
+        for(sizeType i=it->second[0]; i<it->second[1]; i++)
+          if((_pssHand.col(_order[i])-po).squaredNorm()<cutoffSqr)
+            f(_order[i]);
+      }
+}
+template <typename T>
+T MetricEnergy<T>::cutoff() const
+{
+  if(_tol<=0)
+    return -1;
+  switch(_activation)
+  {
+  case EXP_ACTIVATION:
+    return -_alpha*std::log(_tol);
+  case SQR_EXP_ACTIVATION:
+    return std::sqrt(-_alpha*std::log(_tol));
+  case INVERSE_ACTIVATION:
+    return _alpha*(1/_tol-1);
+  case SQR_INVERSE_ACTIVATION:
+    return _alpha*std::sqrt(1/_tol-1);
+  default:
+    ASSERT_MSG(false,"Unknown activation")
+    return -1;
+  }
+}
 template <typename T>
 T MetricEnergy<T>::activation(T param,T* D,T* DD) const
 {
@@ -2,6 +2,8 @@
 #define METRIC_ENERGY_H
 
 #include "ArticulatedObjective.h"
+#include <CommonFile/Hash.h>
+#include <unordered_map>
 
 PRJ_BEGIN
 
@@ -30,18 +32,34 @@ public:
   using ArticulatedObjective<T>::_object;
   using ArticulatedObjective<T>::_info;
   MetricEnergy(DSSQPObjectiveCompound<T>& obj,const PBDArticulatedGradientInfo<T>& info,const GraspPlanner<T>& planner,const PointCloudObject<T>& object,
-               T d0,const T& alpha,T coef,METRIC_TYPE m,METRIC_ACTIVATION a,T normalExtrude=0);
+               T d0,const T& alpha,T coef,METRIC_TYPE m,METRIC_ACTIVATION a,T normalExtrude=0,T tol=0);
   virtual int operator()(const Vec& x,ParallelMatrix<T>& e,ParallelMatrix<Mat3XT>* g,ParallelMatrix<Mat12XT>* h,Vec* fgrad,STrips* fhess) override;
   T Quality(const Vec& x);
+  //contact weights of the object points at the configuration of info
+  Vec weights();
 protected:
+  //transform the hand samples once and hash them into cells of size cutoff()
+  void updateSamples();
+  //w[k]=area*sum of activation(|p-po_k|) over the hand samples p within cutoff() of the object point po_k
+  Vec contactWeights(T area) const;
+  template <typename F>
+  void forEachSample(sizeType oid,F f) const;
+  //distance beyond which the activation is below tol times its value at 0, negative if there is no cutoff (tol=0)
+  T cutoff() const;
   void addTerm(T area,const Vec& gw,sizeType linkId,sizeType linkPId,sizeType oid,ParallelMatrix<Mat3XT>* g,ParallelMatrix<Mat12XT>* h) const;
   T activation(T param,T* D=NULL,T* DD=NULL) const;
-  T _d0,_coef;
+  T _d0,_coef,_tol;
   const T& _alpha;
   METRIC_TYPE _type;
   METRIC_ACTIVATION _activation;
   sizeType _off;
   Mat3XT _pss;
+  //world-space hand samples with their (link,sample) ids, _order sorts them by cell and _grid maps a cell to its range in _order
+  Mat3XT _pssHand;
+  std::vector<Vec2i,Eigen::aligned_allocator<Vec2i>> _sampleId;
+  std::vector<sizeType> _order;
+  std::unordered_map<Vec3i,Vec2i,Hash> _grid;
+  T _cutoff;
 };
 
 PRJ_END
@@ -6,6 +6,7 @@
 #include <Utils/CrossSpatialUtil.h>
 #include <CommonFile/Interp.h>
 #include <CommonFile/MakeMesh.h>
+#include <CommonFile/Hash.h>
 #include <CommonFile/CameraModel.h>
 #include <CommonFile/geom/BVHBuilder.h>
 #include <CommonFile/geom/ObjMeshGeomCell.h>
@@ -17,7 +18,7 @@
 USE_PRJ_NAMESPACE
 
 template <typename T>
-PointCloudObject<T>::PointCloudObject() {}
+PointCloudObject<T>::PointCloudObject():_levelRatio(0) {}
 template <typename T>
 void PointCloudObject<T>::reset(ObjMesh& obj,T rad)
 {
@@ -31,6 +32,7 @@ void PointCloudObject<T>::reset(ObjMesh& obj,T rad)
   }
   //distance
   _m=obj;
+  _mLazy=NULL;
   //sample
   samplePoints(rad);
   buildBVH();
@@ -42,6 +44,7 @@ void PointCloudObject<T>::resetPointCloud(ArticulatedBody& body,const Vec& x,con
   _m=body.writeMesh(info._TM.unaryExpr([&](const T& in) {
     return (scalarD)std::to_double(in);
   }),Joint::MESH);
+  _mLazy=NULL;
   //sample
   _rad=1;
   std::vector<Mat4,Eigen::aligned_allocator<Mat4>> tss;
@@ -103,6 +106,8 @@ void PointCloudObject<T>::resetGraspable(ObjMesh& obj,T rad,sizeType dRes,const
   //distance
   _m=obj;
   _distExact.reset(new ObjMeshGeomCellExact(ObjMeshGeomCell(Mat4::Identity(),obj,0,true)));
+  _distLazy=NULL;
+  _mLazy=NULL;
   //sample
   samplePoints(rad);
   buildBVH();
@@ -119,8 +124,10 @@ bool PointCloudObject<T>::read(std::istream& is,IOData* dat)
   readBinaryData(_nss,is);
   readBinaryData(_idss,is);
   _m.readBinary(is);
-  readBinaryData(_gij,is);
+  _gij.read(is);
   readBinaryData(_rad,is);
+  _distLazy=NULL;
+  _mLazy=NULL;
   return is.good();
 }
 template <typename T>
@@ -128,16 +135,74 @@ bool PointCloudObject<T>::write(std::ostream& os,IOData* dat) const
 {
   registerType<ObjMeshGeomCellExact>(dat);
   writeBinaryData(_bvh,os);
-  writeBinaryData(_distExact,os,dat);
+  writeBinaryData(distPtr(),os,dat);
   writeBinaryData(_pss,os);
   writeBinaryData(_nss,os);
   writeBinaryData(_idss,os);
-  _m.writeBinary(os);
-  writeBinaryData(_gij,os);
+  mesh().writeBinary(os);
+  _gij.write(os);
   writeBinaryData(_rad,os);
   return os.good();
 }
 template <typename T>
+bool PointCloudObject<T>::readMapped(const std::string& path)
+{
+  if(!SectionFile::isSectionFile(path))
+    return SerializableBase::read(path);
+  std::shared_ptr<SectionFile> file(new SectionFile(path));
+  if(!file->valid() || file->type()!=type()) {
+    WARNINGV("Cannot read %s as %s",path.c_str(),type().c_str())
+    return false;
+  }
+  readBinaryData(_bvh,*(file->stream("bvh")));
+  std::shared_ptr<IMemoryStream> is=file->stream("points");
+  readBinaryData(_pss,*is);
+  readBinaryData(_nss,*is);
+  readBinaryData(_idss,*is);
+  readBinaryData(_rad,*is);
+  if(!_gij.readMapped(file->data("gij"),file->size("gij"),file->file()))
+    return false;
+  _levels.clear();
+  //the exact geometry is only used by ObjectClosednessEnergy and the mesh only by writeVTK
+  _distExact=NULL;
+  _distLazy.reset(new LazySection<std::shared_ptr<ObjMeshGeomCellExact>>(file,"dist",[](std::istream& is,std::shared_ptr<ObjMeshGeomCellExact>& dist) {
+    std::shared_ptr<IOData> dat=getIOData();
+    registerType<ObjMeshGeomCellExact>(dat.get());
+    readBinaryData(dist,is,dat.get());
+  }));
+  _m=ObjMesh();
+  _mLazy.reset(new LazySection<ObjMesh>(file,"mesh",[](std::istream& is,ObjMesh& m) {
+    m.readBinary(is);
+  }));
+  return is->good();
+}
+template <typename T>
+bool PointCloudObject<T>::writeMapped(const std::string& path) const
+{
+  SectionFileWriter writer(type());
+  writer.add("bvh",[&](std::ostream& os) {
+    writeBinaryData(_bvh,os);
+  });
+  writer.add("points",[&](std::ostream& os) {
+    writeBinaryData(_pss,os);
+    writeBinaryData(_nss,os);
+    writeBinaryData(_idss,os);
+    writeBinaryData(_rad,os);
+  });
+  writer.add("gij",[&](std::ostream& os) {
+    _gij.writeMapped(os);
+  });
+  writer.add("dist",[&](std::ostream& os) {
+    std::shared_ptr<IOData> dat=getIOData();
+    registerType<ObjMeshGeomCellExact>(dat.get());
+    writeBinaryData(distPtr(),os,dat.get());
+  });
+  writer.add("mesh",[&](std::ostream& os) {
+    mesh().writeBinary(os);
+  });
+  return writer.write(path);
+}
+template <typename T>
 std::shared_ptr<SerializableBase> PointCloudObject<T>::copy() const
 {
   return std::shared_ptr<SerializableBase>(new PointCloudObject<T>);
@@ -169,7 +234,7 @@ void PointCloudObject<T>::writeVTK(const std::string& path,T len,T normalExtrude
     css.push_back(_idss[i]);
   }
   create(path);
-  _m.writeVTK(path+"/mesh.vtk",true);
+  mesh().writeVTK(path+"/mesh.vtk",true);
   VTKWriter<scalar> os("particles",path+"/sample.vtk",true);
   os.appendPoints(vss.begin(),vss.end());
   os.appendCells(VTKWriter<scalar>::IteratorIndex<Vec3i>(0,2,0),
@@ -186,7 +251,7 @@ T PointCloudObject<T>::computeQInfBarrier(const Vec& w,T r,T d0,Vec* g) const
   T area=_rad*_rad*M_PI,ret=r,D;
   if(g)
     *g=Vec::Unit(_gij.rows()+1,_gij.rows());
-  Vec wrench=(_gij.transpose()*w.asDiagonal()).rowwise().sum()*area;
+  Vec wrench=_gij.transposeTimes(w)*area;
   for(sizeType i=0; i<wrench.size(); i++) {
     ret-=clog<T>(wrench[i]-r,g?&D:NULL,NULL,d0,1);
     if(!std::isfinite(ret))
@@ -201,7 +266,7 @@ T PointCloudObject<T>::computeQInf(const Vec& w,Vec* g) const
 {
   sizeType id;
   T area=_rad*_rad*M_PI;
-  Vec wrench=(_gij.transpose()*w.asDiagonal()).rowwise().sum()*area;
+  Vec wrench=_gij.transposeTimes(w)*area;
   T ret=wrench.minCoeff(&id);
   // std::cout << "Q_Inf value = " << ret << std::endl;
   if(g)
@@ -212,20 +277,20 @@ template <typename T>
 T PointCloudObject<T>::computeQ1(const Vec& w,Vec* g) const
 {
   sizeType idMax,idMin;
-  Vec wrench=(_gij.transpose()*w.asDiagonal()).rowwise().maxCoeff();
+  Vec wrench=_gij.maxTimes(w);
   T ret=wrench.minCoeff(&idMin);
   // std::cout << "Q_1 value = " << ret << std::endl;
   if(g) {
     Vec tmp=(_gij.col(idMin).array()*w.array()).matrix();
     tmp.maxCoeff(&idMax);
-    *g=Vec::Unit(_gij.rows(),idMax)*_gij(idMax,idMin);
+    *g=Vec::Unit(_gij.rows(),idMax)*_gij.coeff(idMax,idMin);
   }
   return ret;
 }
 template <typename T>
 const ObjMeshGeomCellExact& PointCloudObject<T>::dist() const
 {
-  return *_distExact;
+  return *distPtr();
 }
 template <typename T>
 typename PointCloudObject<T>::Mat3XT PointCloudObject<T>::pss(T normalExtrude) const
@@ -248,11 +313,45 @@ const Coli& PointCloudObject<T>::idss() const
   return _idss;
 }
 template <typename T>
-const typename PointCloudObject<T>::MatT& PointCloudObject<T>::gij() const
+const GijMatrix<T>& PointCloudObject<T>::gij() const
 {
   return _gij;
 }
 template <typename T>
+void PointCloudObject<T>::compressGij(typename GijMatrix<T>::MODE mode,T tol)
+{
+  _gij.compress(mode,tol);
+  for(std::shared_ptr<PointCloudObject<T>> l:_levels)
+    l->compressGij(mode,tol);
+}
+template <typename T>
+void PointCloudObject<T>::buildLevels(sizeType nrCoarse,T ratio)
+{
+  if((sizeType)_levels.size()==nrCoarse && _levelRatio==ratio)
+    return;
+  _levels.clear();
+  _levelRatio=ratio;
+  T rad=_rad;
+  for(sizeType l=0; l<nrCoarse; l++) {
+    rad*=ratio;
+    std::shared_ptr<PointCloudObject<T>> coarse(new PointCloudObject<T>);
+    coarse->subsample(level(l),rad);
+    INFOV("PointCloudObject level %d: %d points",l+1,coarse->_pss.cols())
+    _levels.push_back(coarse);
+  }
+}
+template <typename T>
+const PointCloudObject<T>& PointCloudObject<T>::level(sizeType l) const
+{
+  ASSERT_MSGV(l>=0 && l<nrLevel(),"PointCloudObject has %d levels, requested level %d",nrLevel(),l)
+  return l==0?*this:*(_levels[l-1]);
+}
+template <typename T>
+sizeType PointCloudObject<T>::nrLevel() const
+{
+  return (sizeType)_levels.size()+1;
+}
+template <typename T>
 void PointCloudObject<T>::debug(sizeType iter)
 {
   if(_gij.size()==0)
@@ -299,17 +398,18 @@ void PointCloudObject<T>::buildGij(sizeType dRes,const Mat6T& M,T mu,bool torque
     if(torque)
       dss.push_back(concatRow<Vec>(Vec3T::Zero(),m.getV(i).template cast<T>()));
   }
-  _gij.resize(_pss.cols(),(sizeType)dss.size());
+  MatT gij(_pss.cols(),(sizeType)dss.size());
   for(sizeType r=0; r<_pss.cols(); r++)
     for(sizeType c=0; c<(sizeType)dss.size(); c++)
     {
-      _gij(r,c)=computeGij(_pss.col(r),_nss.col(r),dss[c],M,mu);
-      if (_gij(r,c)<0)
+      gij(r,c)=computeGij(_pss.col(r),_nss.col(r),dss[c],M,mu);
+      if (gij(r,c)<0)
       {
-        std::cout << "gij < 0:" << _gij(r, c) << " " << r << " " << c<< std::endl;
+        std::cout << "gij < 0:" << gij(r, c) << " " << r << " " << c<< std::endl;
       }
       
     }
+  _gij=GijMatrix<T>(gij);
 }
 template <typename T>
 void PointCloudObject<T>::samplePoints(T rad)
@@ -330,6 +430,76 @@ void PointCloudObject<T>::samplePoints(T rad)
   _idss.setConstant(_pss.cols(),-1);
 }
 template <typename T>
+void PointCloudObject<T>::subsample(const PointCloudObject<T>& fine,T rad)
+{
+  //greedy Poisson-disk selection of the fine points in their sampling order, using a grid of cell size rad
+  std::unordered_map<Vec3i,std::vector<sizeType>,Hash> grid;
+  std::vector<sizeType> ids;
+  std::function<Vec3i(const Vec3T&)> cellOf=[&](const Vec3T& p) {
+    return Vec3i((sizeType)std::floor(std::to_double(p[0]/rad)),
+                 (sizeType)std::floor(std::to_double(p[1]/rad)),
+                 (sizeType)std::floor(std::to_double(p[2]/rad)));
+  };
+  std::function<sizeType(const Vec3T&,T&)> closest=[&](const Vec3T& p,T& distSqr) {
+    sizeType ret=-1;
+    Vec3i c=cellOf(p);
+    distSqr=ScalarUtil<T>::scalar_max();
+    for(sizeType x=-1; x<=1; x++)
+      for(sizeType y=-1; y<=1; y++)
+        for(sizeType z=-1; z<=1; z++) {
+          typename std::unordered_map<Vec3i,std::vector<sizeType>,Hash>::const_iterator it=grid.find(c+Vec3i(x,y,z));
+          if(it!=grid.end())
+            for(sizeType id:it->second) {
+              T d=(fine._pss.col(ids[id])-p).squaredNorm();
+              if(d<distSqr) {
+                distSqr=d;
+                ret=id;
+              }
+            }
+        }
+    return ret;
+  };
+  T distSqr;
+  for(sizeType i=0; i<fine._pss.cols(); i++)
+    if(closest(fine._pss.col(i),distSqr)<0 || distSqr>=rad*rad) {
+      grid[cellOf(fine._pss.col(i))].push_back((sizeType)ids.size());
+      ids.push_back(i);
+    }
+  _pss.resize(3,(sizeType)ids.size());
+  _nss.resize(3,(sizeType)ids.size());
+  _idss.resize((sizeType)ids.size());
+  for(sizeType i=0; i<(sizeType)ids.size(); i++) {
+    _pss.col(i)=fine._pss.col(ids[i]);
+    _nss.col(i)=fine._nss.col(ids[i]);
+    _idss[i]=fine._idss[ids[i]];
+  }
+  //every fine point is merged into its closest selected point, whose gij row is the sum of the merged rows,
+  //so that the wrenches and Q of a coarse level approximate those of the full object with the same _rad
+  //coarse levels are stored dense, compressGij compresses the levels built before it
+  if(fine._gij.size()>0) {
+    MatT gijFine=fine._gij.toDense(),gij=MatT::Zero((sizeType)ids.size(),fine._gij.cols());
+    for(sizeType i=0; i<fine._pss.cols(); i++)
+      gij.row(closest(fine._pss.col(i),distSqr))+=gijFine.row(i);
+    _gij=GijMatrix<T>(gij);
+  } else _gij=GijMatrix<T>();
+  _distExact=fine._distExact;
+  _distLazy=fine._distLazy;
+  _m=fine._m;
+  _mLazy=fine._mLazy;
+  _rad=fine._rad;
+  buildBVH();
+}
+template <typename T>
+const std::shared_ptr<ObjMeshGeomCellExact>& PointCloudObject<T>::distPtr() const
+{
+  return _distLazy?_distLazy->get():_distExact;
+}
+template <typename T>
+const ObjMesh& PointCloudObject<T>::mesh() const
+{
+  return _mLazy?_mLazy->get():_m;
+}
+template <typename T>
 void PointCloudObject<T>::buildBVH()
 {
   //build BVH
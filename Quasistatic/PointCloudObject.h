@@ -3,7 +3,8 @@
 
 #include <CommonFile/geom/BVHNode.h>
 #include <CommonFile/ObjMesh.h>
-#include <Utils/SparseUtils.h>
+#include "GijMatrix.h"
+
 
 PRJ_BEGIN
 
@@ -21,6 +22,10 @@ public:
   void resetGraspable(ObjMesh& obj,T rad,sizeType dRes=4,const Mat6T& M=Mat6T::Identity(),T mu=0.1f,bool torque=false);
   bool read(std::istream& is,IOData* dat) override;
   bool write(std::ostream& os,IOData* dat) const override;
+  //memory-mapped SectionFile: a dense double gij is used in place, the exact geometry and the mesh are loaded on first access,
+  //readMapped falls back to SerializableBase::read for files in the stream format
+  bool readMapped(const std::string& path);
+  bool writeMapped(const std::string& path) const;
   std::shared_ptr<SerializableBase> copy() const override;
   std::string type() const override;
   const std::vector<Node<sizeType,BBox<scalarD>>>& getBVH() const;
@@ -33,21 +38,35 @@ public:
   const Mat3XT& pss() const;
   const Mat3XT& nss() const;
   const Coli& idss() const;
-  const MatT& gij() const;
+  const GijMatrix<T>& gij() const;
+  void compressGij(typename GijMatrix<T>::MODE mode,T tol);
+  //multiresolution: level 0 is this object, level l>0 a nested Poisson-disk subsample with radius _rad*ratio^l
+  void buildLevels(sizeType nrCoarse,T ratio=2);
+  const PointCloudObject<T>& level(sizeType l) const;
+  sizeType nrLevel() const;
   void debug(sizeType iter);
 protected:
   static T computeGij(const Vec3T& p,const Vec3T& n,const Vec6T& d,const Mat6T& M,T mu);
   void buildGij(sizeType dRes,const Mat6T& M,T mu,bool torque);
   void samplePoints(T rad);
   void buildBVH();
+  void subsample(const PointCloudObject<T>& fine,T rad);
+  const std::shared_ptr<ObjMeshGeomCellExact>& distPtr() const;
+  const ObjMesh& mesh() const;
   //data
   std::vector<Node<sizeType,BBox<scalarD>>> _bvh;
   std::shared_ptr<ObjMeshGeomCellExact> _distExact;
   Mat3XT _pss,_nss;
   Coli _idss;
   ObjMesh _m;
-  MatT _gij;
+  GijMatrix<T> _gij;
   T _rad;
+  //sections of a mapped file not loaded yet, they replace _distExact and _m when set
+  std::shared_ptr<LazySection<std::shared_ptr<ObjMeshGeomCellExact>>> _distLazy;
+  std::shared_ptr<LazySection<ObjMesh>> _mLazy;
+  //coarse levels, built on demand and not serialized
+  std::vector<std::shared_ptr<PointCloudObject<T>>> _levels;
+  T _levelRatio;
 };
 
 PRJ_END
@@ -40,8 +40,9 @@ int PrimalDualQInfMetricEnergy<T>::operator()(const Vec& x,Vec& fvec,STrips* fja
       for(sizeType i=0; i<nrC; i++) {
         Vec cjacRow=Vec::Zero(_planner.body().nrDOF());
         Mat3XT G=Mat3XT::Zero(3,_planner.body().nrJ()*4);
+        Vec gi=_object.gij().col(i);
         for(sizeType oid=0; oid<_pss.cols(); oid++)
-          G+=linkObjCoefG.block(3*oid,0,3,_planner.body().nrJ()*4)*_object.gij()(oid,i);
+          G+=linkObjCoefG.block(3*oid,0,3,_planner.body().nrJ()*4)*gi[oid];
         fjac->push_back(STrip(i+DSSQPObjectiveComponent<T>::_offset,MetricEnergy<T>::_off,-1));
         _info.DTG(_planner.body(),ArticulatedObjective<T>::mapM(G),ArticulatedObjective<T>::mapV(cjacRow));
         addBlock(*fjac,i+DSSQPObjectiveComponent<T>::_offset,0,cjacRow.transpose());
@@ -59,15 +60,16 @@ int PrimalDualQInfMetricEnergy<T>::operator()(const Vec& x,Vec& fvec,STrips* fja
       for(sizeType i=0; i<nrC; i++) {
         Vec cjacRow=Vec::Zero(_planner.body().nrDOF());
         Mat3XT G=Mat3XT::Zero(3,_planner.body().nrJ()*4);
+        Vec gi=_object.gij().col(i);
         for(sizeType oid=0; oid<_pss.cols(); oid++)
-          G+=linkObjCoefG.block(3*oid,0,3,_planner.body().nrJ()*4)*_object.gij()(oid,i);
+          G+=linkObjCoefG.block(3*oid,0,3,_planner.body().nrJ()*4)*gi[oid];
         fjac->push_back(STrip(i+DSSQPObjectiveComponent<T>::_offset,MetricEnergy<T>::_off,-1));
         _info.DTG(_planner.body(),ArticulatedObjective<T>::mapM(G),ArticulatedObjective<T>::mapV(cjacRow));
         addBlock(*fjac,i+DSSQPObjectiveComponent<T>::_offset,0,cjacRow.transpose());
       }
     }
   }
-  fvec.template segment(DSSQPObjectiveComponent<T>::_offset,nrC)=_object.gij().transpose()*linkObjCoef.getMatrix()-Vec::Constant(nrC,x[MetricEnergy<T>::_off]);
+  fvec.template segment(DSSQPObjectiveComponent<T>::_offset,nrC)=_object.gij().transposeTimes(linkObjCoef.getMatrix())-Vec::Constant(nrC,x[MetricEnergy<T>::_off]);
   return 0;
 }
 template <typename T>
@@ -1,17 +1,20 @@
+#include <Utils/Scalar.h>
 #include "PrimalDualQInfMetricEnergyFGT.h"
 #include "GraspPlanner.h"
 #include "FGTTreeNode.h"
 #include <Utils/SparseUtils.h>
-#include <chrono>
+#include <CommonFile/Profiler.h>
 USE_PRJ_NAMESPACE
 
 template <typename T>
-PrimalDualQInfMetricEnergyFGT<T>::PrimalDualQInfMetricEnergyFGT(DSSQPObjectiveCompound<T>& obj,const PBDArticulatedGradientInfo<T>& info,const GraspPlanner<T>& planner,const PointCloudObject<T>& object,const T& alpha,T coef,T normalExtrude,T FGTThres)
-  :PrimalDualQInfMetricEnergy<T>(obj,info,planner,object,alpha,coef,SQR_EXP_ACTIVATION,normalExtrude),_FGTThres(FGTThres)
+PrimalDualQInfMetricEnergyFGT<T>::PrimalDualQInfMetricEnergyFGT(DSSQPObjectiveCompound<T>& obj,const PBDArticulatedGradientInfo<T>& info,const GraspPlanner<T>& planner,const PointCloudObject<T>& object,const T& alpha,T coef,T normalExtrude,T FGTThres,bool incremental)
+  :PrimalDualQInfMetricEnergy<T>(obj,info,planner,object,alpha,coef,SQR_EXP_ACTIVATION,normalExtrude),_FGTThres(FGTThres),_lastHasJac(false),_incremental(incremental)
 {
 #define LEAF_THRES_FGT 32
   _objectFGT.reset(new FGTTreeNode<T>(NULL,_pss,Vec2i(0,_pss.cols()),LEAF_THRES_FGT));
   _gripperFGT.resize(_planner.body().nrJ());
+  _interactions.resize(_planner.body().nrJ());
+  _TRecord.resize(_planner.body().nrJ());
   for(sizeType i=0; i<_planner.body().nrJ(); i++) {
     Mat3XT& yl=const_cast<Mat3XT&>(_planner.pnss()[i].first);
     Mat3XT& yln=const_cast<Mat3XT&>(_planner.pnss()[i].second);
@@ -26,46 +29,170 @@ template <typename T>
 int PrimalDualQInfMetricEnergyFGT<T>::operator()(const Vec& x,Vec& fvec,STrips* fjac)
 {
   T invHSqr=1/_alpha;
-  Vec G=Vec::Zero(_pss.cols());
-  std::vector<MatX4T,Eigen::aligned_allocator<MatX4T>> DGDT;
-  if(fjac)
-    DGDT.assign(_planner.body().nrJ(),MatX4T::Zero(3*_pss.cols(),4));
-  for(sizeType i=0; i<_planner.body().nrJ(); i++) {
-    const Mat3XT& yl=const_cast<Mat3XT&>(_planner.pnss()[i].first);
-    if(yl.cols()==0)
-      continue;
-    Mat3XT y=ROTI(_info._TM,i)*yl+CTRI(_info._TM,i)*Vec::Ones(yl.cols()).transpose();
-    _gripperFGT[i]->transform(ROTI(_info._TM,i),CTRI(_info._TM,i),y,true);
-    //_gripperFGT[i]->transform(ROTI(_info._TM,i),CTRI(_info._TM,i));
-    FGTTreeNode<T>::FGT(G,fjac?&DGDT[i]:NULL,NULL,y,&yl,_pss,*_gripperFGT[i],*_objectFGT,invHSqr,_FGTThres);
+  sizeType nrJ=_planner.body().nrJ();
+  //the line search and the next SQP iteration evaluate accepted configurations again
+  bool fitted=_incremental && _TMLast.size()==_info._TM.size();
+  if(!fitted || _TMLast!=_info._TM || (fjac && !_lastHasJac)) {
+    _GLast=Vec::Zero(_pss.cols());
+    //DGDT of all links as a sparse (12*nrJ)x|pss| matrix: column i holds the 3x4 blocks of object point i,
+    //only the points that received a contribution of a link are stored
+    STrips DGDTTrips;
+    if(fjac)
+      _DGDT.resize(3*_pss.cols(),4);
+    //refit the link trees concurrently, links have very different numbers of samples
+    std::vector<Mat3XT,Eigen::aligned_allocator<Mat3XT>> ys(nrJ);
+    {
+      PROFILE_SCOPE("FGTTreeNode::transform")
+      OMP_PARALLEL_FOR_DYNAMIC_X(OmpSettings::getOmpSettings().nrThreads())
+      for(sizeType i=0; i<nrJ; i++) {
+        const Mat3XT& yl=_planner.pnss()[i].first;
+        if(yl.cols()==0)
+          continue;
+        ys[i]=ROTI(_info._TM,i)*yl+CTRI(_info._TM,i)*Vec::Ones(yl.cols()).transpose();
+        if(!fitted || TRANSI(_TMLast,i)!=TRANSI(_info._TM,i))
+          _gripperFGT[i]->transform(ROTI(_info._TM,i),CTRI(_info._TM,i),ys[i],true);
+        //_gripperFGT[i]->transform(ROTI(_info._TM,i),CTRI(_info._TM,i));
+      }
+    }
+    //links are evaluated in order since the error bounds depend on the G accumulated so far, each FGT runs in parallel
+    for(sizeType i=0; i<nrJ; i++) {
+      const Mat3XT& yl=_planner.pnss()[i].first;
+      const Mat3XT& y=ys[i];
+      if(yl.cols()==0)
+        continue;
+      PROFILE_SCOPE("FGTTreeNode::FGT")
+      if(fjac)
+        _DGDT.setZero();
+      if(_incremental) {
+        //node pairs recorded more than half a kernel width away are no longer a good traversal, start over
+        if(!_interactions[i].empty() && _gripperFGT[i]->motionBound(_TRecord[i],TRANSI(_info._TM,i))>std::sqrt(_alpha)/2)
+          _interactions[i].clear();
+        if(_interactions[i].empty())
+          _TRecord[i]=TRANSI(_info._TM,i);
+        FGTTreeNode<T>::FGTIncremental(_GLast,fjac?&_DGDT:NULL,NULL,y,&yl,_pss,*_gripperFGT[i],*_objectFGT,invHSqr,_FGTThres,_interactions[i]);
+      } else FGTTreeNode<T>::FGT(_GLast,fjac?&_DGDT:NULL,NULL,y,&yl,_pss,*_gripperFGT[i],*_objectFGT,invHSqr,_FGTThres);
+      if(fjac) {
+        //the nonzero 3x4 blocks are counted first, so every block fills its own slots in oid order
+        typename STrips::vector_type& trips=DGDTTrips.getVector();
+        std::vector<sizeType> offsets(_pss.cols()+1,(sizeType)trips.size());
+        for(sizeType oid=0; oid<_pss.cols(); oid++)
+          offsets[oid+1]=offsets[oid]+((_DGDT.template block<3,4>(oid*3,0).array()==0).all()?0:12);
+        trips.resize(offsets.back());
+        OMP_PARALLEL_FOR_
+        for(sizeType oid=0; oid<_pss.cols(); oid++) {
+          if(offsets[oid+1]==offsets[oid])
+            continue;
+          const Eigen::Block<MatX4T,3,4> blk=_DGDT.template block<3,4>(oid*3,0);
+          for(sizeType c=0; c<4; c++)
+            for(sizeType r=0; r<3; r++)
+              trips[offsets[oid]+c*3+r]=STrip(i*12+c*3+r,oid,blk(r,c));
+        }
+      }
+    }
+    _DGDTSLast.resize(nrJ*12,_pss.cols());
+    _DGDTSLast.setFromTriplets(DGDTTrips.begin(),DGDTTrips.end());
+    _TMLast=_info._TM;
+    _lastHasJac=fjac!=NULL;
   }
+  const Vec& G=_GLast;
 
   sizeType nrC=values();
+  sizeType nrDOF=_planner.body().nrDOF();
   T area=_planner.area();
   if(fjac) {
-    Vec cjacRow;
-    Mat3XT DGDTc;
-    DGDTc.resize(3,_planner.body().nrJ()*4);
-    for(sizeType r=0; r<nrC; r++) {
-      DGDTc.setZero();
+    PROFILE_SCOPE("PrimalDualQInfMetricEnergyFGT::jacobian")
+    //column r of DGDTc is the 3x(4*nrJ) DTG input of constraint r, all constraints in one product
+    MatT DGDTc=_object.gij().leftTimes(_DGDTSLast)*area;
+    MatT cjac;
+    if(nrC>nrJ*12) {
+      //DTG is linear in G: map the 12*nrJ unit inputs once and multiply, instead of one DTG per constraint
+      MatT DTGBasis=MatT::Zero(nrDOF,nrJ*12);
       OMP_PARALLEL_FOR_
-      for(sizeType j=0; j<_planner.body().nrJ(); j++) {
-        if(!_gripperFGT[j])
-          continue;
-        for(sizeType i=0; i<_pss.cols(); i++)
-          TRANSI(DGDTc,j)+=_object.gij()(i,r)*DGDT[j].template block<3,4>(i*3,0);
+      for(sizeType k=0; k<nrJ*12; k++) {
+        Mat3XT Gk=Mat3XT::Zero(3,nrJ*4);
+        Vec cjacCol=Vec::Zero(nrDOF);
+        Gk.data()[k]=1;
+        _info.DTG(_planner.body(),ArticulatedObjective<T>::mapM(Gk),ArticulatedObjective<T>::mapV(cjacCol));
+        DTGBasis.col(k)=cjacCol;
+      }
+      cjac=DGDTc.transpose()*DTGBasis.transpose();
+    } else {
+      cjac.setZero(nrC,nrDOF);
+      OMP_PARALLEL_FOR_
+      for(sizeType r=0; r<nrC; r++) {
+        Mat3XT Gr=Eigen::Map<const Mat3XT>(DGDTc.col(r).data(),3,nrJ*4);
+        Vec cjacRow=Vec::Zero(nrDOF);
+        _info.DTG(_planner.body(),ArticulatedObjective<T>::mapM(Gr),ArticulatedObjective<T>::mapV(cjacRow));
+        cjac.row(r)=cjacRow.transpose();
       }
-      DGDTc*=area;
-
-      cjacRow=Vec::Zero(_planner.body().nrDOF());
-      fjac->push_back(STrip(r+DSSQPObjectiveComponent<T>::_offset,MetricEnergy<T>::_off,-1));
-      _info.DTG(_planner.body(),ArticulatedObjective<T>::mapM(DGDTc),ArticulatedObjective<T>::mapV(cjacRow));
-      addBlock(*fjac,r+DSSQPObjectiveComponent<T>::_offset,0,cjacRow.transpose());
     }
+    for(sizeType r=0; r<nrC; r++)
+      fjac->push_back(STrip(r+DSSQPObjectiveComponent<T>::_offset,MetricEnergy<T>::_off,-1));
+    addBlock(*fjac,DSSQPObjectiveComponent<T>::_offset,0,cjac);
   }
-  fvec.template segment(DSSQPObjectiveComponent<T>::_offset,nrC)=_object.gij().transpose()*G*area-Vec::Constant(nrC,x[MetricEnergy<T>::_off]);
+  fvec.template segment(DSSQPObjectiveComponent<T>::_offset,nrC)=_object.gij().transposeTimes(G)*area-Vec::Constant(nrC,x[MetricEnergy<T>::_off]);
   return 0;
 }
+template <typename T>
+bool PrimalDualQInfMetricEnergyFGT<T>::readState(std::istream& is)
+{
+  std::vector<FGTTreeNode<T>*> xNodes;
+  _objectFGT->nodes(xNodes);
+  sizeType nrJ;
+  readBinaryData(nrJ,is);
+  if(!is.good() || nrJ!=(sizeType)_interactions.size())
+    return false;
+  for(sizeType i=0; i<nrJ; i++) {
+    std::vector<FGTTreeNode<T>*> yNodes;
+    if(_gripperFGT[i])
+      _gripperFGT[i]->nodes(yNodes);
+    sizeType nrI,yId,xId,type;
+    readBinaryData(_TRecord[i],is);
+    readBinaryData(nrI,is);
+    _interactions[i].resize(nrI);
+    for(FGTInteraction<T>& I:_interactions[i]) {
+      readBinaryData(yId,is);
+      readBinaryData(xId,is);
+      readBinaryData(type,is);
+      if(!is.good() || yId<0 || yId>=(sizeType)yNodes.size() || xId<0 || xId>=(sizeType)xNodes.size())
+        return false;
+      I._y=yNodes[yId];
+      I._x=xNodes[xId];
+      I._type=(typename FGTInteraction<T>::TYPE)type;
+    }
+  }
+  //the next evaluation transforms all link trees, the trees themselves are not stored
+  _TMLast.resize(3,0);
+  _lastHasJac=false;
+  return is.good();
+}
+template <typename T>
+bool PrimalDualQInfMetricEnergyFGT<T>::writeState(std::ostream& os) const
+{
+  //the node pairs are stored as preorder indices into the link tree and the object tree
+  std::vector<FGTTreeNode<T>*> xNodes;
+  _objectFGT->nodes(xNodes);
+  std::unordered_map<const FGTTreeNode<T>*,sizeType> xId;
+  for(sizeType k=0; k<(sizeType)xNodes.size(); k++)
+    xId[xNodes[k]]=k;
+  writeBinaryData((sizeType)_interactions.size(),os);
+  for(sizeType i=0; i<(sizeType)_interactions.size(); i++) {
+    std::vector<FGTTreeNode<T>*> yNodes;
+    if(_gripperFGT[i])
+      _gripperFGT[i]->nodes(yNodes);
+    std::unordered_map<const FGTTreeNode<T>*,sizeType> yId;
+    for(sizeType k=0; k<(sizeType)yNodes.size(); k++)
+      yId[yNodes[k]]=k;
+    writeBinaryData(_TRecord[i],os);
+    writeBinaryData((sizeType)_interactions[i].size(),os);
+    for(const FGTInteraction<T>& I:_interactions[i]) {
+      writeBinaryData(yId.find(I._y)->second,os);
+      writeBinaryData(xId.find(I._x)->second,os);
+      writeBinaryData((sizeType)I._type,os);
+    }
+  }
+  return os.good();
+}
 //instance
 PRJ_BEGIN
 template class PrimalDualQInfMetricEnergyFGT<double>;
@@ -2,11 +2,10 @@
 #define PRIMAL_DUAL_QINF_METRIC_ENERGY_FGT_H
 
 #include "PrimalDualQInfMetricEnergy.h"
+#include "FGTTreeNode.h"
 
 PRJ_BEGIN
 
-template <typename T>
-struct FGTTreeNode;
 template <typename T>
 class PrimalDualQInfMetricEnergyFGT : public PrimalDualQInfMetricEnergy<T>
 {
@@ -19,13 +18,26 @@ public:
   using MetricEnergy<T>::_coef;
   using MetricEnergy<T>::_pss;
   using PrimalDualQInfMetricEnergy<T>::values;
-  PrimalDualQInfMetricEnergyFGT(DSSQPObjectiveCompound<T>& obj,const PBDArticulatedGradientInfo<T>& info,const GraspPlanner<T>& planner,const PointCloudObject<T>& object,const T& alpha,T coef,T normalExtrude=0,T FGTThres=1e-6f);
+  PrimalDualQInfMetricEnergyFGT(DSSQPObjectiveCompound<T>& obj,const PBDArticulatedGradientInfo<T>& info,const GraspPlanner<T>& planner,const PointCloudObject<T>& object,const T& alpha,T coef,T normalExtrude=0,T FGTThres=1e-6f,bool incremental=false);
   //constraints
   virtual int operator()(const Vec& x,Vec& fvec,STrips* fjac=NULL) override;
+  //the incremental state: the node pairs of every link and the link transforms they were recorded at
+  virtual bool readState(std::istream& is) override;
+  virtual bool writeState(std::ostream& os) const override;
 protected:
   std::vector<std::shared_ptr<FGTTreeNode<T>>> _gripperFGT;
   std::shared_ptr<FGTTreeNode<T>> _objectFGT;
+  MatX4T _DGDT;   //dense DGDT of one link, reused across links and iterations
   T _FGTThres;
+  //incremental mode: the node pairs of the last traversal of every link and the link transform of their full traversal,
+  //the result of the last evaluation is reused when the configuration did not change
+  std::vector<std::vector<FGTInteraction<T>>> _interactions;
+  std::vector<Mat3X4T,Eigen::aligned_allocator<Mat3X4T>> _TRecord;
+  Mat3XT _TMLast;
+  Vec _GLast;
+  SMat _DGDTSLast;
+  bool _lastHasJac;
+  bool _incremental;
 };
 
 PRJ_END
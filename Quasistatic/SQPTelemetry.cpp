@@ -0,0 +1,77 @@
+#include "SQPTelemetry.h"
+#include <iomanip>
+
+USE_PRJ_NAMESPACE
+
+static void writeJSONValue(std::ostream& os,scalarD val)
+{
+  if(std::isfinite(val))
+    os << val;
+  else os << "null";
+}
+SQPTelemetryRow::SQPTelemetryRow()
+  :_it(0),_E(0),_dNorm(0),_cNorm(0),_alpha(0),_rho(0),_reg(0),_lineSearchTrials(0),
+   _timeAssemble(0),_timeQP(0),_timeLineSearch(0),_time(0) {}
+SQPTelemetry::SQPTelemetry(const std::string& path,bool append):_csv(false)
+{
+  _beg=_lap=Clock::now();
+  if(path.empty())
+    return;
+  _os.open(path,append?std::ios::app|std::ios::ate:std::ios::out);
+  if(!_os.good()) {
+    WARNINGV("Cannot open SQP telemetry file %s",path.c_str())
+    return;
+  }
+  _os << std::setprecision(17);
+  _csv=path.size()>=4 && path.substr(path.size()-4)==".csv";
+  if(_csv && _os.tellp()==0)
+    _os << "it,E,dNorm,cNorm,alpha,rho,reg,lineSearchTrials,status,timeAssemble,timeQP,timeLineSearch,time" << std::endl;
+}
+bool SQPTelemetry::enabled() const
+{
+  return _os.is_open() && _os.good();
+}
+void SQPTelemetry::write(const SQPTelemetryRow& row)
+{
+  if(!enabled())
+    return;
+  if(_csv) {
+    _os << row._it << "," << row._E << "," << row._dNorm << "," << row._cNorm << "," << row._alpha << "," << row._rho << "," << row._reg << ","
+        << row._lineSearchTrials << "," << row._status << "," << row._timeAssemble << "," << row._timeQP << "," << row._timeLineSearch << "," << row._time;
+  } else {
+    const std::pair<const char*,scalarD> vals[12]= {
+      {"E",row._E},{"dNorm",row._dNorm},{"cNorm",row._cNorm},{"alpha",row._alpha},{"rho",row._rho},{"reg",row._reg},
+      {"lineSearchTrials",(scalarD)row._lineSearchTrials},{"timeAssemble",row._timeAssemble},{"timeQP",row._timeQP},
+      {"timeLineSearch",row._timeLineSearch},{"time",row._time},{NULL,0}
+    };
+    _os << "{\"it\":" << row._it << ",\"status\":\"" << row._status << "\"";
+    for(sizeType i=0; vals[i].first; i++) {
+      _os << ",\"" << vals[i].first << "\":";
+      writeJSONValue(_os,vals[i].second);
+    }
+    _os << "}";
+  }
+  //flush every row, so that a run can be inspected while it is optimizing
+  _os << std::endl;
+}
+scalarD SQPTelemetry::elapsed() const
+{
+  return std::chrono::duration<scalarD>(Clock::now()-_beg).count();
+}
+scalarD SQPTelemetry::lap()
+{
+  Clock::time_point now=Clock::now();
+  scalarD ret=std::chrono::duration<scalarD>(now-_lap).count();
+  _lap=now;
+  return ret;
+}
+std::string SQPTelemetry::suffixPath(const std::string& path,const std::string& suffix)
+{
+  if(path.empty())
+    return path;
+  std::string::size_type dot=path.find_last_of('.');
+  std::string::size_type slash=path.find_last_of("/\\");
+  if(dot==std::string::npos || (slash!=std::string::npos && dot<slash))
+    dot=path.size();
+  return path.substr(0,dot)+suffix+path.substr(dot);
+}
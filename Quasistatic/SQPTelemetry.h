@@ -0,0 +1,44 @@
+#ifndef SQP_TELEMETRY_H
+#define SQP_TELEMETRY_H
+
+#include <CommonFile/MathBasic.h>
+#include <fstream>
+#include <chrono>
+
+PRJ_BEGIN
+
+//one row per SQP iteration, times are in seconds
+struct SQPTelemetryRow
+{
+  SQPTelemetryRow();
+  sizeType _it;
+  scalarD _E,_dNorm,_cNorm,_alpha,_rho,_reg;
+  sizeType _lineSearchTrials;
+  std::string _status;
+  scalarD _timeAssemble,_timeQP,_timeLineSearch,_time;
+};
+//machine-readable per-iteration log of GraspPlanner::optimizeSQP
+//the format follows the extension of the path: .csv writes a header and comma separated rows,
+//anything else one JSON object per line (non-finite values are written as null)
+class SQPTelemetry
+{
+public:
+  typedef std::chrono::steady_clock Clock;
+  //append continues the file of a resumed optimization (without a second .csv header)
+  SQPTelemetry(const std::string& path,bool append=false);
+  bool enabled() const;
+  void write(const SQPTelemetryRow& row);
+  scalarD elapsed() const;
+  //seconds since the last call, used to split an iteration into phases
+  scalarD lap();
+  //insert suffix before the extension, e.g. the 3rd start of a multi-start run: a.jsonl -> a_start3.jsonl
+  static std::string suffixPath(const std::string& path,const std::string& suffix);
+private:
+  std::ofstream _os;
+  bool _csv;
+  Clock::time_point _beg,_lap;
+};
+
+PRJ_END
+
+#endif
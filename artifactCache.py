@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# Content-addressed cache for the generated .dat artifacts.
+#
+# mainGripper writes <urdf>_<density>.dat and mainPointCloudObject writes
+# <obj>_<density>_<scale>.dat (+ maxRange_Scale.txt).  Both binaries silently
+# reuse an existing .dat, so a stale file survives any change of the URDF, the
+# meshes or the OBJ.  Here an artifact is keyed on the sha256 of all its input
+# files (the URDF together with every mesh it references, or the OBJ), the
+# generation parameters and the generating binary.  Entries live in
+# <root>/<key[:2]>/<key>/ and are tracked in <root>/index.json with their size
+# and last access time, the cache is trimmed to maxBytes by evicting the least
+# recently used entries.
+import argparse,fcntl,hashlib,json,os,re,shutil,time
+
+GRIPPER='gripper'
+POINTCLOUD='pointcloud'
+
+def hashFile(path,h=None):
+    h=hashlib.sha256() if h is None else h
+    with open(path,'rb') as f:
+        for chunk in iter(lambda:f.read(1<<20),b''):
+            h.update(chunk)
+    return h
+
+def urdfInputs(urdf):
+    """The URDF itself and every existing file it references (meshes)"""
+    files=[os.path.abspath(urdf)]
+    with open(urdf,'r') as f:
+        text=f.read()
+    for ref in sorted(set(re.findall(r'filename\s*=\s*"([^"]+)"',text))):
+        ref=re.sub(r'^package://[^/]*/','',ref)
+        path=os.path.join(os.path.dirname(os.path.abspath(urdf)),ref)
+        if os.path.exists(path):
+            files.append(path)
+    return files
+
+def artifactKey(kind,inputs,params,binary=None):
+    """sha256 over kind, input contents (not paths), params and the binary"""
+    h=hashlib.sha256()
+    h.update(kind.encode())
+    for path in inputs:
+        h.update(b'\0file\0')
+        #paths relative to the first input, so that moving a dataset keeps its keys
+        h.update(os.path.relpath(path,os.path.dirname(inputs[0])).encode())
+        h.update(hashFile(path).digest())
+    for k in sorted(params):
+        h.update(('\0%s=%s'%(k,params[k])).encode())
+    if binary is not None and os.path.exists(binary):
+        h.update(b'\0binary\0')
+        h.update(hashFile(binary).digest())
+    return h.hexdigest()
+
+def gripperKey(urdf,density,binary=None):
+    return artifactKey(GRIPPER,urdfInputs(urdf),{'density':density},binary)
+
+def pointCloudKey(obj,density,scale,binary=None):
+    return artifactKey(POINTCLOUD,[os.path.abspath(obj)],{'density':density,'scale':'%f'%float(scale)},binary)
+
+class ArtifactCache:
+    def __init__(self,root,maxBytes=None):
+        self.root=os.path.abspath(root)
+        self.maxBytes=maxBytes
+        os.makedirs(self.root,exist_ok=True)
+
+    def entryDir(self,key):
+        return os.path.join(self.root,key[:2],key)
+
+    #index access is serialized across runner processes with a lock file
+    def _locked(self,func):
+        with open(os.path.join(self.root,'.lock'),'w') as lock:
+            fcntl.flock(lock,fcntl.LOCK_EX)
+            try:
+                index=self._readIndex()
+                ret=func(index)
+                self._writeIndex(index)
+                return ret
+            finally:
+                fcntl.flock(lock,fcntl.LOCK_UN)
+
+    def _readIndex(self):
+        path=os.path.join(self.root,'index.json')
+        if not os.path.exists(path):
+            return {}
+        with open(path,'r') as f:
+            return json.load(f)
+
+    def _writeIndex(self,index):
+        path=os.path.join(self.root,'index.json')
+        with open(path+'.tmp','w') as f:
+            json.dump(index,f,indent=2,sort_keys=True)
+        os.replace(path+'.tmp',path)
+
+    def _valid(self,index,key):
+        entry=index.get(key)
+        if entry is None:
+            return False
+        return all(os.path.exists(os.path.join(self.entryDir(key),name)) for name in entry['files'])
+
+    def lookup(self,key):
+        """Entry dir of a valid entry (and mark it as used) or None"""
+        def func(index):
+            if not self._valid(index,key):
+                index.pop(key,None)
+                return None
+            index[key]['lastAccess']=time.time()
+            return self.entryDir(key)
+        return self._locked(func)
+
+    def fetch(self,key,targets):
+        """Materialize a cached entry, targets maps file name->destination path"""
+        entry=self.lookup(key)
+        if entry is None:
+            return False
+        for name,dst in targets.items():
+            src=os.path.join(entry,name)
+            if not os.path.exists(src):
+                return False
+            linkOrCopy(src,dst)
+        return True
+
+    def store(self,key,sources,meta=None):
+        """Insert an entry, sources maps file name->generated file"""
+        entry=self.entryDir(key)
+        tmp=entry+'.tmp%d'%os.getpid()
+        shutil.rmtree(tmp,ignore_errors=True)
+        os.makedirs(tmp)
+        for name,src in sources.items():
+            shutil.copy2(src,os.path.join(tmp,name))
+        size=sum(os.path.getsize(os.path.join(tmp,name)) for name in sources)
+        def func(index):
+            shutil.rmtree(entry,ignore_errors=True)
+            os.rename(tmp,entry)
+            index[key]={'files':sorted(sources.keys()),'size':size,'created':time.time(),'lastAccess':time.time(),'meta':meta or {}}
+            self._evict(index,keep=key)
+        self._locked(func)
+
+    def _evict(self,index,keep=None):
+        if self.maxBytes is None:
+            return []
+        evicted=[]
+        total=sum(e['size'] for e in index.values())
+        for key in sorted(index,key=lambda k:index[k]['lastAccess']):
+            if total<=self.maxBytes:
+                break
+            if key==keep:
+                continue
+            total-=index[key]['size']
+            shutil.rmtree(self.entryDir(key),ignore_errors=True)
+            del index[key]
+            evicted.append(key)
+        return evicted
+
+    def evict(self):
+        return self._locked(self._evict)
+
+    def prune(self):
+        """Drop index entries whose files are gone and directories not in the index"""
+        def func(index):
+            for key in [k for k in index if not self._valid(index,k)]:
+                del index[key]
+            for sub in os.listdir(self.root):
+                subDir=os.path.join(self.root,sub)
+                if len(sub)!=2 or not os.path.isdir(subDir):
+                    continue
+                for key in os.listdir(subDir):
+                    if key not in index:
+                        shutil.rmtree(os.path.join(subDir,key),ignore_errors=True)
+        self._locked(func)
+
+    def entries(self):
+        return self._locked(lambda index:dict(index))
+
+def linkOrCopy(src,dst):
+    """Hardlink src to dst, copy if linking is impossible (e.g. across devices)"""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src,dst)
+    except OSError:
+        shutil.copy2(src,dst)
+
+def parseSize(size):
+    m=re.match(r'^\s*([0-9.]+)\s*([kKmMgGtT]?)[bB]?\s*$',size)
+    if m is None:
+        raise ValueError('cannot parse size: %s'%size)
+    return int(float(m.group(1))*1024**' KMGT'.index(m.group(2).upper() or ' '))
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description='Inspect or trim the artifact cache used by runDataset.py.')
+    parser.add_argument('--cache',default='artifactCache',help='cache folder')
+    parser.add_argument('--maxSize',default=None,help='evict least recently used entries down to this size, e.g. 2G')
+    parser.add_argument('--prune',action='store_true',help='remove broken and unindexed entries')
+    args=parser.parse_args()
+    cache=ArtifactCache(args.cache,parseSize(args.maxSize) if args.maxSize else None)
+    if args.prune:
+        cache.prune()
+    if args.maxSize:
+        for key in cache.evict():
+            print('Evicted %s'%key)
+    entries=cache.entries()
+    for key in sorted(entries,key=lambda k:entries[k]['lastAccess']):
+        e=entries[key]
+        print('%s %-10s %10d %s %s'%(key[:16],e['meta'].get('kind',''),e['size'],
+                                    time.strftime('%Y-%m-%d %H:%M',time.localtime(e['lastAccess'])),e['meta'].get('input','')))
+    print('%d entries, %d bytes'%(len(entries),sum(e['size'] for e in entries.values())))
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# Reproducible FGT vs. direct summation benchmark over mainGraspPlan.
+#
+# For every object, density and FGT threshold, mainGraspPlan is run in its
+# profile mode (max_iters=-N, savingDir "profile": only the normalExtrude=10
+# phase, then Q_INF of the result is printed) with useFGT=0 (direct summation)
+# and useFGT=1 (FGT).  Each configuration is repeated after a number of
+# discarded warmup runs, the per-iteration wall times come from the SQP
+# telemetry (see sqpTelemetry.py) of all repetitions, and median/IQR of the
+# time per SQP iteration, the FGT speedup and the Q_INF lost by FGT are
+# reported.  The direct runs do not depend on the FGT threshold and are shared.
+#
+#   python3 benchmarkFGT.py run -p build3 --out benchmarks/fgt.json
+#   python3 benchmarkFGT.py check --baseline benchmarks/fgt.json -p build3
+#
+# check runs the configurations of the baseline again (or compares against
+# --current) and exits with 1 if a median time per iteration grew by more than
+# --tolerance, the speedup dropped by more than --tolerance or the Q_INF loss
+# grew by more than --qinfTolerance.
+import argparse,hashlib,json,os,platform,re,shutil,subprocess,sys,time
+import numpy as np
+from runDataset import parseScript,datName
+from sqpTelemetry import load,PHASES
+
+DEFAULT_OBJECTS=['BarrettHand1','BarrettHand3','ShadowHand1','ShadowHand3']
+QINF=re.compile(r'Q_INF=([-+0-9.eEinfa]+)')
+
+def caseKey(name,density,thres=None):
+    return '%s/%s'%(name,density) if thres is None else '%s/%s/%s'%(name,density,thres)
+
+def stats(values):
+    values=np.asarray(values,dtype=np.float64)
+    if values.size==0:
+        return {'n':0,'median':None,'q25':None,'q75':None,'iqr':None}
+    q25,median,q75=np.percentile(values,[25,50,75])
+    return {'n':int(values.size),'median':float(median),'q25':float(q25),'q75':float(q75),'iqr':float(q75-q25)}
+
+def ensureData(obj,density,build,log):
+    """Object and gripper .dat of a density, generated like the GraspDataset scripts if missing"""
+    dat=os.path.join(obj['dir'],datName(obj['stem'],density,obj['scale']))
+    if not os.path.exists(dat):
+        subprocess.check_call([os.path.join(build,'mainPointCloudObject'),obj['stem']+'.obj',density,obj['scale']],cwd=obj['dir'],stdout=log,stderr=subprocess.STDOUT)
+    gripper=os.path.splitext(obj['urdf'])[0]+'_%s.dat'%density
+    if not os.path.exists(gripper):
+        subprocess.check_call([os.path.join(build,'mainGripper'),obj['urdf'],density,dat],cwd=obj['dir'],stdout=log,stderr=subprocess.STDOUT)
+    return dat
+
+def profileRun(obj,dat,density,useFGT,thres,args,scratch):
+    """One profile run, returns (per-iteration telemetry, Q_INF)"""
+    shutil.rmtree(scratch,ignore_errors=True)
+    os.makedirs(scratch)
+    telemetry=os.path.join(scratch,'telemetry.jsonl')
+    initial=os.path.abspath(args.initial) if args.initial else os.path.join(obj['dir'],'initialParameters.txt')
+    cmd=[os.path.join(os.path.abspath(args.build),'mainGraspPlan'),obj['urdf'],density,dat,obj['name'],obj['scale'],
+         str(useFGT),str(-abs(args.iters)),'profile',initial,thres if useFGT else '-',telemetry]
+    env=dict(os.environ)
+    env['OMP_NUM_THREADS']=str(args.ompThreads)
+    with open(os.path.join(scratch,'log.txt'),'w') as f:
+        f.write('# cmd: %s\n'%' '.join(cmd))
+        f.flush()
+        ret=subprocess.call(cmd,cwd=scratch,env=env,stdout=f,stderr=subprocess.STDOUT)
+    with open(os.path.join(scratch,'log.txt'),'r') as f:
+        m=QINF.findall(f.read())
+    if ret!=0:
+        raise RuntimeError('%s failed with exit code %d, see %s'%(' '.join(cmd),ret,os.path.join(scratch,'log.txt')))
+    #the profile mode only runs the normalExtrude=10 phase
+    data=load(os.path.join(scratch,'telemetry_extrude10.jsonl'))
+    return data,float(m[-1]) if m else None
+
+def measure(obj,dat,density,useFGT,thres,args):
+    """Repeated profile runs of one configuration, warmup runs are discarded"""
+    times={p:[] for p in PHASES+['iteration']}
+    iters,QInf=[],[]
+    scratch=os.path.join(os.path.abspath(args.workDir),obj['name'],'%s_%s'%(density,'fgt%s'%thres if useFGT else 'direct'))
+    for r in range(args.warmup+args.reps):
+        data,q=profileRun(obj,dat,density,useFGT,thres,args,scratch)
+        print('  %s %s run %d%s: %d iterations, Q_INF=%s'%(obj['name'],'FGT(%s)'%thres if useFGT else 'direct',r,' (warmup)' if r<args.warmup else '',len(data),q))
+        if r<args.warmup:
+            continue
+        #iterations that ended the run (converged/failed) are not full iterations
+        full=np.isin(data['status'],['accept','accept_retry','reject'])
+        for p in PHASES:
+            times[p].extend(data[p][full].tolist())
+        times['iteration'].extend(sum(data[p][full] for p in PHASES).tolist())
+        iters.append(len(data))
+        QInf.append(q)
+    ret={p:stats(v) for p,v in times.items()}
+    ret['iterations']=iters
+    ret['QInf']=QInf
+    return ret
+
+def binaryHash(build):
+    path=os.path.join(build,'mainGraspPlan')
+    if not os.path.exists(path):
+        return None
+    with open(path,'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def runSuite(args):
+    objs=[]
+    for name in args.objects:
+        obj=parseScript(os.path.join(args.root,name))
+        if obj is None:
+            print('Skipping %s: cannot parse %s.sh'%(name,name))
+        else:
+            objs.append(obj)
+    os.makedirs(args.workDir,exist_ok=True)
+    result={'meta':{'date':time.strftime('%Y-%m-%d %H:%M:%S'),'host':platform.node(),'machine':platform.machine(),
+                    'cpus':os.cpu_count(),'ompThreads':args.ompThreads,'reps':args.reps,'warmup':args.warmup,
+                    'iters':args.iters,'binary':binaryHash(args.build)},
+            'direct':{},'cases':{}}
+    with open(os.path.join(args.workDir,'generate.log'),'a') as log:
+        for obj in objs:
+            for density in args.densities:
+                dat=ensureData(obj,density,os.path.abspath(args.build),log)
+                direct=measure(obj,dat,density,0,None,args)
+                result['direct'][caseKey(obj['name'],density)]=direct
+                for thres in args.thres:
+                    fgt=measure(obj,dat,density,1,thres,args)
+                    case={'object':obj['name'],'hand':'BarrettHand' if 'BarrettHand' in obj['urdf'] else 'ShadowHand',
+                          'density':density,'FGTThres':thres,'fgt':fgt,'direct':caseKey(obj['name'],density)}
+                    dm,fm=direct['iteration']['median'],fgt['iteration']['median']
+                    case['speedup']=dm/fm if dm and fm else None
+                    #relative loss of Q_INF of the FGT results w.r.t. direct summation (positive: FGT is worse)
+                    pairs=[(d,f) for d,f in zip(direct['QInf'],fgt['QInf']) if d is not None and f is not None and d!=0]
+                    case['QInfLoss']=float(np.median([(d-f)/abs(d) for d,f in pairs])) if pairs else None
+                    result['cases'][caseKey(obj['name'],density,thres)]=case
+    return result
+
+def report(result):
+    print('%-28s %12s %10s %12s %10s %8s %10s'%('case','direct[ms]','IQR','FGT[ms]','IQR','speedup','QInfLoss'))
+    for key in sorted(result['cases']):
+        case=result['cases'][key]
+        d=result['direct'][case['direct']]['iteration']
+        f=case['fgt']['iteration']
+        fmt=lambda v,s='%12.3f':s%(v*1000) if v is not None else '%12s'%'-'
+        print('%-28s %s %s %s %s %8s %10s'%(key,fmt(d['median']),fmt(d['iqr'],'%10.3f'),fmt(f['median']),fmt(f['iqr'],'%10.3f'),
+                                           '%.2f'%case['speedup'] if case['speedup'] else '-',
+                                           '%.2e'%case['QInfLoss'] if case['QInfLoss'] is not None else '-'))
+
+def check(baseline,current,tolerance,qinfTolerance):
+    """Regressions of current w.r.t. baseline as a list of messages"""
+    flags=[]
+    def slower(what,b,c):
+        if b is not None and c is not None and c>b*(1+tolerance):
+            flags.append('%s: %.3fms -> %.3fms (+%.0f%%)'%(what,b*1000,c*1000,(c/b-1)*100))
+    for key,b in sorted(baseline['direct'].items()):
+        c=current['direct'].get(key)
+        if c is None:
+            flags.append('%s: missing in current results'%key)
+            continue
+        slower('%s direct'%key,b['iteration']['median'],c['iteration']['median'])
+    for key,b in sorted(baseline['cases'].items()):
+        c=current['cases'].get(key)
+        if c is None:
+            flags.append('%s: missing in current results'%key)
+            continue
+        slower('%s FGT'%key,b['fgt']['iteration']['median'],c['fgt']['iteration']['median'])
+        if b['speedup'] and c['speedup'] and c['speedup']<b['speedup']*(1-tolerance):
+            flags.append('%s: speedup %.2f -> %.2f'%(key,b['speedup'],c['speedup']))
+        if b['QInfLoss'] is not None and c['QInfLoss'] is not None and c['QInfLoss']>b['QInfLoss']+qinfTolerance:
+            flags.append('%s: Q_INF loss %.2e -> %.2e'%(key,b['QInfLoss'],c['QInfLoss']))
+    return flags
+
+def addRunArguments(parser):
+    parser.add_argument('-p','--build',default='build3',help='path to the build folder with mainGraspPlan/mainPointCloudObject/mainGripper')
+    parser.add_argument('--root',default='GraspDataset',help='dataset folder containing one folder per object')
+    parser.add_argument('-n','--iters',type=int,default=100,help='SQP iterations of each profile run')
+    parser.add_argument('-r','--reps',type=int,default=5,help='measured repetitions of each configuration')
+    parser.add_argument('-w','--warmup',type=int,default=1,help='discarded warmup runs of each configuration')
+    parser.add_argument('-t','--ompThreads',type=int,default=1,help='OMP_NUM_THREADS of the runs')
+    parser.add_argument('-i','--initial',default=None,help='initial parameters (default: initialParameters.txt of each object)')
+    parser.add_argument('--workDir',default='benchLogs',help='scratch folder for logs and telemetry of the runs')
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description='Benchmark FGT against direct summation in mainGraspPlan.')
+    sub=parser.add_subparsers(dest='command')
+    run=sub.add_parser('run',help='run the benchmark and write a JSON baseline')
+    addRunArguments(run)
+    run.add_argument('--objects',nargs='*',default=DEFAULT_OBJECTS)
+    run.add_argument('--densities',nargs='*',default=['100','200','400'])
+    run.add_argument('--thres',nargs='*',default=['1e-6','1e-4'],help='FGT thresholds')
+    run.add_argument('--out',default='benchmarks/fgt.json')
+    chk=sub.add_parser('check',help='compare against a JSON baseline and flag regressions')
+    addRunArguments(chk)
+    chk.add_argument('--baseline',required=True)
+    chk.add_argument('--current',default=None,help='compare these results instead of running the baseline configurations')
+    chk.add_argument('--out',default=None,help='also save the new results')
+    chk.add_argument('--tolerance',type=float,default=0.1,help='allowed relative slowdown of the median time per iteration and of the speedup')
+    chk.add_argument('--qinfTolerance',type=float,default=1e-3,help='allowed increase of the relative Q_INF loss')
+    args=parser.parse_args()
+    if args.command is None:
+        parser.error('missing command: run or check')
+    if args.command=='run':
+        result=runSuite(args)
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)),exist_ok=True)
+        with open(args.out,'w') as f:
+            json.dump(result,f,indent=2,sort_keys=True)
+        report(result)
+        sys.exit(0)
+    with open(args.baseline,'r') as f:
+        baseline=json.load(f)
+    if args.current:
+        with open(args.current,'r') as f:
+            current=json.load(f)
+    else:
+        cases=baseline['cases'].values()
+        args.objects=sorted({c['object'] for c in cases})
+        args.densities=sorted({c['density'] for c in cases},key=float)
+        args.thres=sorted({c['FGTThres'] for c in cases},key=float)
+        current=runSuite(args)
+        if args.out:
+            with open(args.out,'w') as f:
+                json.dump(current,f,indent=2,sort_keys=True)
+    report(current)
+    flags=check(baseline,current,args.tolerance,args.qinfTolerance)
+    for flag in flags:
+        print('[REGRESSION] %s'%flag)
+    print('%d regressions (tolerance %.0f%%)'%(len(flags),args.tolerance*100))
+    sys.exit(1 if flags else 0)
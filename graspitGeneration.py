@@ -1,83 +1,131 @@
 from sys import path
 import numpy as np
 import re
+import os
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+CHUNK_SIZE = 1 << 25
+
+def readChunks(objPath):
+    # chunks of whole lines (as bytes), so that no record is split
+    with open(objPath, 'rb') as fin:
+        while True:
+            chunk = fin.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            chunk += fin.readline()
+            if not chunk.endswith(b'\n'):
+                chunk += b'\n'
+            yield chunk
+
+def recordRuns(chunk, tag=b'v'):
+    """
+    Byte ranges [beg,end) of the runs of consecutive records with the given one letter tag in chunk
+    Lines are classified by their first two bytes at once, vn/vt/vp records are not positions
+    """
+    buf = np.frombuffer(chunk, dtype=np.uint8)
+    ends = np.flatnonzero(buf == ord('\n')) + 1
+    begs = np.concatenate(([0], ends[:-1]))
+    c0 = buf[begs]
+    c1 = buf[np.minimum(begs + 1, len(buf) - 1)]
+    isTag = (c0 == tag[0]) & ((c1 == ord(' ')) | (c1 == ord('\t')))
+    edges = np.diff(np.concatenate(([0], isTag.astype(np.int8), [0])))
+    first = np.flatnonzero(edges == 1)
+    last = np.flatnonzero(edges == -1)
+    return zip(begs[first].tolist(), ends[last - 1].tolist(), (last - first).tolist())
+
+def parseVertexRun(run, n):
+    values = np.fromstring(run.decode().replace('v', ' '), sep=' ')
+    if values.size == 3 * n:
+        return values.reshape(-1, 3)
+    # optional w or color components, only keep x y z
+    return np.array([l.split()[1:4] for l in run.splitlines()], dtype=np.float64)
+
+def parseFaceRun(run, n, nv):
+    """
+    Vertex indices (flat, 0-based) and the number of vertices of each face in a run of n face records
+    The texture/normal references (f 1/2/3 ...) are dropped, negative indices are relative to the nv vertices read so far
+    """
+    run = re.sub(rb'/\S*', b'', run)
+    buf = np.frombuffer(run, dtype=np.uint8)
+    ws = (buf == ord(' ')) | (buf == ord('\t')) | (buf == ord('\r')) | (buf == ord('\n'))
+    tokenBeg = ~ws & np.concatenate(([True], ws[:-1]))
+    nl = buf == ord('\n')
+    line = np.cumsum(nl) - nl
+    counts = np.bincount(line[tokenBeg], minlength=n) - 1
+    indices = np.fromstring(run.decode().replace('f', ' '), dtype=np.int64, sep=' ')
+    if indices.size != counts.sum():
+        raise ValueError('cannot parse face records: %s' % run.splitlines()[0].decode())
+    return np.where(indices < 0, indices + nv, indices - 1), counts
+
+def readVertices(objPath):
+    """
+    Read all geometric vertices of an obj file into a (n,3) array
+    Each run of vertex records is parsed by numpy at once instead of line by line
+    """
+    vs = [parseVertexRun(chunk[beg:end], n) for chunk in readChunks(objPath) for beg, end, n in recordRuns(chunk)]
+    return np.concatenate(vs) if vs else np.zeros((0, 3))
+
+def readMesh(objPath):
+    """
+    Read vertices (n,3) and faces (flat indices, vertex count per face) of an obj file in one pass
+    """
+    vs, fs, cs = [], [], []
+    nv = 0
+    for chunk in readChunks(objPath):
+        runs = [(beg, end, n, b'v') for beg, end, n in recordRuns(chunk, b'v')] + \
+               [(beg, end, n, b'f') for beg, end, n in recordRuns(chunk, b'f')]
+        for beg, end, n, tag in sorted(runs):
+            if tag == b'v':
+                vs.append(parseVertexRun(chunk[beg:end], n))
+                nv += n
+            else:
+                f, c = parseFaceRun(chunk[beg:end], n, nv)
+                fs.append(f)
+                cs.append(c)
+    v = np.concatenate(vs) if vs else np.zeros((0, 3))
+    f = np.concatenate(fs) if fs else np.zeros(0, dtype=np.int64)
+    c = np.concatenate(cs) if cs else np.zeros(0, dtype=np.int64)
+    return v, f, c
+
+def formatVertices(v, prefix='v '):
+    return ((prefix + '%r %r %r\n') * v.shape[0]) % tuple(v.ravel().tolist())
+
+def formatFaces(f, counts):
+    # faces with the same number of vertices are formatted together
+    out = []
+    splits = np.flatnonzero(np.diff(counts)) + 1
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    for beg, end in zip(np.concatenate(([0], splits)).tolist(), np.concatenate((splits, [len(counts)])).tolist()):
+        k = int(counts[beg])
+        rows = f[offsets[beg]:offsets[end]].reshape(-1, k)
+        rows = np.concatenate((np.full((rows.shape[0], 1), k), rows), axis=1)
+        out.append((('%d' + ' %d' * k + '\n') * rows.shape[0]) % tuple(rows.ravel().tolist()))
+    return ''.join(out)
+
+def writeScaledObj(objPath, v, outputs):
+    """
+    Stream objPath to every (path, factor) in outputs, replacing the i-th vertex record by factor*v[i]
+    All other records (vn, vt, f, ...) are copied through unchanged without being kept in memory
+    """
+    fouts = [(open(path, 'wb'), factor) for path, factor in outputs]
+    try:
+        off = 0
+        for chunk in readChunks(objPath):
+            last = 0
+            for beg, end, n in recordRuns(chunk):
+                for fout, factor in fouts:
+                    fout.write(chunk[last:beg])
+                    fout.write(formatVertices(v[off:off + n] * factor).encode())
+                off += n
+                last = end
+            for fout, _ in fouts:
+                fout.write(chunk[last:])
+    finally:
+        for fout, _ in fouts:
+            fout.close()
 
-parser = argparse.ArgumentParser(description='Convert Obj to .off and generate Graspit xml files')
-parser.add_argument('--inputPath', type=str, help='Path to the maxRange_Scale.txt file')
-
-args = parser.parse_args()
-maxRange_scale_path = args.inputPath
-path_elements = maxRange_scale_path.split('/')
-path_elements[-1] = path_elements[-2] + '.obj'
-inputPath = '/'.join(path_elements)
-
-vertices = []
-faces = ''
-with open(inputPath, 'r') as fin:
-    for line in fin:
-        if line[0] == 'v' or line[0:2]=='vt':
-            try:
-                vertices.append([*map(lambda x: -1 * float(x[1:]) if x[0]=="-" else float(x), [i for i in line.replace('\n', '').split(" ")[1:] if i != ''])])
-            except IndexError:
-                print(line)
-                print([i for i in line.replace('\n', '').split(" ")[1:] if i != ''])
-                exit(1)
-        if line[0] == "f":
-            faces += line
-try:
-    with open(maxRange_scale_path, 'r') as f:
-        content = f.readlines()
-        scale = float(content[1])
-        if path_elements[-2] == 'ShadowHand10' or path_elements[-2]== 'BarrettHand10':
-            scale=1.0
-        maxRange = np.array([*map(lambda x: -1 * float(x[1:]) if x[0]=="-" else float(x), content[0].split(" ")[:-1])])
-        # print(scale)
-        # print(maxRange)
-except FileNotFoundError:
-    print(f"PLEASE RUN \'{path_elements[-2]+'.sh'}\' FIRST TO GET THE \'maxRange_Scale.txt\' FILE!")
-    exit(1)
-v = np.array(vertices)
-# print(np.max(v[:,0]), np.min(v[:,0]))
-# print(np.max(v[:,1]), np.min(v[:,1]))
-# print(np.max(v[:,2]), np.min(v[:,2]))
-v *= scale
-
-centroid_before = np.array([np.max(v[:,0]), np.max(v[:,1]), np.max(v[:,2])])
-centroid_after = maxRange
-movement = centroid_after - centroid_before
-
-v += movement
-# print(f'movement = {movement}')
-# print(np.max(v[:,0]), np.min(v[:,0]))
-# print(np.max(v[:,1]), np.min(v[:,1]))
-# print(np.max(v[:,2]), np.min(v[:,2]))  
-
-path_elements[-1] = path_elements[-2] + '_small_tmp.obj'
-if path_elements[-2] == 'ShadowHand2':
-    # print(np.array([np.max(v[:,0]), np.max(v[:,1]), np.max(v[:,2])]))
-    v -= np.array([np.max(v[:,0]), np.max(v[:,1]), np.max(v[:,2])])
-# print(f'movement = {movement}')
-# print(np.max(v[:,0]), np.min(v[:,0]))
-# print(np.max(v[:,1]), np.min(v[:,1]))
-# print(np.max(v[:,2]), np.min(v[:,2]))    
-
-obj_output_path = '/'.join(path_elements)
-with open(obj_output_path, 'w') as fout:
-    for i in range(v.shape[0]):
-        line = f'v {v[i, 0]} {v[i, 1]} {v[i, 2]}\n'
-        fout.write(line)
-    fout.write(faces)
-v *= 1000
-
-path_elements[-1] = path_elements[-2] + '_small.obj'
-obj_output_path = '/'.join(path_elements)
-with open(obj_output_path, 'w') as fout:
-    for i in range(v.shape[0]):
-        line = f'v {v[i, 0]} {v[i, 1]} {v[i, 2]}\n'
-        fout.write(line)
-    fout.write(faces)
-print("SCALED .OBJ FILE GENERATED!")
 def obj2off(objpath, offpath):
     '''
     Convert obj file to off file
@@ -85,70 +133,132 @@ def obj2off(objpath, offpath):
          :param offpath: the save address of the path of the .off file
          :return: none
     '''
-    line = ""
-
-    vset = []
-    fset = []
-    with open(objpath,'r') as f:
-        lines = f.readlines()
-    p = re.compile(r'/+')
-    space = re.compile(r' +')
-
-    for line in lines:
-                 #Get a line in the obj file as a string
-        tailMark = " "
-        line = line+tailMark
-        if line[0]!='v' and line[0]!='f' :
+    v, f, counts = readMesh(objpath)
+    with open(offpath, 'w') as out:
+        out.write("OFF\n")
+        out.write("%d %d 0\n" % (v.shape[0], counts.shape[0]))
+        out.write(formatVertices(v, prefix=''))
+        out.write(formatFaces(f, counts))
+    print("{} converts to {} success!".format(os.path.basename(objpath), os.path.basename(offpath)))
+
+def outputPaths(maxRange_scale_path):
+    """
+    All files generated for the object of maxRange_scale_path (.../GraspDataset/XXX/maxRange_Scale.txt)
+    """
+    path_elements = maxRange_scale_path.split('/')
+    name = path_elements[-2]
+    objDir = '/'.join(path_elements[:-1])
+    graspitDir = '/'.join(path_elements[:-3]) + '/GraspItDataset'
+    return {'obj': objDir + '/' + name + '.obj',
+            'params': objDir + '/initialParameters.txt',
+            'obj_tmp': objDir + '/' + name + '_small_tmp.obj',
+            'obj_small': objDir + '/' + name + '_small.obj',
+            'off': graspitDir + '/' + name + '_small.off',
+            'xml': graspitDir + '/' + name + '_small.xml',
+            'params_graspit': graspitDir + '/' + name + '_small_initialParameters.txt'}
+
+def upToDate(maxRange_scale_path):
+    paths = outputPaths(maxRange_scale_path)
+    inputs = [maxRange_scale_path, paths['obj'], paths['params']]
+    outputs = [paths[k] for k in ['obj_tmp', 'obj_small', 'off', 'xml', 'params_graspit']]
+    if not all(os.path.exists(p) for p in outputs):
+        return False
+    return min(os.path.getmtime(p) for p in outputs) >= max(os.path.getmtime(p) for p in inputs)
+
+def generate(maxRange_scale_path):
+    '''
+    Generate the scaled .obj files and the GraspIt .off, .xml and parameter files of one object
+         :param maxRange_scale_path: path to the maxRange_Scale.txt file of the object
+         :return: none
+    '''
+    name = maxRange_scale_path.split('/')[-2]
+    paths = outputPaths(maxRange_scale_path)
+    with open(maxRange_scale_path, 'r') as f:
+        content = f.readlines()
+        scale = float(content[1])
+        if name == 'ShadowHand10' or name == 'BarrettHand10':
+            scale = 1.0
+        maxRange = np.array(content[0].split(), dtype=np.float64)
+
+    v = readVertices(paths['obj'])
+    v *= scale
+
+    # align the maximal corner with the one of the sampled point cloud
+    centroid_before = v.max(axis=0)
+    centroid_after = maxRange
+    movement = centroid_after - centroid_before
+
+    v += movement
+
+    if name == 'ShadowHand2':
+        v -= v.max(axis=0)
+
+    writeScaledObj(paths['obj'], v, [(paths['obj_tmp'], 1.0), (paths['obj_small'], 1000.0)])
+    print("SCALED .OBJ FILE GENERATED!")
+
+    os.makedirs(os.path.dirname(paths['off']), exist_ok=True)
+    obj2off(paths['obj_small'], paths['off'])
+    with open(paths['xml'], 'w') as xml:
+        xml.write(f'<root>\n\t<material>plastic</material>/n/t<mass>100</mass>\n\t<cog>0 0 0</cog>\n\t<geometryFile type="off">{name+"_small.off"}</geometryFile>\n</root>')
+    with open(paths['params'], 'r') as params:
+        content = params.readlines()
+        with open(paths['params_graspit'], 'w') as out_params:
+            out_params.write(content[0])
+
+    print("GRASPIT REQUIRED FILES GENERATED!")
+
+def generateSafe(maxRange_scale_path):
+    # executed in a worker process of the batch mode, returns an error message or None
+    try:
+        generate(maxRange_scale_path)
+    except Exception as e:
+        return '%s: %s' % (type(e).__name__, str(e))
+    return None
+
+def generateAll(root, names=(), jobs=0, force=False):
+    """
+    Run generate for every object folder of root on a process pool, skipping objects whose outputs are newer than their inputs
+    Returns the number of failed objects
+    """
+    todo = []
+    for name in sorted(os.listdir(root)):
+        if not re.match(r'^(BarrettHand|ShadowHand)\d+$', name):
+            continue
+        if names and name not in names:
             continue
+        maxRange_scale_path = os.path.abspath(os.path.join(root, name, 'maxRange_Scale.txt'))
+        if not os.path.exists(maxRange_scale_path):
+            print(f"Skipping {name}: PLEASE RUN \'{name+'.sh'}\' FIRST TO GET THE \'maxRange_Scale.txt\' FILE!")
+        elif not os.path.exists(os.path.join(root, name, name + '.obj')):
+            print(f"Skipping {name}: missing {name}.obj")
+        elif not force and upToDate(maxRange_scale_path):
+            print(f"Skipping {name}: up to date")
+        else:
+            todo.append(maxRange_scale_path)
+    failed = 0
+    with ProcessPoolExecutor(max_workers=jobs if jobs > 0 else None) as pool:
+        for maxRange_scale_path, error in zip(todo, pool.map(generateSafe, todo)):
+            if error is not None:
+                failed += 1
+                print(f"[FAIL] {maxRange_scale_path.split('/')[-2]}: {error}")
+    print(f"{len(todo) - failed}/{len(todo)} objects converted")
+    return failed
 
-        parameters = space.split(line.strip())
-        if parameters[0] == "v": #if it is a vertex
-            Point = []
-            Point.append(eval( parameters[1]) )
-            Point.append(eval( parameters[2]) )
-            Point.append(eval( parameters[3]) )
-            vset.append(Point)
-
-        elif parameters[0] == "f": #if it is a face, the index of the vertices is stored
-            vIndexSets = [] # collection of temporary storage points
-            for i in range(1,len(parameters) ):
-                x = parameters[i]
-                ans = p.split(x)[0]
-                index = eval(ans)
-                index -= 1 #Because the vertex index starts at 1 in the obj file, and the vertex we store starts at 0, so we want to subtract 1
-                vIndexSets.append(index)
-
-                fset.append(vIndexSets)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert Obj to .off and generate Graspit xml files')
+    parser.add_argument('--inputPath', type=str, help='Path to the maxRange_Scale.txt file')
+    parser.add_argument('--root', type=str, default=None, help='Convert every object of this dataset folder (e.g. GraspDataset) instead')
+    parser.add_argument('--objects', nargs='*', default=[], help='Only convert these objects of --root, e.g. BarrettHand1 ShadowHand3')
+    parser.add_argument('-j', '--jobs', type=int, default=0, help='Number of worker processes of --root (default: #cores)')
+    parser.add_argument('--force', action='store_true', help='Regenerate outputs of --root that are already up to date')
 
-    with open(offpath, 'w') as out:
-        out = open(offpath, 'w')
-        out.write("OFF\n")
-        out.write(str(vset.__len__()) + " " + str(fset.__len__()) + " 0\n")
-        for j in range(len(vset)):
-            out.write(str(vset[j][0]) + " " + str(vset[j][1]) + " " + str(vset[j][2]) + "\n")
-
-        for i in range(len(fset)):
-            s = str(len( fset[i] ))
-            for j in range( len( fset[i] ) ):
-                s = s+ " "+ str(fset[i][j])
-            s += "\n"
-            out.write(s)
-
-        print("{} converts to {} success!".format( p.split(objpath)[-1], p.split(offpath)[-1] ))
-
-path_elements[-1] = path_elements[-2] + '_small.off'
-off_path ='/'.join(path_elements[:-3]) + '/GraspItDataset/' + path_elements[-2] + '_small.off'
-obj2off(obj_output_path, off_path)
-xml_path = '/'.join(path_elements[:-3]) + '/GraspItDataset/' + path_elements[-2] + '_small.xml'
-path_elements[-1] = 'initialParameters.txt'
-init_param_path1 = '/'.join(path_elements)
-init_param_path2 = '/'.join(path_elements[:-3]) + '/GraspItDataset/' + path_elements[-2] + '_small_initialParameters.txt'
-
-with open(xml_path, 'w') as xml:
-    xml.write(f'<root>\n\t<material>plastic</material>/n/t<mass>100</mass>\n\t<cog>0 0 0</cog>\n\t<geometryFile type="off">{path_elements[-2]+"_small.off"}</geometryFile>\n</root>')
-with open(init_param_path1, 'r') as params:
-    content = params.readlines()
-    with open(init_param_path2, 'w') as out_params:
-        out_params.write(content[0])
-
-print("GRASPIT REQUIRED FILES GENERATED!")
\ No newline at end of file
+    args = parser.parse_args()
+    if args.root is not None:
+        exit(1 if generateAll(args.root, set(args.objects), args.jobs, args.force) else 0)
+    if args.inputPath is None:
+        parser.error('either --inputPath or --root is required')
+    if not os.path.exists(args.inputPath):
+        path_elements = args.inputPath.split('/')
+        print(f"PLEASE RUN \'{path_elements[-2]+'.sh'}\' FIRST TO GET THE \'maxRange_Scale.txt\' FILE!")
+        exit(1)
+    generate(args.inputPath)
@@ -0,0 +1,179 @@
+#include <Quasistatic/GraspPlanner.h>
+#include <Utils/Utils.h>
+#include <CommonFile/Profiler.h>
+#include <pybind11/pybind11.h>
+#include <pybind11/eigen.h>
+#include <pybind11/stl.h>
+
+//Python bindings for a long-lived planning process: the gripper and the objects
+//are loaded once and kept resident, every request only calls optimize/evaluateQInf.
+//Point clouds and gij are returned as read-only NumPy views into the C++ storage
+//(they stay valid as long as the owning object is alive), input vectors are
+//accepted as Eigen::Ref so that contiguous float64 arrays are not converted.
+//A GraspPlanner is stateful during optimize, use one planner per worker thread,
+//the GIL is released while optimizing.
+USE_PRJ_NAMESPACE
+namespace py=pybind11;
+
+typedef double T;
+typedef GraspPlanner<T>::Vec Vec;
+typedef GraspPlanner<T>::MatT MatT;
+typedef GraspPlanner<T>::Mat3XT Mat3XT;
+typedef Eigen::Ref<const Vec> VecCRef;
+template <typename TYPE>
+std::shared_ptr<TYPE> load(const std::string& path)
+{
+  //raise in python instead of aborting the interpreter
+  if(!exists(path))
+    throw std::runtime_error("Cannot find file: "+path);
+  std::shared_ptr<TYPE> ret(new TYPE);
+  //both the stream and the memory-mapped format are accepted
+  if(!ret->readMapped(path))
+    throw py::value_error("Cannot read "+path+" as "+ret->type());
+  return ret;
+}
+PYBIND11_MODULE(pyLibDiff,m)
+{
+  m.doc()="Grasp planning with GraspPlanner/PointCloudObject";
+  mpfr_set_default_prec(1024U);
+  RandEngine::useDeterministic();
+  RandEngine::seed(0);
+  m.def("setPrecision",[](sizeType bits) {
+    mpfr_set_default_prec((mpfr_prec_t)bits);
+  },py::arg("bits")=1024);
+  m.def("seed",[](sizeType s) {
+    RandEngine::seed(s);
+  },py::arg("seed")=0);
+  m.def("enableProfiler",&enableProfiler);
+  m.def("disableProfiler",&disableProfiler);
+  m.def("resetProfiler",&resetProfiler);
+  m.def("writeProfileTrace",&writeProfileTrace,py::arg("path"));
+  m.def("writeProfileSummary",[](const std::string& path) {
+    writeProfileSummary(path);
+  },py::arg("path"));
+
+  py::enum_<METRIC_TYPE>(m,"METRIC_TYPE")
+  .value("Q_1",Q_1)
+  .value("Q_INF",Q_INF)
+  .value("Q_INF_CONSTRAINT",Q_INF_CONSTRAINT)
+  .value("Q_INF_CONSTRAINT_FGT",Q_INF_CONSTRAINT_FGT)
+  .value("Q_INF_BARRIER",Q_INF_BARRIER)
+  .value("NO_METRIC",NO_METRIC)
+  .export_values();
+  py::enum_<METRIC_ACTIVATION>(m,"METRIC_ACTIVATION")
+  .value("EXP_ACTIVATION",EXP_ACTIVATION)
+  .value("SQR_EXP_ACTIVATION",SQR_EXP_ACTIVATION)
+  .value("INVERSE_ACTIVATION",INVERSE_ACTIVATION)
+  .value("SQR_INVERSE_ACTIVATION",SQR_INVERSE_ACTIVATION)
+  .export_values();
+
+  py::class_<GraspPlannerParameter>(m,"GraspPlannerParameter")
+  .def(py::init([]() {
+    Options ops;
+    return GraspPlannerParameter(ops);
+  }))
+  .def_readwrite("d0",&GraspPlannerParameter::_d0)
+  .def_readwrite("alpha",&GraspPlannerParameter::_alpha)
+  .def_readwrite("metricTol",&GraspPlannerParameter::_metricTol)
+  .def_readwrite("metric",&GraspPlannerParameter::_metric)
+  .def_readwrite("activation",&GraspPlannerParameter::_activation)
+  .def_readwrite("normalExtrude",&GraspPlannerParameter::_normalExtrude)
+  .def_readwrite("FGTThres",&GraspPlannerParameter::_FGTThres)
+  .def_readwrite("FGTIncremental",&GraspPlannerParameter::_FGTIncremental)
+  .def_readwrite("coefM",&GraspPlannerParameter::_coefM)
+  .def_readwrite("coefOC",&GraspPlannerParameter::_coefOC)
+  .def_readwrite("coefCC",&GraspPlannerParameter::_coefCC)
+  .def_readwrite("coefO",&GraspPlannerParameter::_coefO)
+  .def_readwrite("coefS",&GraspPlannerParameter::_coefS)
+  .def_readwrite("useGJK",&GraspPlannerParameter::_useGJK)
+  .def_readwrite("skin",&GraspPlannerParameter::_skin)
+  .def_readwrite("levels",&GraspPlannerParameter::_levels)
+  .def_readwrite("levelRatio",&GraspPlannerParameter::_levelRatio)
+  .def_readwrite("levelIter",&GraspPlannerParameter::_levelIter)
+  .def_readwrite("levelThres",&GraspPlannerParameter::_levelThres)
+  .def_readwrite("rho0",&GraspPlannerParameter::_rho0)
+  .def_readwrite("thres",&GraspPlannerParameter::_thres)
+  .def_readwrite("alphaThres",&GraspPlannerParameter::_alphaThres)
+  .def_readwrite("lineSearchBatch",&GraspPlannerParameter::_lineSearchBatch)
+  .def_readwrite("callback",&GraspPlannerParameter::_callback)
+  .def_readwrite("sparse",&GraspPlannerParameter::_sparse)
+  .def_readwrite("maxIter",&GraspPlannerParameter::_maxIter)
+  .def_readwrite("timeBudget",&GraspPlannerParameter::_timeBudget)
+  .def_readwrite("targetQInf",&GraspPlannerParameter::_targetQInf)
+  .def_readwrite("telemetry",&GraspPlannerParameter::_telemetry)
+  .def_readwrite("checkpoint",&GraspPlannerParameter::_checkpoint)
+  .def_readwrite("checkpointInterval",&GraspPlannerParameter::_checkpointInterval)
+  .def_readwrite("resume",&GraspPlannerParameter::_resume);
+
+  py::class_<PointCloudObject<T>,std::shared_ptr<PointCloudObject<T>>>(m,"PointCloudObject")
+  .def_static("load",&load<PointCloudObject<T>>,py::arg("path"))
+  .def("write",[](const PointCloudObject<T>& o,const std::string& path) {
+    return o.SerializableBase::write(path);
+  })
+  .def("writeMapped",&PointCloudObject<T>::writeMapped,py::arg("path"))
+  .def_property_readonly("pss",[](const PointCloudObject<T>& o)->const Mat3XT& {
+    return o.pss();
+  },py::return_value_policy::reference_internal)
+  .def_property_readonly("nss",[](const PointCloudObject<T>& o)->const Mat3XT& {
+    return o.nss();
+  },py::return_value_policy::reference_internal)
+  .def_property_readonly("gij",[](py::object self)->py::object {
+    //a dense gij is viewed in place with the object as base, a compressed one has no dense storage and is expanded
+    const PointCloudObject<T>& o=self.cast<const PointCloudObject<T>&>();
+    if(o.gij().mode()==GijMatrix<T>::DENSE)
+      return py::cast(o.gij().dense(),py::return_value_policy::reference_internal,self);
+    return py::cast(o.gij().toDense());
+  })
+  .def("compressGij",[](PointCloudObject<T>& o,sizeType mode,T tol) {
+    o.compressGij((typename GijMatrix<T>::MODE)mode,tol);
+    return o.gij().error();
+  },py::arg("mode"),py::arg("tol"))
+  .def("extrudedPss",[](const PointCloudObject<T>& o,T normalExtrude) {
+    return o.pss(normalExtrude);
+  },py::arg("normalExtrude"))
+  .def("computeQInf",[](const PointCloudObject<T>& o,VecCRef w) {
+    return o.computeQInf(w);
+  },py::arg("w"))
+  .def("computeQ1",[](const PointCloudObject<T>& o,VecCRef w) {
+    return o.computeQ1(w);
+  },py::arg("w"))
+  .def("buildLevels",&PointCloudObject<T>::buildLevels,py::arg("nrCoarse"),py::arg("ratio")=2)
+  .def("level",&PointCloudObject<T>::level,py::arg("l"),py::return_value_policy::reference_internal)
+  .def_property_readonly("nrLevel",&PointCloudObject<T>::nrLevel)
+  .def("writeVTK",&PointCloudObject<T>::writeVTK,py::arg("path"),py::arg("len"),py::arg("normalExtrude")=0);
+
+  py::class_<GraspPlanner<T>,std::shared_ptr<GraspPlanner<T>>>(m,"GraspPlanner")
+  .def_static("load",&load<GraspPlanner<T>>,py::arg("path"))
+  .def("writeMapped",&GraspPlanner<T>::writeMapped,py::arg("path"))
+  .def("buildSelfIndex",&GraspPlanner<T>::buildSelfIndex,py::arg("nrSample"),py::arg("margin"))
+  .def_property_readonly("nrDOF",[](const GraspPlanner<T>& p) {
+    return p.body().nrDOF();
+  })
+  .def_property_readonly("rad",&GraspPlanner<T>::rad)
+  .def_property_readonly("area",&GraspPlanner<T>::area)
+  .def("optimize",[](GraspPlanner<T>& p,VecCRef init,PointCloudObject<T>& object,GraspPlannerParameter& ops) {
+    py::gil_scoped_release release;
+    return p.optimize(false,init,object,ops);
+  },py::arg("init"),py::arg("object"),py::arg("param"))
+  .def("optimizeMultiStart",[](const GraspPlanner<T>& p,const std::vector<Vec>& inits,PointCloudObject<T>& object,const GraspPlannerParameter& ops) {
+    py::gil_scoped_release release;
+    std::vector<sizeType> nrIter;
+    std::vector<T> QInf;
+    std::vector<Vec> xs=p.optimizeMultiStart(inits,object,ops,&nrIter,&QInf);
+    return std::make_tuple(xs,nrIter,QInf);
+  },py::arg("inits"),py::arg("object"),py::arg("param"))
+  .def("evaluateQInf",[](GraspPlanner<T>& p,VecCRef x,PointCloudObject<T>& object,GraspPlannerParameter& ops) {
+    py::gil_scoped_release release;
+    Vec xEval=x;
+    return p.evaluateQInf(xEval,object,ops);
+  },py::arg("x"),py::arg("object"),py::arg("param"))
+  .def("evaluateBatch",[](const GraspPlanner<T>& p,const MatT& xs,const PointCloudObject<T>& object,const GraspPlannerParameter& ops) {
+    if(xs.cols()!=p.body().nrDOF() && xs.cols()<p.A().cols())
+      throw py::value_error("Configurations have "+std::to_string(xs.cols())+" values, expected "+std::to_string(p.body().nrDOF())+" (full) or at least "+std::to_string(p.A().cols())+" (reduced)");
+    py::gil_scoped_release release;
+    return p.evaluateBatch(xs,object,ops);
+  },py::arg("xs"),py::arg("object"),py::arg("param"))
+  .def("writeVTK",[](const GraspPlanner<T>& p,VecCRef x,const std::string& path,T len) {
+    p.writeVTK(x,path,len);
+  },py::arg("x"),py::arg("path"),py::arg("len")=1);
+}
@@ -1,82 +1,180 @@
-from transforms3d.quaternions import rotate_vector
 import xml.etree.ElementTree as ET
-import argparse 
-import transforms3d
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import argparse
+import json
 import os
+import re
+from runDataset import parseScript, datName
 
 scale = 0.001
-parser = argparse.ArgumentParser(description='Grasp World Files.')
-parser.add_argument('--path', type=str, help='Path to the grasp file', default='/home/jiangtang/IRC/EBM_Hand/grasp_generation/output/ShadowHand2_small.xml/grasp0.xml')
-parser.add_argument('--hand_type', type = str, help='Type of the hand', default='ShadowHand')
-args = parser.parse_args()
-path =  args.path
-hand = args.hand_type
-tree = ET.parse(path)
-root = tree.getroot()
-print(root.tag)
+root_dir = os.path.dirname(os.path.abspath(__file__))
+URDF = {'BarrettHand': os.path.join(root_dir, 'data/BarrettHand/bh280.urdf'),
+        'ShadowHand': os.path.join(root_dir, 'data/ShadowHand/shadowhand_noarm_noknuckle.urdf')}
+# offset between the palm frames of GraspIt and of our urdf
+ERROR = {'BarrettHand': np.array([0, 0, 0.0787185]),
+         'ShadowHand': np.array([0.111251 - 0.11216547500617721, 0.011497 - 0.014274999999999998, 0.198529 - 0.19494474812631868])}
+# our dofs as (GraspIt dof, factor), coupled joints are driven by a fraction of their parent
+A_BARRETT = 0.32142929
+A_SHADOW = 0.8
+DOF_MAP = {'BarrettHand': ([0, 1, 1, 0, 4, 4, 7, 7],
+                           [1, 1, A_BARRETT, 1, 1, A_BARRETT, 1, A_BARRETT]),
+           'ShadowHand': ([10, 11, 12, 12, 7, 8, 9, 9, 4, 5, 6, 6, 0, 1, 2, 3, 3, 13, 14, 15, 16, 17],
+                          [-1, -1, -1, -A_SHADOW, -1, -1, -1, -A_SHADOW, -1, -1, -1, -A_SHADOW,
+                           -1, -1, -1, -1, -A_SHADOW, -1, -1, -1, -1, -1])}
+# extra translation of objects whose mesh was moved by graspitGeneration.py
+OBJECT_OFFSET = {'ShadowHand2': np.array([-0.73271943, -9.91455281, -2.50903307])}
 
-transform = []
-for trans in root.iter('fullTransform'):
-    transform.append(trans.text)
-    print(trans.text)
-robot_position = transform[1]
-robot_trans = [i * scale for i in [*map(lambda x: float(x[1:]) if x[0]=="+" else -1 * float(x[1:]), robot_position[robot_position.find("[")+1: robot_position.find("]")].split(" "))]]
-print(robot_trans)
-if 'BarrettHand' in hand:
-    error_in_z_axis = 0.0787185
-    robot_trans[2] -= error_in_z_axis
-else:
-    error_in_z_axis = 0.198529 - 0.19494474812631868
-    error_in_x_axis = 0.111251 - 0.11216547500617721
-    error_in_y_axis = 0.011497 -  0.014274999999999998
-    robot_trans[0] -= error_in_x_axis
-    robot_trans[1] -= error_in_y_axis
-    robot_trans[2] -= error_in_z_axis
-robot_rots_quat = [*map(lambda x: float(x[1:]) if x[0]=="+" else -1 * float(x[1:]), robot_position[robot_position.find("(")+1: robot_position.find(")")].split(" "))]
-print(robot_rots_quat)
-robot_rots_ax = transforms3d.euler.quat2euler(robot_rots_quat, 'sxzy')
-print(robot_rots_ax)
-dofs = [*map(lambda x: float(x[1:]) if x[0]=="+" else -1 * float(x[1:]), [*filter(None, [*root.iter("dofValues")][0].text.split(" "))])]
-print(dofs)
-if 'BarrettHand' in hand: 
-    A = 0.32142929 
-    dofs  = [dofs[0], dofs[1], dofs[1] * A, dofs[0],  dofs[4], dofs[4] * A, dofs[7], dofs[7] * A]
-else:
-    A = 0.8
-    dofs = [dofs[10], dofs[11], dofs[12], dofs[12] * A, 
-            dofs[7], dofs[8], dofs[9], dofs[9] * A, 
-            dofs[4], dofs[5], dofs[6], dofs[6] * A,
-            dofs[0], dofs[1], dofs[2], dofs[3], dofs[3] * A,
-            dofs[13], dofs[14], dofs[15], dofs[16], dofs[17]]
-    dofs = [i * -1 for i in dofs]
-elements = path.split('/')
-obj_name = elements[-2].replace('_small.xml', '')
-print(obj_name)
-paramters = []
-if obj_name == 'ShadowHand2':
-    robot_trans[0] += -0.73271943
-    robot_trans[1] += -9.91455281 
-    robot_trans[2] += -2.50903307
+def parseGrasp(path):
+    '''
+    Read the robot pose and the dof values of a GraspIt grasp file
+         :param path: path to the grasp .xml file
+         :return: translation (3,), quaternion w x y z (4,), dofs (n,)
+    '''
+    root = ET.parse(path).getroot()
+    # the first fullTransform is the one of the object, the second one is the robot
+    robot_position = [*root.iter('fullTransform')][1].text
+    trans = np.array(robot_position[robot_position.find("[")+1: robot_position.find("]")].split(), dtype=np.float64)
+    quat = np.array(robot_position[robot_position.find("(")+1: robot_position.find(")")].split(), dtype=np.float64)
+    dofs = np.array([*root.iter("dofValues")][0].text.split(), dtype=np.float64)
+    return trans, quat, dofs
 
-paramters.extend(robot_trans)
-paramters.extend(robot_rots_ax)
-paramters.extend(dofs)
-result_path = path[:-3] + 'txt'
-print(result_path)
-paramters = " ".join([str(i) for i in paramters])
-with open(result_path, 'w') as f:
-    f.write(paramters)
+def parseGraspSafe(path):
+    # executed in a worker process, returns None if the file cannot be parsed
+    try:
+        return parseGrasp(path)
+    except (ET.ParseError, IndexError, ValueError, OSError) as e:
+        print(f"Skipping {path}: {e}")
+        return None
 
+def quat2euler(q):
+    '''
+    Vectorized transforms3d.euler.quat2euler(q, 'sxzy') for a (n,4) array of w x y z quaternions
+    '''
+    q = np.asarray(q, dtype=np.float64)
+    w, x, y, z = q.T
+    s = 2.0 / np.maximum((q * q).sum(axis=1), np.finfo(np.float64).eps)
+    # rotation matrix entries used by the static xzy decomposition (i=0, j=2, k=1)
+    Mii = 1.0 - s * (y * y + z * z)
+    Mji = s * (x * z - w * y)
+    Mki = s * (x * y + w * z)
+    Mkj = s * (y * z - w * x)
+    Mkk = 1.0 - s * (x * x + z * z)
+    Mjk = s * (y * z + w * x)
+    Mjj = 1.0 - s * (x * x + y * y)
+    cy = np.sqrt(Mii * Mii + Mji * Mji)
+    regular = cy > np.finfo(np.float64).eps * 4.0
+    ax = np.where(regular, np.arctan2(Mkj, Mkk), np.arctan2(-Mjk, Mjj))
+    ay = np.arctan2(-Mki, cy)
+    az = np.where(regular, np.arctan2(Mji, Mii), 0.0)
+    # odd parity
+    return -np.stack([ax, ay, az], axis=1)
 
-dat_root = '/home/jiangtang/IRC/Bilevel-Differential-Grasp-Optimization/GraspDataset/' + obj_name
-for file in os.listdir(dat_root):
-    if file.endswith(".dat"):
-        dat_path = os.path.join(dat_root, file)
-        dat_scale = file.split('_')[-1].replace('.dat', '')
-        print(dat_path)
-if 'BarrettHand' in hand:
-    cmd_line = '/home/jiangtang/IRC/Bilevel-Differential-Grasp-Optimization/data/BarrettHand/bh280.urdf 200 '+dat_path+' '+obj_name+' '+dat_scale+' 2 1 ./ ' + result_path
-else:
-    cmd_line = '/home/jiangtang/IRC/Bilevel-Differential-Grasp-Optimization/data/ShadowHand/shadowhand_noarm_noknuckle.urdf 200 '+dat_path+' '+obj_name+' '+dat_scale+' 2 1 ./ ' + result_path
+def convertGrasps(trans, quat, dofs, hand, obj_names):
+    '''
+    Convert GraspIt poses to our parameters [translation, euler angles, dofs] for many grasps of one hand at once
+         :param trans: (n,3) GraspIt translations in millimeters
+         :param quat: (n,4) GraspIt quaternions
+         :param dofs: (n,m) GraspIt dof values
+         :param hand: 'BarrettHand' or 'ShadowHand'
+         :param obj_names: object name of every grasp
+         :return: (n,6+#dofs) parameters
+    '''
+    robot_trans = trans * scale - ERROR[hand]
+    for obj_name, offset in OBJECT_OFFSET.items():
+        robot_trans[np.array(obj_names) == obj_name] += offset
+    index, factor = DOF_MAP[hand]
+    return np.concatenate([robot_trans, quat2euler(quat), dofs[:, index] * np.array(factor)], axis=1)
 
-print(cmd_line)
\ No newline at end of file
+def handType(obj_name, default):
+    return 'BarrettHand' if 'BarrettHand' in obj_name else 'ShadowHand' if 'ShadowHand' in obj_name else default
+
+def objectName(path):
+    # GraspIt writes the grasps of XXX_small.xml into a folder of the same name
+    return re.sub(r'_small(\.xml)?$', '', os.path.basename(os.path.dirname(os.path.abspath(path))))
+
+def objectJob(obj_name, hand, dataset, density, build, param_path):
+    '''
+    mainGraspPlan command line evaluating every grasp of param_path (one per line) on the object
+    '''
+    info = parseScript(os.path.join(dataset, obj_name))
+    if info is not None:
+        dat_path = os.path.join(info['dir'], datName(info['stem'], density, info['scale']))
+        dat_scale = info['scale']
+    else:
+        dats = sorted(f for f in os.listdir(os.path.join(dataset, obj_name)) if f.endswith('.dat')) \
+            if os.path.isdir(os.path.join(dataset, obj_name)) else []
+        if not dats:
+            return None
+        dat_path = os.path.join(os.path.abspath(dataset), obj_name, dats[-1])
+        dat_scale = dats[-1].split('_')[-1].replace('.dat', '')
+    return [os.path.join(build, 'mainGraspPlan'), URDF[hand], density, dat_path, obj_name, dat_scale,
+            '2', '1', os.path.dirname(param_path) + os.sep, param_path]
+
+def importGrasps(graspit_dir, output_dir, hand_type, dataset, density, build, jobs=0):
+    '''
+    Parse every grasp .xml below graspit_dir concurrently and write
+         output_dir/graspit.npz: one (n,6+#dofs) parameter array per hand
+         output_dir/XXX_graspit.txt: the parameters of object XXX, one grasp per line (multi-start input of mainGraspPlan)
+         output_dir/manifest.json: the source file of every row and one evaluation job per object
+    '''
+    paths = sorted(os.path.join(d, f) for d, _, files in os.walk(graspit_dir) for f in files if f.endswith('.xml'))
+    with ProcessPoolExecutor(max_workers=jobs if jobs > 0 else None) as pool:
+        grasps = list(pool.map(parseGraspSafe, paths, chunksize=max(1, len(paths) // (8 * (os.cpu_count() or 1)))))
+    # group the grasps by hand and object, so that the rows of an object are contiguous
+    groups = {}
+    for path, grasp in zip(paths, grasps):
+        if grasp is None:
+            continue
+        obj_name = objectName(path)
+        groups.setdefault(handType(obj_name, hand_type), {}).setdefault(obj_name, []).append((path, grasp))
+    os.makedirs(output_dir, exist_ok=True)
+    arrays = {}
+    manifest = {'arrays': os.path.join(output_dir, 'graspit.npz'), 'hands': {}, 'jobs': []}
+    for hand, objects in sorted(groups.items()):
+        rows = [(obj_name, path, grasp) for obj_name in sorted(objects) for path, grasp in objects[obj_name]]
+        lengths = {grasp[2].shape[0] for _, _, grasp in rows}
+        if len(lengths) != 1:
+            raise ValueError(f"{hand} grasps have different numbers of dofs: {sorted(lengths)}")
+        params = convertGrasps(np.stack([g[0] for _, _, g in rows]), np.stack([g[1] for _, _, g in rows]),
+                               np.stack([g[2] for _, _, g in rows]), hand, [o for o, _, _ in rows])
+        arrays[hand] = params
+        manifest['hands'][hand] = {'urdf': URDF[hand], 'shape': list(params.shape), 'files': [p for _, p, _ in rows]}
+        beg = 0
+        for obj_name in sorted(objects):
+            end = beg + len(objects[obj_name])
+            param_path = os.path.join(os.path.abspath(output_dir), obj_name + '_graspit.txt')
+            np.savetxt(param_path, params[beg:end], fmt='%.17g')
+            manifest['jobs'].append({'object': obj_name, 'hand': hand, 'rows': [beg, end], 'parameters': param_path,
+                                     'cmd': objectJob(obj_name, hand, dataset, density, build, param_path)})
+            beg = end
+    np.savez(manifest['arrays'], **arrays)
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Imported {sum(a.shape[0] for a in arrays.values())}/{len(paths)} grasps of {len(manifest['jobs'])} objects into {output_dir}")
+    return manifest
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Grasp World Files.')
+    parser.add_argument('--path', type=str, help='Path to the grasp file, or to a folder of grasp files for a bulk import')
+    parser.add_argument('--hand_type', type = str, help='Type of the hand, if it is not part of the object name', default='ShadowHand')
+    parser.add_argument('--output', type=str, help='Output folder of the bulk import', default='graspitImport')
+    parser.add_argument('--dataset', type=str, help='GraspDataset folder with the object .dat files', default=os.path.join(root_dir, 'GraspDataset'))
+    parser.add_argument('--density', type=str, help='Sample density of the gripper and object .dat files', default='200')
+    parser.add_argument('-p', '--build', type=str, help='Path to the build folder with mainGraspPlan', default='build3')
+    parser.add_argument('-j', '--jobs', type=int, help='Number of parser processes of the bulk import (default: #cores)', default=0)
+    args = parser.parse_args()
+    build = os.path.abspath(args.build)
+    if os.path.isdir(args.path):
+        importGrasps(args.path, args.output, args.hand_type, args.dataset, args.density, build, args.jobs)
+    else:
+        obj_name = objectName(args.path)
+        hand = handType(obj_name, args.hand_type)
+        trans, quat, dofs = parseGrasp(args.path)
+        paramters = convertGrasps(trans[None], quat[None], dofs[None], hand, [obj_name])[0]
+        result_path = args.path[:-3] + 'txt'
+        print(result_path)
+        with open(result_path, 'w') as f:
+            f.write(" ".join([str(i) for i in paramters]))
+        cmd_line = objectJob(obj_name, hand, args.dataset, args.density, build, os.path.abspath(result_path))
+        print(' '.join(cmd_line) if cmd_line is not None else f"No .dat file of {obj_name} in {args.dataset}")
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# Dependency-aware parallel runner for GraspDataset.
+#
+# Replaces running every GraspDataset/XXX/XXX.sh by hand: the per-object
+# scripts are parsed into a DAG of jobs
+#   pointcloud(obj) -> gripper(hand) -> plan(obj,metric) -> test(obj,metric)
+# which is executed on a process pool.  Each job gets its own log file, its own
+# scratch working directory (mainGraspPlan recreates "object" and the urdf
+# folder in its cwd, so concurrent jobs must not share one) and a bounded
+# OMP_NUM_THREADS, so that #workers x #threads never oversubscribes the machine.
+#
+# The gripper and object .dat files go through the content-addressed
+# ArtifactCache (artifactCache.py): a cache hit materializes the artifact
+# without running the generator, a miss removes the possibly stale file first
+# (the binaries would otherwise reuse it) and stores the regenerated one.
+#
+# With --telemetry every planning job also writes its per-iteration SQP
+# telemetry (<logDir>/<obj>/plan-<metric>.jsonl, see sqpTelemetry.py).
+#
+# The exit code is a bitmask of the stages that failed (see STAGES), and a
+# summary table is printed (and written as summary.json) at the end.
+import argparse,json,os,re,subprocess,sys,time
+from concurrent.futures import ProcessPoolExecutor,wait,FIRST_COMPLETED
+from artifactCache import ArtifactCache,gripperKey,pointCloudKey,parseSize
+
+STAGES=['pointcloud','gripper','plan','test']
+OK=('ok','cached')
+METRICS={'Q_INF_CONSTRAINT_FGT':1,'Q_1':0,'No_Metric_OC':3}
+TEST_METRIC=2
+
+class Job:
+    def __init__(self,name,stage,cmd,cwd,deps=()):
+        self.name=name
+        self.stage=stage
+        self.cmd=cmd
+        self.cwd=cwd
+        self.deps=list(deps)
+        #dependency name -> cmd, the job runs the cmd of the first of these that succeeds
+        self.anyDeps={}
+        self.cache=None
+
+    def setCache(self,key,targets,meta):
+        #targets maps the file name inside the cache entry to its destination
+        self.cache={'key':key,'targets':targets,'meta':meta}
+
+def handTag(urdf):
+    #must agree with the handName computed in Main/mainGraspPlan.cpp
+    return 'BarrettHand' if 'BarrettHand' in urdf else 'Shadowhand'
+
+def datName(stem,density,scale):
+    #mainPointCloudObject writes <obj>_<density>_<std::to_string(scale)>.dat
+    return '%s_%s_%f.dat'%(stem,density,float(scale))
+
+def parseScript(objDir):
+    """Read object name, density, scale and urdf from the legacy XXX.sh"""
+    name=os.path.basename(objDir)
+    script=os.path.join(objDir,name+'.sh')
+    if not os.path.exists(script):
+        return None
+    with open(script,'r') as f:
+        text=f.read()
+    mObj=re.search(r'mainPointCloudObject\s+(\S+)\.obj\s+(\S+)\s+(\S+)',text)
+    mGripper=re.search(r'mainGripper\s+(\S+\.urdf)',text)
+    if mObj is None or mGripper is None:
+        return None
+    return {'name':name,
+            'dir':os.path.abspath(objDir),
+            'stem':mObj.group(1),
+            'density':mObj.group(2),
+            'scale':mObj.group(3),
+            'urdf':os.path.abspath(os.path.join(objDir,mGripper.group(1)))}
+
+def discover(root,names):
+    objs=[]
+    for name in sorted(os.listdir(root)):
+        if not re.match(r'^(BarrettHand|ShadowHand)\d+$',name):
+            continue
+        if names and name not in names:
+            continue
+        obj=parseScript(os.path.join(root,name))
+        if obj is None:
+            print('Skipping %s: cannot parse %s.sh'%(name,name))
+        elif not os.path.exists(os.path.join(obj['dir'],obj['stem']+'.obj')):
+            print('Skipping %s: missing %s.obj'%(name,obj['stem']))
+        else:
+            objs.append(obj)
+    return objs
+
+def buildJobs(objs,args):
+    build=os.path.abspath(args.build)
+    logRoot=os.path.abspath(args.logDir)
+    jobs={}
+    def add(job):
+        jobs[job.name]=job
+        return job
+    def scratch(name):
+        return os.path.join(logRoot,name.replace('/',os.sep))
+    grippers={}
+    for obj in objs:
+        density=args.density if args.density is not None else obj['density']
+        obj['dat']=os.path.join(obj['dir'],datName(obj['stem'],density,obj['scale']))
+        pc=add(Job(obj['name']+'/pointcloud','pointcloud',
+                   [os.path.join(build,'mainPointCloudObject'),obj['stem']+'.obj',density,obj['scale']],
+                   obj['dir']))
+        if args.cache:
+            objPath=os.path.join(obj['dir'],obj['stem']+'.obj')
+            pc.setCache(pointCloudKey(objPath,density,obj['scale'],pc.cmd[0]),
+                        {'object.dat':obj['dat'],'maxRange_Scale.txt':os.path.join(obj['dir'],'maxRange_Scale.txt')},
+                        {'kind':'pointcloud','input':objPath,'density':density,'scale':obj['scale']})
+        #one gripper job per (hand,density), it needs some object's .dat as its argument
+        #so it runs after whichever pointcloud job of that hand succeeds first
+        key=(obj['urdf'],density)
+        if key not in grippers:
+            name=os.path.splitext(os.path.basename(obj['urdf']))[0]
+            grippers[key]=add(Job('gripper/%s_%s'%(name,density),'gripper',
+                                  [os.path.join(build,'mainGripper'),obj['urdf'],density,obj['dat']],
+                                  None))
+            if args.cache:
+                #mainGraspPlan/mainGripper expect <urdf>_<density>.dat next to the urdf
+                grippers[key].setCache(gripperKey(obj['urdf'],density,grippers[key].cmd[0]),
+                                       {'gripper.dat':os.path.join(os.path.dirname(obj['urdf']),'%s_%s.dat'%(name,density))},
+                                       {'kind':'gripper','input':obj['urdf'],'density':density})
+        gripper=grippers[key]
+        gripper.anyDeps[pc.name]=gripper.cmd[:3]+[obj['dat']]
+        initial=os.path.abspath(args.initial) if args.initial else os.path.join(obj['dir'],'initialParameters.txt')
+        for metric in args.metrics:
+            plan=add(Job('%s/plan-%s'%(obj['name'],metric),'plan',
+                         [os.path.join(build,'mainGraspPlan'),obj['urdf'],density,obj['dat'],obj['name'],obj['scale'],
+                          str(METRICS[metric]),str(args.rounds),obj['dir']+os.sep,initial],
+                         None,[pc.name,gripper.name]))
+            if args.telemetry:
+                #one row per SQP iteration, load with sqpTelemetry.py
+                plan.cmd+=['-',os.path.join(logRoot,obj['name'],'plan-%s.jsonl'%metric)]
+            if args.noTest:
+                continue
+            result=os.path.join(obj['dir'],'afterOptimize_%s_%s_%s_%s'%(metric,handTag(obj['urdf']),obj['name'],obj['scale']),'parameters.txt')
+            #the evaluation run writes its own beforeOptimize_* snapshot, keep those in the job's scratch dir
+            testName='%s/test-%s'%(obj['name'],metric)
+            add(Job(testName,'test',
+                    [os.path.join(build,'mainGraspPlan'),obj['urdf'],density,obj['dat'],obj['name'],obj['scale'],
+                     str(TEST_METRIC),'1',scratch(testName)+os.sep,result],
+                    None,[plan.name]))
+    for job in jobs.values():
+        if job.cwd is None:
+            job.cwd=scratch(job.name)
+        job.log=os.path.join(logRoot,job.name.replace('/',os.sep)+'.log')
+    return jobs
+
+def runJob(cmd,cwd,log,ompThreads):
+    """Executed in a worker process, returns (returncode,seconds)"""
+    env=dict(os.environ)
+    env['OMP_NUM_THREADS']=str(ompThreads)
+    os.makedirs(cwd,exist_ok=True)
+    os.makedirs(os.path.dirname(log),exist_ok=True)
+    beg=time.time()
+    with open(log,'w') as f:
+        f.write('# cwd: %s\n# cmd: %s\n# OMP_NUM_THREADS=%d\n'%(cwd,' '.join(cmd),ompThreads))
+        f.flush()
+        try:
+            ret=subprocess.call(cmd,cwd=cwd,env=env,stdout=f,stderr=subprocess.STDOUT)
+        except OSError as e:
+            f.write('# failed to launch: %s\n'%str(e))
+            ret=127
+        f.write('# exit code: %d\n'%ret)
+    return ret,time.time()-beg
+
+def execute(jobs,args):
+    cache=ArtifactCache(args.cache,parseSize(args.cacheSize)) if args.cache else None
+    status={}
+    pending=dict(jobs)
+    running={}
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        while pending or running:
+            #repeat until no job resolves, a cached or skipped job may unblock its dependents
+            resolved=True
+            while resolved:
+                resolved=False
+                for name in sorted(pending):
+                    job=pending[name]
+                    depStatus=[status.get(d) for d in job.deps]
+                    anyStatus=[status.get(d) for d in job.anyDeps]
+                    anyOK=[d for d,s in zip(job.anyDeps,anyStatus) if s is not None and s['status'] in OK]
+                    if job.anyDeps and not anyOK and all(s is not None for s in anyStatus):
+                        status[name]={'stage':job.stage,'status':'skipped','code':None,'time':0,'log':job.log,'reason':'all of '+','.join(job.anyDeps)+' failed'}
+                        print('[SKIP] %s (all of %s failed)'%(name,','.join(job.anyDeps)))
+                        del pending[name]
+                        resolved=True
+                    elif any(s is not None and s['status'] not in OK for s in depStatus):
+                        failed=[d for d,s in zip(job.deps,depStatus) if s is not None and s['status'] not in OK]
+                        status[name]={'stage':job.stage,'status':'skipped','code':None,'time':0,'log':job.log,'reason':'failed dependency '+','.join(failed)}
+                        print('[SKIP] %s (failed dependency %s)'%(name,','.join(failed)))
+                        del pending[name]
+                        resolved=True
+                    elif all(s is not None for s in depStatus) and (anyOK or not job.anyDeps):
+                        del pending[name]
+                        resolved=True
+                        if anyOK:
+                            job.cmd=job.anyDeps[anyOK[0]]
+                        if job.cache is not None:
+                            if cache.fetch(job.cache['key'],job.cache['targets']):
+                                status[name]={'stage':job.stage,'status':'cached','code':0,'time':0,'log':job.log}
+                                print('[CACHED] %s (%s)'%(name,job.cache['key'][:16]))
+                                continue
+                            for dst in job.cache['targets'].values():
+                                if os.path.exists(dst):
+                                    print('Removing stale %s'%dst)
+                                    os.remove(dst)
+                        print('[START] %s'%name)
+                        running[pool.submit(runJob,job.cmd,job.cwd,job.log,args.ompThreads)]=job
+            if not running:
+                if pending:
+                    print('Unresolvable dependencies: %s'%','.join(sorted(pending)))
+                    for name,job in pending.items():
+                        status[name]={'stage':job.stage,'status':'skipped','code':None,'time':0,'log':job.log,'reason':'unresolvable dependency'}
+                break
+            done,_=wait(running,return_when=FIRST_COMPLETED)
+            for future in done:
+                job=running.pop(future)
+                try:
+                    ret,sec=future.result()
+                except Exception as e:
+                    ret,sec=-1,0
+                    print('[ERROR] %s: %s'%(job.name,str(e)))
+                ok=ret==0
+                if ok and job.cache is not None:
+                    missing=[dst for dst in job.cache['targets'].values() if not os.path.exists(dst)]
+                    if missing:
+                        ok=False
+                        print('[ERROR] %s did not produce %s'%(job.name,','.join(missing)))
+                    else:
+                        cache.store(job.cache['key'],job.cache['targets'],job.cache['meta'])
+                status[job.name]={'stage':job.stage,'status':'ok' if ok else 'failed','code':ret,'time':sec,'log':job.log}
+                print('[%s] %s (%.1fs, exit code %d, log: %s)'%('DONE' if ok else 'FAIL',job.name,sec,ret,job.log))
+    return status
+
+def summarize(status,args):
+    exitCode=0
+    print('%-48s %-10s %-8s %-6s %8s'%('job','stage','status','code','time'))
+    for name in sorted(status):
+        s=status[name]
+        print('%-48s %-10s %-8s %-6s %8.1f'%(name,s['stage'],s['status'],'-' if s['code'] is None else str(s['code']),s['time']))
+        if s['status']=='failed':
+            exitCode|=1<<STAGES.index(s['stage'])
+    for i,stage in enumerate(STAGES):
+        if exitCode&(1<<i):
+            print('Stage "%s" failed (exit code bit %d)'%(stage,1<<i))
+    with open(os.path.join(args.logDir,'summary.json'),'w') as f:
+        json.dump({'exitCode':exitCode,'stages':STAGES,'jobs':status},f,indent=2,sort_keys=True)
+    return exitCode
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description='Run the GraspDataset pipeline (object, gripper, planning, testing) as a parallel DAG.')
+    parser.add_argument('--root',default='GraspDataset',help='dataset folder containing one folder per object')
+    parser.add_argument('--objects',nargs='*',default=[],help='only run these objects, e.g. BarrettHand1 ShadowHand3')
+    parser.add_argument('-p','--build',default='build3',help='path to the build folder with mainPointCloudObject/mainGripper/mainGraspPlan')
+    parser.add_argument('-r','--rounds',type=int,default=1000,help='max iterations of the planning runs')
+    parser.add_argument('-i','--initial',default=None,help='initial parameters (default: initialParameters.txt of each object)')
+    parser.add_argument('--density',default=None,help='override the sampling density of the scripts')
+    parser.add_argument('--metrics',nargs='*',default=list(METRICS.keys()),choices=list(METRICS.keys()))
+    parser.add_argument('--noTest',action='store_true',help='do not evaluate Q_INF of the planned grasps')
+    parser.add_argument('-j','--jobs',type=int,default=0,help='number of concurrent jobs (default: #cores / ompThreads)')
+    parser.add_argument('-t','--ompThreads',type=int,default=1,help='OMP_NUM_THREADS of each job')
+    parser.add_argument('--logDir',default='runLogs',help='folder for per-job logs, scratch folders and summary.json')
+    parser.add_argument('--cache',default='artifactCache',help='folder of the .dat artifact cache, empty to disable')
+    parser.add_argument('--cacheSize',default='20G',help='evict least recently used artifacts beyond this size')
+    parser.add_argument('--telemetry',action='store_true',help='write per-iteration SQP telemetry of the planning jobs next to their logs')
+    parser.add_argument('--dryRun',action='store_true',help='print the job graph and exit')
+    args=parser.parse_args()
+    args.ompThreads=max(1,args.ompThreads)
+    if args.jobs<=0:
+        args.jobs=max(1,(os.cpu_count() or 1)//args.ompThreads)
+
+    objs=discover(args.root,set(args.objects))
+    jobs=buildJobs(objs,args)
+    if args.dryRun:
+        for name in sorted(jobs,key=lambda n:(STAGES.index(jobs[n].stage),n)):
+            job=jobs[name]
+            print('%s <- [%s]\n    cwd: %s\n    cmd: %s'%(name,','.join(job.deps),job.cwd,' '.join(job.cmd)))
+            if job.anyDeps:
+                print('    any of: [%s]'%','.join(job.anyDeps))
+            if job.cache is not None:
+                print('    cache: %s'%job.cache['key'])
+        sys.exit(0)
+    os.makedirs(args.logDir,exist_ok=True)
+    print('Running %d jobs on %d workers with OMP_NUM_THREADS=%d'%(len(jobs),args.jobs,args.ompThreads))
+    status=execute(jobs,args)
+    sys.exit(summarize(status,args))
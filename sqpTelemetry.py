@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# Loader for the per-iteration SQP telemetry of GraspPlanner::optimizeSQP.
+#
+# mainGraspPlan writes it when given a telemetry path (argument 11, .jsonl or
+# .csv), runDataset.py --telemetry writes <logDir>/<obj>/plan-<metric>.jsonl.
+# Every row is one SQP iteration with the energy E, the step norm dNorm, the
+# constraint violation cNorm, the accepted step length alpha, the merit
+# parameter rho, the QP regularization reg, the number of line-search trials,
+# the status of the iteration (accept, accept_retry, reject, converged,
+# qp_failed, line_search_failed, invalid_configuration) and its wall time
+# split into timeAssemble, timeQP and timeLineSearch (time is the elapsed time
+# since the start of the run).
+import argparse,csv,glob,json,os
+import numpy as np
+
+FIELDS=[('it',np.int64),('status','U24'),('E',np.float64),('dNorm',np.float64),('cNorm',np.float64),
+        ('alpha',np.float64),('rho',np.float64),('reg',np.float64),('lineSearchTrials',np.int64),
+        ('timeAssemble',np.float64),('timeQP',np.float64),('timeLineSearch',np.float64),('time',np.float64)]
+PHASES=['timeAssemble','timeQP','timeLineSearch']
+
+def readRows(path):
+    """Rows of a telemetry file as dicts, null/nan become nan"""
+    with open(path,'r') as f:
+        if path.endswith('.csv'):
+            return list(csv.DictReader(f))
+        return [json.loads(line) for line in f if line.strip()]
+
+def load(path):
+    """Telemetry of one run as a numpy structured array (one entry per iteration)"""
+    dtype=np.dtype(FIELDS)
+    rows=readRows(path)
+    data=np.zeros(len(rows),dtype=dtype)
+    for name,t in FIELDS:
+        if t=='U24':
+            data[name]=[r.get(name,'') for r in rows]
+        else:
+            data[name]=[np.nan if r.get(name) in (None,'','null') else float(r[name]) for r in rows]
+    return data
+
+def loadFrame(paths):
+    """Telemetry of one or more runs (paths or glob patterns) as a pandas DataFrame with a run column"""
+    import pandas as pd
+    if isinstance(paths,str):
+        paths=[paths]
+    files=sorted({f for p in paths for f in (glob.glob(p) or [p])})
+    frames=[]
+    for f in files:
+        df=pd.DataFrame(load(f))
+        df.insert(0,'run',f)
+        frames.append(df)
+    return pd.concat(frames,ignore_index=True) if frames else pd.DataFrame(columns=['run']+[n for n,_ in FIELDS])
+
+def summarize(data):
+    """Iterations, final status/E/cNorm and total time per phase of one run"""
+    ret={'iterations':len(data),
+         'status':str(data['status'][-1]) if len(data) else '',
+         'E':float(data['E'][-1]) if len(data) else np.nan,
+         'cNorm':float(data['cNorm'][-1]) if len(data) else np.nan,
+         'time':float(data['time'][-1]) if len(data) else 0.0}
+    for phase in PHASES:
+        ret[phase]=float(np.nansum(data[phase]))
+    return ret
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description='Summarize SQP telemetry files written by mainGraspPlan.')
+    parser.add_argument('paths',nargs='+',help='telemetry files or glob patterns, e.g. runLogs/*/plan-*.jsonl')
+    args=parser.parse_args()
+    files=sorted({f for p in args.paths for f in (glob.glob(p) or [p])})
+    print('%-56s %6s %-20s %14s %12s %9s %9s %9s %9s'%('run','iters','status','E','cNorm','assemble','QP','lineSrch','total'))
+    for f in files:
+        if not os.path.exists(f):
+            print('%-56s missing'%f)
+            continue
+        s=summarize(load(f))
+        print('%-56s %6d %-20s %14.6g %12.4g %9.3f %9.3f %9.3f %9.3f'%(f,s['iterations'],s['status'],s['E'],s['cNorm'],
+                                                                    s['timeAssemble'],s['timeQP'],s['timeLineSearch'],s['time']))